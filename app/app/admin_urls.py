@@ -0,0 +1,12 @@
+"""
+URL mappings for the admin site.
+
+Imported on the first admin request, which registers the `admin` modules
+of all apps then instead of at startup.
+"""
+
+from django.contrib import admin
+
+admin.autodiscover()
+
+urlpatterns = admin.site.get_urls()
@@ -12,8 +12,11 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 import os
 
+from importlib.util import find_spec
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -21,19 +24,22 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = (
-	"django-insecure-j3d!k8)yy_e)k%)f8o64ifdv&11si3v$kdewp)g%o49m53)jeu"
+SECRET_KEY = os.environ.get(
+	"SECRET_KEY",
+	"django-insecure-j3d!k8)yy_e)k%)f8o64ifdv&11si3v$kdewp)g%o49m53)jeu",
 )
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = bool(int(os.environ.get("DEBUG", 1)))
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = list(
+	filter(None, os.environ.get("ALLOWED_HOSTS", "").split(","))
+)
 
 # Application definition
 
 INSTALLED_APPS = [
-	"django.contrib.admin",
+	"django.contrib.admin.apps.SimpleAdminConfig",
 	"django.contrib.auth",
 	"django.contrib.contenttypes",
 	"django.contrib.sessions",
@@ -50,11 +56,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+	"core.metrics.MetricsMiddleware",
+	"core.slow_queries.SlowQueryMiddleware",
+	"core.nplusone.NPlusOneMiddleware",
 	"django.middleware.security.SecurityMiddleware",
 	"django.contrib.sessions.middleware.SessionMiddleware",
 	"django.middleware.common.CommonMiddleware",
 	"django.middleware.csrf.CsrfViewMiddleware",
 	"django.contrib.auth.middleware.AuthenticationMiddleware",
+	"core.profiling.ProfilingMiddleware",
 	"django.contrib.messages.middleware.MessageMiddleware",
 	"django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -81,6 +91,11 @@ WSGI_APPLICATION = "app.wsgi.application"
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+# Connections are kept open for DB_CONN_MAX_AGE seconds and checked before
+# reuse, except under ASGI (GUNICORN_ASGI=1), where the sync code of each
+# request runs in a thread of its own and kept connections would pile up.
+# Setting DB_POOL_MAX_SIZE uses a psycopg 3 connection pool instead, which
+# also works under ASGI but needs the psycopg[pool] package installed.
 
 DATABASES = {
 	"default": {
@@ -89,9 +104,80 @@ DATABASES = {
 		"NAME": os.environ.get("DB_NAME"),
 		"USER": os.environ.get("DB_USER"),
 		"PASSWORD": os.environ.get("DB_PASS"),
+		"CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 60)),
+		"CONN_HEALTH_CHECKS": bool(
+			int(os.environ.get("DB_CONN_HEALTH_CHECKS", 1))
+		),
+	}
+}
+
+if bool(int(os.environ.get("GUNICORN_ASGI", 0))):
+	DATABASES["default"]["CONN_MAX_AGE"] = 0
+
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 0))
+
+if DB_POOL_MAX_SIZE:
+	if not (find_spec("psycopg") and find_spec("psycopg_pool")):
+		raise ImproperlyConfigured(
+			"DB_POOL_MAX_SIZE needs psycopg 3, install psycopg[pool]."
+		)
+	# Pooled connections are returned after every request instead.
+	DATABASES["default"]["CONN_MAX_AGE"] = 0
+	DATABASES["default"]["OPTIONS"] = {
+		"pool": {
+			"min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+			"max_size": DB_POOL_MAX_SIZE,
+			"timeout": int(os.environ.get("DB_POOL_TIMEOUT", 10)),
+		},
+	}
+
+# Safe API requests read from the DB_REPLICA_HOSTS replicas, except for
+# users who wrote within the last DB_READ_YOUR_WRITES_WINDOW seconds. The
+# window is tracked in the default cache, which must be shared between
+# processes for it to hold across them. With replicas it defaults to the
+# database cache table on the primary, created by `createcachetable`.
+# CACHE_BACKEND and CACHE_LOCATION select another shared cache, such as
+# django.core.cache.backends.redis.RedisCache.
+
+DATABASE_REPLICAS = []
+
+for index, host in enumerate(
+	filter(None, os.environ.get("DB_REPLICA_HOSTS", "").split(",")), 1
+):
+	alias = f"replica_{index}"
+	DATABASES[alias] = {
+		**DATABASES["default"],
+		"HOST": host.strip(),
+		"TEST": {"MIRROR": "default"},
+	}
+	DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["core.routers.ReplicaRouter"]
+DB_READ_YOUR_WRITES_WINDOW = int(
+	os.environ.get("DB_READ_YOUR_WRITES_WINDOW", 5)
+)
+
+CACHES = {
+	"default": {
+		"BACKEND": os.environ.get(
+			"CACHE_BACKEND",
+			"django.core.cache.backends.db.DatabaseCache"
+			if DATABASE_REPLICAS
+			else "django.core.cache.backends.locmem.LocMemCache",
+		),
+		"LOCATION": os.environ.get(
+			"CACHE_LOCATION", "django_cache" if DATABASE_REPLICAS else ""
+		),
 	}
 }
 
+if DATABASE_REPLICAS and CACHES["default"]["BACKEND"].endswith(
+	(".LocMemCache", ".DummyCache")
+):
+	raise ImproperlyConfigured(
+		"Read replicas need a cache shared between processes."
+	)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -130,6 +216,56 @@ MEDIA_URL = "/static/media/"
 MEDIA_ROOT = "/vol/web/media"
 STATIC_ROOT = "/vol/web/static"
 
+# Recipe images
+# Resized copies are generated by a background job, or inline in the
+# request when RECIPE_IMAGE_INLINE_DERIVATIVES is 1.
+
+RECIPE_IMAGE_DERIVATIVE_SIZES = [
+	int(size)
+	for size in os.environ.get(
+		"RECIPE_IMAGE_DERIVATIVE_SIZES", "128,512,1024"
+	).split(",")
+]
+RECIPE_IMAGE_DERIVATIVE_FORMATS = os.environ.get(
+	"RECIPE_IMAGE_DERIVATIVE_FORMATS", "WEBP,JPEG"
+).split(",")
+RECIPE_IMAGE_DERIVATIVE_QUALITY = int(
+	os.environ.get("RECIPE_IMAGE_DERIVATIVE_QUALITY", 80)
+)
+RECIPE_IMAGE_INLINE_DERIVATIVES = bool(
+	int(os.environ.get("RECIPE_IMAGE_INLINE_DERIVATIVES", 0))
+)
+
+# Uploads are streamed to RECIPE_IMAGE_UPLOAD_TEMP_DIR (MEDIA_ROOT/tmp when
+# unset), which must be on the same filesystem as MEDIA_ROOT.
+RECIPE_IMAGE_MAX_UPLOAD_BYTES = int(
+	os.environ.get("RECIPE_IMAGE_MAX_UPLOAD_BYTES", 20 * 2**20)
+)
+RECIPE_IMAGE_MAX_PIXELS = int(
+	os.environ.get("RECIPE_IMAGE_MAX_PIXELS", 50_000_000)
+)
+RECIPE_IMAGE_UPLOAD_FORMATS = ["JPEG", "PNG", "WEBP", "GIF"]
+
+# Stored originals are downscaled to fit RECIPE_IMAGE_MAX_DIMENSION pixels
+# and re-encoded without metadata at RECIPE_IMAGE_QUALITY.
+RECIPE_IMAGE_MAX_DIMENSION = int(
+	os.environ.get("RECIPE_IMAGE_MAX_DIMENSION", 2048)
+)
+RECIPE_IMAGE_QUALITY = int(os.environ.get("RECIPE_IMAGE_QUALITY", 85))
+RECIPE_IMAGE_UPLOAD_TEMP_DIR = os.environ.get("RECIPE_IMAGE_UPLOAD_TEMP_DIR")
+
+# Media serving
+# MEDIA_SENDFILE_BACKEND is "" to stream files from Python, "nginx" to hand
+# them to nginx with X-Accel-Redirect under MEDIA_ACCEL_REDIRECT_PREFIX, or
+# "xsendfile" for servers supporting X-Sendfile. docker-compose-deploy.yml
+# runs the nginx of proxy/ in front of the app with "nginx".
+
+MEDIA_SENDFILE_BACKEND = os.environ.get("MEDIA_SENDFILE_BACKEND", "")
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get(
+	"MEDIA_ACCEL_REDIRECT_PREFIX", "/protected-media/"
+)
+MEDIA_CACHE_MAX_AGE = int(os.environ.get("MEDIA_CACHE_MAX_AGE", 60 * 60))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -144,3 +280,79 @@ REST_FRAMEWORK = {
 SPECTACULAR_SETTINGS = {
 	"COMPONENT_SPLIT_REQUEST": True,
 }
+
+# OpenAPI schema
+# Written by `manage.py build_schema` and served from memory at /api/schema/.
+
+OPENAPI_SCHEMA_FILE = os.environ.get(
+	"OPENAPI_SCHEMA_FILE", BASE_DIR / "schema.yml"
+)
+
+# Auth tokens
+# Lifetimes are in seconds, 0 disables the check.
+
+AUTH_TOKEN_TTL = int(os.environ.get("AUTH_TOKEN_TTL", 60 * 60 * 24 * 30))
+AUTH_TOKEN_IDLE_TTL = int(
+	os.environ.get("AUTH_TOKEN_IDLE_TTL", 60 * 60 * 24 * 7)
+)
+AUTH_TOKEN_USAGE_FLUSH_INTERVAL = int(
+	os.environ.get("AUTH_TOKEN_USAGE_FLUSH_INTERVAL", 60)
+)
+AUTH_TOKEN_USAGE_BATCH_SIZE = int(
+	os.environ.get("AUTH_TOKEN_USAGE_BATCH_SIZE", 500)
+)
+
+# Background jobs
+# Jobs are claimed by `manage.py run_worker` and leased for JOB_TIMEOUT
+# seconds, renewed while they run, so a job is only claimed again when its
+# worker died. Failures are retried after JOB_RETRY_DELAY seconds, doubling per
+# attempt up to JOB_RETRY_MAX_DELAY. Finished jobs are kept JOB_RETENTION
+# seconds.
+
+JOB_WORKER_CONCURRENCY = int(os.environ.get("JOB_WORKER_CONCURRENCY", 4))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1.0))
+JOB_TIMEOUT = int(os.environ.get("JOB_TIMEOUT", 60 * 10))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 5))
+JOB_RETRY_DELAY = int(os.environ.get("JOB_RETRY_DELAY", 10))
+JOB_RETRY_MAX_DELAY = int(os.environ.get("JOB_RETRY_MAX_DELAY", 60 * 60))
+JOB_RETENTION = int(os.environ.get("JOB_RETENTION", 60 * 60 * 24 * 7))
+
+# Metrics
+# Request metrics are served at /metrics, to requests bearing METRICS_TOKEN.
+# Without a token they are only served with DEBUG on. With METRICS_DIR set, every process writes its metrics
+# there at most every METRICS_FLUSH_INTERVAL seconds so they can be merged.
+
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 1.0))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Slow queries
+# Statements taking SLOW_QUERY_THRESHOLD seconds or longer during a request
+# are logged and kept in the admin, 0 disables this. Their parameters may
+# hold secrets and are only kept with SLOW_QUERY_LOG_PARAMS. A background
+# job captures the plan of a share of SLOW_QUERY_EXPLAIN_RATE of slow
+# SELECTs, under EXPLAIN ANALYZE when their parameters were kept and as a
+# generic plan otherwise. Only the latest SLOW_QUERY_LOG_SIZE are kept.
+
+SLOW_QUERY_THRESHOLD = float(os.environ.get("SLOW_QUERY_THRESHOLD", 0.2))
+SLOW_QUERY_EXPLAIN_RATE = float(
+	os.environ.get("SLOW_QUERY_EXPLAIN_RATE", 0.1)
+)
+SLOW_QUERY_LOG_SIZE = int(os.environ.get("SLOW_QUERY_LOG_SIZE", 500))
+SLOW_QUERY_LOG_PARAMS = bool(int(os.environ.get("SLOW_QUERY_LOG_PARAMS", 0)))
+
+# Request profiling
+# Staff users sending "X-Profile: json" or "X-Profile: prof" get a profile
+# of the request instead of its response, listing REQUEST_PROFILING_LIMIT
+# functions. REQUEST_PROFILING=0 removes the middleware.
+
+REQUEST_PROFILING = bool(int(os.environ.get("REQUEST_PROFILING", 1)))
+REQUEST_PROFILING_LIMIT = int(os.environ.get("REQUEST_PROFILING_LIMIT", 40))
+
+# N+1 queries
+# With NPLUSONE_DETECTION=log or raise, requests running the same query
+# shape more than NPLUSONE_THRESHOLD times log a warning or fail, naming
+# the serializer field or code that ran them. Empty removes the middleware.
+
+NPLUSONE_DETECTION = os.environ.get("NPLUSONE_DETECTION", "")
+NPLUSONE_THRESHOLD = int(os.environ.get("NPLUSONE_THRESHOLD", 5))
@@ -16,25 +16,28 @@ Including another URLconf
 """
 
 from django.conf import settings
-from django.conf.urls.static import static
-from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from core.views import lazy_view, metrics, openapi_schema, serve_media
 
 urlpatterns = [
-    path("admin/", admin.site.urls),
-    path("api/schema/", SpectacularAPIView.as_view(), name="api-schema"),
+    # The admin and docs views are only imported when first requested.
+    path("admin/", ("app.admin_urls", "admin", "admin")),
+    path("api/schema/", openapi_schema, name="api-schema"),
     path(
         "api/docs/",
-        SpectacularSwaggerView.as_view(url_name="api-schema"),
+        lazy_view(
+            "drf_spectacular.views.SpectacularSwaggerView",
+            url_name="api-schema",
+        ),
         name="api-docs",
     ),
+    path("metrics", metrics, name="metrics"),
     path("api/users/", include("user.urls")),
     path("api/recipe/", include("recipe.urls")),
+    re_path(
+        rf"^{settings.MEDIA_URL.lstrip('/')}(?P<path>.*)$",
+        serve_media,
+        name="media",
+    ),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
-    )
@@ -47,3 +47,29 @@ class UserAdmin(BaseUserAdmin):
 
 
 admin.site.register(models.User, UserAdmin)
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ["id", "name", "status", "attempts", "run_at", "duration"]
+    list_filter = ["status", "name"]
+    ordering = ["-id"]
+    readonly_fields = ["created", "started", "finished", "duration"]
+
+
+admin.site.register(models.Job, JobAdmin)
+
+
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ["created", "duration", "route", "method", "user_id"]
+    list_filter = ["route", "database"]
+    search_fields = ["sql"]
+    ordering = ["-id"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(models.SlowQuery, SlowQueryAdmin)
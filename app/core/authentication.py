@@ -0,0 +1,251 @@
+"""
+Token authentication with expiry and batched last-used tracking.
+"""
+
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    TokenAuthentication,
+    get_authorization_header,
+)
+from rest_framework.authtoken.models import Token
+
+from .models import TokenActivity
+
+logger = logging.getLogger(__name__)
+
+
+def expired_token_q(now):
+    """
+    Build a filter matching tokens that are expired at `now`.
+    :param now:
+    :return:
+    """
+    query = Q(pk__in=[])
+
+    if settings.AUTH_TOKEN_TTL:
+        created_before = now - timedelta(seconds=settings.AUTH_TOKEN_TTL)
+        query |= Q(created__lt=created_before)
+
+    if settings.AUTH_TOKEN_IDLE_TTL:
+        idle_since = now - timedelta(seconds=settings.AUTH_TOKEN_IDLE_TTL)
+        query |= Q(activity__last_used__lt=idle_since)
+        query |= Q(activity__isnull=True, created__lt=idle_since)
+
+    return query
+
+
+def is_token_expired(token, now):
+    """
+    Check a single token against the expiry settings.
+    :param token:
+    :param now:
+    :return:
+    """
+    ttl = settings.AUTH_TOKEN_TTL
+    if ttl and token.created < now - timedelta(seconds=ttl):
+        return True
+
+    idle_ttl = settings.AUTH_TOKEN_IDLE_TTL
+    if idle_ttl:
+        try:
+            last_used = token.activity.last_used
+        except TokenActivity.DoesNotExist:
+            last_used = token.created
+
+        if last_used < now - timedelta(seconds=idle_ttl):
+            return True
+
+    return False
+
+
+def issue_token(user):
+    """
+    Return the user's token, replacing it if it has expired.
+    :param user:
+    :return:
+    """
+    token = Token.objects.select_related("activity").filter(user=user).first()
+
+    if token is not None and is_token_expired(token, timezone.now()):
+        token.delete()
+        token = None
+
+    if token is None:
+        token, created = Token.objects.get_or_create(user=user)
+
+    return token
+
+
+class TokenUsageBuffer:
+    """
+    Collect token last-used timestamps in memory and write them in batches.
+
+    Each process keeps at most one pending timestamp per token and flushes
+    them with a single upsert once the batch is full or the flush interval
+    has passed, so authenticating a request never costs a write of its own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def touch(self, key, when):
+        """
+        Record that the token `key` was used at `when`.
+        :param key:
+        :param when:
+        :return:
+        """
+        with self._lock:
+            self._pending[key] = when
+            due = (
+                len(self._pending) >= settings.AUTH_TOKEN_USAGE_BATCH_SIZE
+                or time.monotonic() - self._last_flush
+                >= settings.AUTH_TOKEN_USAGE_FLUSH_INTERVAL
+            )
+
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all pending timestamps and return how many were written.
+        :return:
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+
+        if not pending:
+            return 0
+
+        # Tokens may have been deleted since they were used.
+        live_keys = set(
+            Token.objects.filter(key__in=pending).values_list("key", flat=True)
+        )
+        activities = [
+            TokenActivity(token_id=key, last_used=when)
+            for key, when in pending.items()
+            if key in live_keys
+        ]
+
+        try:
+            TokenActivity.objects.bulk_create(
+                activities,
+                update_conflicts=True,
+                unique_fields=["token"],
+                update_fields=["last_used"],
+            )
+        except IntegrityError:
+            logger.warning(
+                "Dropped %d token usage timestamps.", len(activities)
+            )
+            return 0
+
+        return len(activities)
+
+
+token_usage = TokenUsageBuffer()
+
+
+def flush_token_usage():
+    """
+    Write the token usage this process buffered, as it exits. Without it,
+    every recycled worker would lose the uses since its last flush.
+    :return:
+    """
+    try:
+        token_usage.flush()
+    except DatabaseError:
+        logger.warning("Dropped token usage timestamps.", exc_info=True)
+
+
+class ExpiringTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that rejects expired tokens.
+    """
+
+    def authenticate_credentials(self, key):
+        """
+        Validate the token and record its use.
+        :param key:
+        :return:
+        """
+        model = self.get_model()
+        token = (
+            model.objects.select_related("user", "activity")
+            .filter(key=key)
+            .first()
+        )
+
+        return self._check_token(token)
+
+    async def aauthenticate(self, request):
+        """
+        Authenticate a request to a plain Django async view.
+        :param request:
+        :return: (user, token), or None without token credentials
+        """
+        auth = get_authorization_header(request).split()
+
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(_("Invalid token header."))
+
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(_("Invalid token header."))
+
+        token = (
+            await self.get_model()
+            .objects.select_related("user", "activity")
+            .filter(key=key)
+            .afirst()
+        )
+        user, token = self._check_token(token, touch=False)
+        await sync_to_async(token_usage.touch)(token.key, timezone.now())
+
+        return (user, token)
+
+    def _check_token(self, token, touch=True):
+        """
+        Reject missing, inactive or expired tokens.
+        :param token:
+        :param touch: record the use of the token
+        :return: (user, token)
+        """
+        if token is None:
+            raise exceptions.AuthenticationFailed(_("Invalid token."))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _("User inactive or deleted.")
+            )
+
+        now = timezone.now()
+        if is_token_expired(token, now):
+            raise exceptions.AuthenticationFailed(_("Token has expired."))
+
+        if touch:
+            token_usage.touch(token.key, now)
+
+        return (token.user, token)
@@ -0,0 +1,53 @@
+"""
+Helpers for benchmark commands.
+"""
+
+import math
+import statistics
+
+
+def percentile(samples, pct):
+    """
+    Return the nearest-rank percentile of `samples`.
+    :param samples: sorted list of numbers
+    :param pct: percentile between 0 and 100
+    :return:
+    """
+    if not samples:
+        return 0.0
+
+    rank = max(math.ceil(pct / 100 * len(samples)), 1)
+
+    return samples[rank - 1]
+
+
+def summarize(samples):
+    """
+    Return count, mean and percentiles of timings in milliseconds.
+    :param samples: timings in seconds
+    :return:
+    """
+    timings = sorted(sample * 1000 for sample in samples)
+
+    return {
+        "count": len(timings),
+        "mean": statistics.fmean(timings) if timings else 0.0,
+        "p50": percentile(timings, 50),
+        "p95": percentile(timings, 95),
+        "p99": percentile(timings, 99),
+        "max": timings[-1] if timings else 0.0,
+    }
+
+
+def format_summary(label, summary):
+    """
+    Return a one line description of a `summarize` result.
+    :param label:
+    :param summary:
+    :return:
+    """
+    return (
+        f"{label}: n={summary['count']} mean={summary['mean']:.2f}ms "
+        f"p50={summary['p50']:.2f}ms p95={summary['p95']:.2f}ms "
+        f"p99={summary['p99']:.2f}ms max={summary['max']:.2f}ms"
+    )
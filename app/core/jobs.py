@@ -0,0 +1,297 @@
+"""
+Background jobs stored in the database.
+
+Handlers are registered by name in a `jobs` module of an installed app and
+queued with `enqueue`. Workers claim due jobs with
+`SELECT ... FOR UPDATE SKIP LOCKED`, so any number of them can share the
+queue without blocking each other or running a job twice. A claimed job is
+leased for JOB_TIMEOUT seconds, and the lease is renewed while it runs, so
+only jobs of a worker that died are claimed again.
+"""
+
+import logging
+import random
+import threading
+import time
+import traceback
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def register(name):
+    """
+    Register the decorated function as the handler of jobs named `name`.
+    The job payload is passed to it as keyword arguments.
+    :param name:
+    :return:
+    """
+
+    def decorator(func):
+        _registry[name] = func
+        return func
+
+    return decorator
+
+
+def autodiscover():
+    """
+    Import the `jobs` module of every installed app.
+    :return:
+    """
+    autodiscover_modules("jobs")
+
+
+def enqueue(name, /, *, delay=0, max_attempts=None, **payload):
+    """
+    Queue a job. The payload must be JSON serialisable.
+
+    Jobs queued inside a transaction only become visible to workers once it
+    commits, and disappear if it rolls back.
+    :param name: name the handler is registered under
+    :param delay: seconds before the job may run
+    :param max_attempts: defaults to JOB_MAX_ATTEMPTS
+    :param payload:
+    :return: the job
+    """
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def retry_delay(attempts):
+    """
+    Return seconds to wait before retrying after `attempts` failures.
+    Exponential backoff with jitter so failing jobs spread out.
+    :param attempts:
+    :return:
+    """
+    delay = min(
+        settings.JOB_RETRY_MAX_DELAY,
+        settings.JOB_RETRY_DELAY * 2 ** (attempts - 1),
+    )
+
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim(limit=1):
+    """
+    Lease up to `limit` due jobs to the calling worker.
+
+    Running jobs whose lease expired belong to a worker that died and are
+    claimed again, or failed when they have no attempts left.
+    :param limit:
+    :return: list of claimed jobs
+    """
+    now = timezone.now()
+    claimed = []
+
+    with transaction.atomic():
+        due = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(
+                status__in=[Job.Status.QUEUED, Job.Status.RUNNING],
+                run_at__lte=now,
+            )
+            .order_by("run_at")[:limit]
+        )
+
+        for job in due:
+            if (
+                job.status == Job.Status.RUNNING
+                and job.attempts >= job.max_attempts
+            ):
+                job.status = Job.Status.FAILED
+                job.finished = now
+                job.last_error = "Timed out."
+                job.save(update_fields=["status", "finished", "last_error"])
+                continue
+
+            job.scheduled = job.run_at
+            job.status = Job.Status.RUNNING
+            job.attempts += 1
+            job.started = now
+            job.run_at = now + timedelta(seconds=settings.JOB_TIMEOUT)
+            job.save(update_fields=["status", "attempts", "started", "run_at"])
+            claimed.append(job)
+
+    return claimed
+
+
+def _renew_lease(job, stopped):
+    """
+    Push back the lease of a running job every third of JOB_TIMEOUT until
+    `stopped` is set.
+    :param job:
+    :param stopped: `threading.Event`
+    :return:
+    """
+    try:
+        while not stopped.wait(settings.JOB_TIMEOUT / 3):
+            try:
+                Job.objects.filter(
+                    pk=job.pk, status=Job.Status.RUNNING, attempts=job.attempts
+                ).update(
+                    run_at=timezone.now()
+                    + timedelta(seconds=settings.JOB_TIMEOUT)
+                )
+            except DatabaseError:
+                logger.warning(
+                    "Could not renew the lease of job %s.", job, exc_info=True
+                )
+    finally:
+        connection.close()
+
+
+@contextmanager
+def _leased(job):
+    """
+    Keep `job` leased to this worker while the block runs, from a thread
+    with its own connection.
+    :param job:
+    :return:
+    """
+    stopped = threading.Event()
+    renewer = threading.Thread(
+        target=_renew_lease, args=(job, stopped), daemon=True
+    )
+    renewer.start()
+
+    try:
+        yield
+    finally:
+        stopped.set()
+        renewer.join()
+
+
+def run(job, metrics=None):
+    """
+    Run a claimed job and record the outcome.
+    :param job:
+    :param metrics: optional `JobMetrics` to record timings in
+    :return: whether the job succeeded
+    """
+    start = time.perf_counter()
+
+    try:
+        handler = _registry.get(job.name)
+        if handler is None:
+            raise LookupError(f"No handler registered for job {job.name!r}.")
+        with _leased(job):
+            handler(**job.payload)
+    except Exception:
+        duration = time.perf_counter() - start
+        now = timezone.now()
+        succeeded = False
+        fields = {"duration": duration, "last_error": traceback.format_exc()}
+
+        if job.attempts < job.max_attempts:
+            fields["status"] = Job.Status.QUEUED
+            fields["run_at"] = now + timedelta(
+                seconds=retry_delay(job.attempts)
+            )
+            logger.warning("Job %s failed, retrying.", job, exc_info=True)
+        else:
+            fields["status"] = Job.Status.FAILED
+            fields["finished"] = now
+            logger.exception("Job %s failed.", job)
+    else:
+        duration = time.perf_counter() - start
+        succeeded = True
+        fields = {
+            "duration": duration,
+            "status": Job.Status.DONE,
+            "finished": timezone.now(),
+        }
+
+    # A job whose lease expired may have been claimed again meanwhile.
+    Job.objects.filter(
+        pk=job.pk, status=Job.Status.RUNNING, attempts=job.attempts
+    ).update(**fields)
+
+    if metrics is not None:
+        wait = job.started - getattr(job, "scheduled", job.started)
+        metrics.record(job.name, duration, wait.total_seconds(), succeeded)
+
+    return succeeded
+
+
+def prune(now=None):
+    """
+    Delete jobs that finished more than JOB_RETENTION seconds ago.
+    :param now:
+    :return: number of jobs deleted
+    """
+    cutoff = (now or timezone.now()) - timedelta(
+        seconds=settings.JOB_RETENTION
+    )
+    deleted, _ = Job.objects.filter(
+        status=Job.Status.DONE, finished__lt=cutoff
+    ).delete()
+
+    return deleted
+
+
+class JobMetrics:
+    """
+    Per job name counts and timings, shared by the threads of a worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(
+            lambda: {
+                "count": 0,
+                "failed": 0,
+                "total": 0.0,
+                "max": 0.0,
+                "wait": 0.0,
+            }
+        )
+
+    def record(self, name, duration, wait, succeeded):
+        """
+        Record one run of a job.
+        :param name:
+        :param duration: seconds the handler ran
+        :param wait: seconds between the job being due and claimed
+        :param succeeded:
+        :return:
+        """
+        with self._lock:
+            stats = self._stats[name]
+            stats["count"] += 1
+            stats["failed"] += not succeeded
+            stats["total"] += duration
+            stats["max"] = max(stats["max"], duration)
+            stats["wait"] += wait
+
+    def summary(self):
+        """
+        Return one line per job name.
+        :return:
+        """
+        with self._lock:
+            stats = {name: dict(row) for name, row in self._stats.items()}
+
+        return [
+            f"{name}: {values['count']} run, {values['failed']} failed, "
+            f"avg {values['total'] / values['count']:.3f}s, "
+            f"max {values['max']:.3f}s, "
+            f"avg wait {values['wait'] / values['count']:.3f}s"
+            for name, values in sorted(stats.items())
+        ]
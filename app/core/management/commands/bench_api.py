@@ -0,0 +1,418 @@
+"""
+Django command to benchmark the API against a seeded dataset.
+"""
+
+import io
+import json
+import platform
+import random
+import tempfile
+import time
+from contextlib import ExitStack
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from core.benchmark import format_summary, summarize
+from ingredient.models import Ingredient
+from recipe.models import Recipe
+from tag.models import Tag
+
+PASSWORD = "bench-pass-123"
+
+# Scenario name -> expected status code.
+SCENARIOS = {
+    "recipe-list": 200,
+    "recipe-list-filtered": 200,
+    "recipe-detail": 200,
+    "recipe-create": 201,
+    "recipe-update": 200,
+    "recipe-image-upload": 200,
+    "token-login": 200,
+}
+
+
+class QueryCounter:
+    """
+    Database execute wrapper counting statements.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    """
+    Seed users with recipes, tags and ingredients, then time API requests.
+
+    The dataset is seeded in a transaction that is rolled back afterwards
+    and uploads go to a temporary MEDIA_ROOT, so nothing is left behind.
+    Requests run one at a time through the test client, in the same order
+    for the same --seed, so results of two runs can be compared. Each
+    scenario records latency percentiles, throughput and queries per
+    request.
+    """
+
+    help = "Benchmark API endpoints against a seeded dataset."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument(
+            "--recipes", type=int, default=50, help="Recipes per user."
+        )
+        parser.add_argument(
+            "--tags", type=int, default=10, help="Tags per user."
+        )
+        parser.add_argument(
+            "--ingredients", type=int, default=20, help="Ingredients per user."
+        )
+        parser.add_argument(
+            "--per-recipe",
+            type=int,
+            default=3,
+            help="Tags and ingredients assigned to each recipe.",
+        )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=50,
+            help="Timed requests per scenario.",
+        )
+        parser.add_argument(
+            "--warmup",
+            type=int,
+            default=5,
+            help="Untimed requests per scenario run first.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--scenarios",
+            nargs="+",
+            choices=SCENARIOS,
+            default=list(SCENARIOS),
+        )
+        parser.add_argument(
+            "--output", help="Write the results as JSON to this file."
+        )
+        parser.add_argument(
+            "--baseline", help="Compare with results written by --output."
+        )
+        parser.add_argument(
+            "--max-regression",
+            type=float,
+            help="Fail if p95 latency grew by more than this percentage "
+            "or queries per request grew compared to --baseline.",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Entrypoint for command.
+        :param args:
+        :param options:
+        :return:
+        """
+        self.random = random.Random(options["seed"])
+        self.client = Client()
+        results = {}
+
+        with ExitStack() as stack:
+            media_root = stack.enter_context(tempfile.TemporaryDirectory())
+            stack.enter_context(
+                override_settings(
+                    # The test client sends requests for "testserver".
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                    MEDIA_ROOT=media_root,
+                    # Replicas cannot see the uncommitted dataset.
+                    DATABASE_REPLICAS=[],
+                )
+            )
+            stack.enter_context(transaction.atomic())
+
+            try:
+                self._seed(options)
+
+                for name in options["scenarios"]:
+                    results[name] = self._run(name, options)
+                    self.stdout.write(self._describe(name, results[name]))
+            finally:
+                transaction.set_rollback(True)
+
+        report = {
+            "meta": self._meta(options),
+            "scenarios": results,
+        }
+
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(report, file, indent=2)
+
+        if options["baseline"]:
+            self._compare(report, options)
+
+        self.stdout.write(self.style.SUCCESS("Benchmark finished."))
+
+    def _seed(self, options):
+        """
+        Create the dataset.
+        :param options:
+        :return:
+        """
+        password = make_password(PASSWORD)
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(
+                email=f"bench-{i}@example.com",
+                name=f"Bench {i}",
+                password=password,
+            )
+            for i in range(options["users"])
+        )
+        tokens = Token.objects.bulk_create(
+            Token(user=user, key=Token.generate_key()) for user in users
+        )
+        self.users = []
+
+        for user, token in zip(users, tokens):
+            tags = Tag.objects.bulk_create(
+                Tag(user=user, name=f"Tag {i}") for i in range(options["tags"])
+            )
+            ingredients = Ingredient.objects.bulk_create(
+                Ingredient(user=user, name=f"Ingredient {i}")
+                for i in range(options["ingredients"])
+            )
+            recipes = Recipe.objects.bulk_create(
+                Recipe(
+                    user=user,
+                    title=f"Recipe {i}",
+                    time_minutes=self.random.randint(5, 120),
+                    price=f"{self.random.uniform(1, 50):.2f}",
+                )
+                for i in range(options["recipes"])
+            )
+            per_recipe = options["per_recipe"]
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe=recipe, tag=tag)
+                for recipe in recipes
+                for tag in self.random.sample(
+                    tags, min(per_recipe, len(tags))
+                )
+            )
+            Recipe.ingredients.through.objects.bulk_create(
+                Recipe.ingredients.through(recipe=recipe, ingredient=item)
+                for recipe in recipes
+                for item in self.random.sample(
+                    ingredients, min(per_recipe, len(ingredients))
+                )
+            )
+            self.users.append(
+                {
+                    "email": user.email,
+                    "token": token.key,
+                    "recipes": [recipe.id for recipe in recipes],
+                    "tags": [tag.id for tag in tags],
+                    "ingredients": [item.id for item in ingredients],
+                }
+            )
+
+    def _request(self, name):
+        """
+        Build the next request of scenario `name`.
+        :param name:
+        :return: (method, url, data, extra client kwargs)
+        """
+        user = self.random.choice(self.users)
+        kwargs = {"HTTP_AUTHORIZATION": f"Token {user['token']}"}
+        json_kwargs = {**kwargs, "content_type": "application/json"}
+
+        def some(ids):
+            return ",".join(
+                str(i) for i in self.random.sample(ids, min(2, len(ids)))
+            )
+
+        def recipe_url(view):
+            recipe_id = self.random.choice(user["recipes"])
+            return reverse(f"recipe:recipe-{view}", args=[recipe_id])
+
+        if name == "recipe-list":
+            return "get", reverse("recipe:recipe-list"), None, kwargs
+        if name == "recipe-list-filtered":
+            params = {
+                "tags": some(user["tags"]),
+                "ingredients": some(user["ingredients"]),
+            }
+            return "get", reverse("recipe:recipe-list"), params, kwargs
+        if name == "recipe-detail":
+            return "get", recipe_url("detail"), None, kwargs
+        if name == "recipe-create":
+            payload = {
+                "title": "Bench recipe",
+                "time_minutes": 30,
+                "price": "9.50",
+                "tags": [{"name": "Tag 0"}, {"name": "New tag"}],
+                "ingredients": [{"name": "Ingredient 0"}],
+            }
+            return (
+                "post",
+                reverse("recipe:recipe-list"),
+                json.dumps(payload),
+                json_kwargs,
+            )
+        if name == "recipe-update":
+            payload = {"title": f"Updated {self.random.random()}"}
+            return (
+                "patch",
+                recipe_url("detail"),
+                json.dumps(payload),
+                json_kwargs,
+            )
+        if name == "recipe-image-upload":
+            return (
+                "post",
+                recipe_url("upload-image"),
+                {"image": self._image()},
+                kwargs,
+            )
+
+        credentials = {"email": user["email"], "password": PASSWORD}
+        return "post", reverse("user:token"), credentials, {}
+
+    def _image(self):
+        """
+        Return a new random 256x256 JPEG, so every upload is stored anew.
+        :return:
+        """
+        from PIL import Image
+
+        pixels = self.random.randbytes(256 * 256 * 3)
+        image = Image.frombytes("RGB", (256, 256), pixels)
+        output = io.BytesIO()
+        image.save(output, format="JPEG")
+        output.name = "bench.jpg"
+        output.seek(0)
+
+        return output
+
+    def _run(self, name, options):
+        """
+        Time one scenario.
+        :param name:
+        :param options:
+        :return:
+        """
+        counter = QueryCounter()
+        timings = []
+        queries = []
+        requests = [
+            self._request(name)
+            for _ in range(options["warmup"] + options["iterations"])
+        ]
+
+        for i, (method, url, data, kwargs) in enumerate(requests):
+            counter.count = 0
+            with connection.execute_wrapper(counter):
+                start = time.perf_counter()
+                response = getattr(self.client, method)(url, data, **kwargs)
+                elapsed = time.perf_counter() - start
+
+            if response.status_code != SCENARIOS[name]:
+                raise CommandError(
+                    f"{name}: {method.upper()} {url} returned "
+                    f"{response.status_code}."
+                )
+
+            if i >= options["warmup"]:
+                timings.append(elapsed)
+                queries.append(counter.count)
+
+        summary = summarize(timings)
+        summary["throughput"] = (
+            len(timings) / sum(timings) if timings else 0.0
+        )
+        summary["queries"] = {
+            "mean": sum(queries) / len(queries) if queries else 0.0,
+            "max": max(queries, default=0),
+        }
+
+        return summary
+
+    def _describe(self, name, result):
+        return (
+            f"{format_summary(name, result)} "
+            f"throughput={result['throughput']:.1f}req/s "
+            f"queries={result['queries']['mean']:.1f}"
+        )
+
+    def _meta(self, options):
+        return {
+            "created": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "dataset": {
+                key: options[key]
+                for key in (
+                    "users",
+                    "recipes",
+                    "tags",
+                    "ingredients",
+                    "per_recipe",
+                    "seed",
+                )
+            },
+            "iterations": options["iterations"],
+        }
+
+    def _compare(self, report, options):
+        """
+        Print the change from the baseline and fail on regressions.
+        :param report:
+        :param options:
+        :return:
+        """
+        with open(options["baseline"]) as file:
+            baseline = json.load(file)
+
+        if baseline["meta"]["dataset"] != report["meta"]["dataset"]:
+            self.stdout.write(
+                self.style.WARNING("The baseline used a different dataset.")
+            )
+
+        max_regression = options["max_regression"]
+        regressions = []
+
+        for name, result in report["scenarios"].items():
+            before = baseline["scenarios"].get(name)
+            if before is None:
+                continue
+
+            change = (
+                (result["p95"] - before["p95"]) / before["p95"] * 100
+                if before["p95"]
+                else 0.0
+            )
+            queries = result["queries"]["mean"] - before["queries"]["mean"]
+            self.stdout.write(
+                f"{name}: p95 {before['p95']:.2f}ms -> {result['p95']:.2f}ms "
+                f"({change:+.1f}%), queries {before['queries']['mean']:.1f} "
+                f"-> {result['queries']['mean']:.1f}"
+            )
+
+            if max_regression is not None and (
+                change > max_regression or queries > 0
+            ):
+                regressions.append(name)
+
+        if regressions:
+            raise CommandError(f"Regressed: {', '.join(regressions)}.")
@@ -0,0 +1,105 @@
+"""
+Django command to benchmark database connection reuse.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connections
+
+from core.benchmark import format_summary, summarize
+
+
+class Command(BaseCommand):
+    """
+    Compare per-request latency with and without connection reuse.
+
+    Each simulated request sends the request signals Django uses to open
+    and close connections around a query, so the timings include
+    connecting whenever the connection is not kept.
+    """
+
+    help = "Measure per-request database latency with and without pooling."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=500,
+            help="Number of requests simulated per mode.",
+        )
+        parser.add_argument(
+            "--max-age",
+            type=int,
+            default=60,
+            help="CONN_MAX_AGE used for the persistent mode.",
+        )
+        parser.add_argument(
+            "--query",
+            default="SELECT 1",
+            help="SQL run by every request.",
+        )
+        parser.add_argument(
+            "--database",
+            default="default",
+            help="Database alias to benchmark.",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Entrypoint for command.
+        :param args:
+        :param options:
+        :return:
+        """
+        connection = connections[options["database"]]
+        settings_dict = connection.settings_dict
+        original = (settings_dict["CONN_MAX_AGE"], settings_dict["OPTIONS"])
+        unpooled = {
+            key: value
+            for key, value in original[1].items()
+            if key != "pool"
+        }
+        modes = [
+            ("new connection per request", 0, unpooled),
+            ("persistent connection", options["max_age"], unpooled),
+        ]
+
+        if "pool" in original[1]:
+            modes.append(("connection pool", 0, original[1]))
+
+        try:
+            for label, max_age, db_options in modes:
+                connection.close()
+                settings_dict["CONN_MAX_AGE"] = max_age
+                settings_dict["OPTIONS"] = db_options
+                samples = [
+                    self._request(connection, options["query"])
+                    for _ in range(options["requests"])
+                ]
+                self.stdout.write(format_summary(label, summarize(samples)))
+        finally:
+            connection.close()
+            settings_dict["CONN_MAX_AGE"], settings_dict["OPTIONS"] = original
+
+        self.stdout.write(self.style.SUCCESS("Benchmark finished."))
+
+    def _request(self, connection, query):
+        """
+        Time one simulated request.
+        :param connection:
+        :param query:
+        :return: seconds taken
+        """
+        start = time.perf_counter()
+        request_started.send(sender=self.__class__)
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(query)
+                cursor.fetchall()
+        finally:
+            request_finished.send(sender=self.__class__)
+
+        return time.perf_counter() - start
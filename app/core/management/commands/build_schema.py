@@ -0,0 +1,47 @@
+"""
+Django command to precompute the OpenAPI schema.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.schema import generate_schema, is_stale, render_yaml
+
+
+class Command(BaseCommand):
+    """
+    Generate the OpenAPI schema and write it to OPENAPI_SCHEMA_FILE.
+    """
+
+    help = "Write the OpenAPI schema served at /api/schema/."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Fail if the schema file is out of date instead of "
+            "writing it.",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Entrypoint for command.
+        :param args:
+        :param options:
+        :return:
+        """
+        schema = generate_schema()
+        path = settings.OPENAPI_SCHEMA_FILE
+
+        if options["check"]:
+            if is_stale(schema):
+                raise CommandError(
+                    f"{path} is out of date, run `manage.py build_schema`."
+                )
+            self.stdout.write(self.style.SUCCESS(f"{path} is up to date."))
+            return
+
+        with open(path, "wb") as file:
+            file.write(render_yaml(schema))
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {path}."))
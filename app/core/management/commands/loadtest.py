@@ -0,0 +1,617 @@
+"""
+Django command to load-test the API with a mixed workload.
+"""
+
+import http.client
+import io
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+
+from core.benchmark import format_summary, summarize
+
+PASSWORD = "loadtest-pass-123"
+TAG_NAMES = ["Dinner", "Vegan", "Quick", "Dessert", "Breakfast", "Spicy"]
+INGREDIENT_NAMES = ["Salt", "Garlic", "Onion", "Rice", "Eggs", "Lemon"]
+
+READS = [
+    "recipe-list",
+    "recipe-detail",
+    "tag-list",
+    "ingredient-list",
+    "user-me",
+]
+WRITES = ["recipe-create", "recipe-update", "recipe-delete", "user-token"]
+# Filtered lists and uploads are drawn with their own ratios.
+OPERATIONS = [
+    *READS,
+    "recipe-list-filtered",
+    *WRITES,
+    "recipe-image-upload",
+]
+
+
+class LoadTestError(Exception):
+    """
+    Raised when the target does not answer a setup request as expected.
+    """
+
+
+def _multipart(name, filename, content):
+    """
+    Encode one file as a multipart/form-data body.
+    :param name: form field name
+    :param filename:
+    :param content:
+    :return: (body, content type)
+    """
+    boundary = uuid.uuid4().hex
+    body = b"".join(
+        [
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{name}"; '
+            f'filename="{filename}"\r\n'
+            "Content-Type: image/jpeg\r\n\r\n".encode(),
+            content,
+            f"\r\n--{boundary}--\r\n".encode(),
+        ]
+    )
+
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class HttpTarget:
+    """
+    Send requests to a deployment, over one keep-alive connection per
+    worker thread.
+    """
+
+    def __init__(self, base_url, timeout):
+        url = urlsplit(base_url)
+        if url.scheme not in ("http", "https") or not url.netloc:
+            raise CommandError(f"Invalid --url {base_url!r}.")
+
+        self.connection_class = (
+            http.client.HTTPSConnection
+            if url.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        self.netloc = url.netloc
+        self.prefix = url.path.rstrip("/")
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def send(self, method, path, token=None, data=None, image=None):
+        """
+        Send a request.
+        :param method:
+        :param path: path and query string below the base URL
+        :param token: auth token
+        :param data: JSON body
+        :param image: JPEG content uploaded as multipart "image" field
+        :return: (status code, body)
+        """
+        headers = {}
+        body = None
+
+        if token:
+            headers["Authorization"] = f"Token {token}"
+        if image is not None:
+            body, headers["Content-Type"] = _multipart(
+                "image", "loadtest.jpg", image
+            )
+        elif data is not None:
+            body = json.dumps(data).encode()
+            headers["Content-Type"] = "application/json"
+
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.connection_class(
+                self.netloc, timeout=self.timeout
+            )
+            self.local.connection = connection
+
+        try:
+            connection.request(
+                method, self.prefix + path, body=body, headers=headers
+            )
+            response = connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self.local.connection = None
+            raise
+
+        return response.status, content
+
+    def close(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+
+
+class ClientTarget:
+    """
+    Send requests to this process through the test client, one client
+    per worker thread.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def send(self, method, path, token=None, data=None, image=None):
+        """
+        Send a request, see `HttpTarget.send`.
+        """
+        client = getattr(self.local, "client", None)
+        if client is None:
+            # Server errors become 500 responses, as with a deployment.
+            client = self.local.client = Client(raise_request_exception=False)
+
+        headers = {"Authorization": f"Token {token}"} if token else {}
+
+        if image is not None:
+            upload = io.BytesIO(image)
+            upload.name = "loadtest.jpg"
+            response = client.post(path, {"image": upload}, headers=headers)
+        else:
+            response = client.generic(
+                method,
+                path,
+                json.dumps(data) if data is not None else "",
+                content_type="application/json",
+                headers=headers,
+            )
+
+        return response.status_code, response.getvalue()
+
+    def close(self):
+        # Threads of the test client keep their database connections.
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    """
+    Drive a mixed read and write workload against the API and report
+    throughput, error rate and latency per operation.
+
+    Virtual users are registered through /api/users/ and given a few
+    recipes before the timed run, which then sends requests from
+    --concurrency threads until --duration or --requests runs out.
+
+    Without --url, requests go through the test client in this process,
+    against the configured database. Both modes leave the created users
+    and recipes behind, so point it at a throwaway database.
+    """
+
+    help = "Load-test the API with a mixed workload."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            help="Base URL of the deployment, e.g. http://localhost:8000. "
+            "Requests go through the in-process test client if omitted.",
+        )
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=30,
+            help="Seconds the timed run lasts.",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            help="Stop after this many timed requests instead.",
+        )
+        parser.add_argument(
+            "--users", type=int, default=16, help="Virtual users created."
+        )
+        parser.add_argument(
+            "--recipes",
+            type=int,
+            default=5,
+            help="Recipes created for each virtual user up front.",
+        )
+        parser.add_argument(
+            "--read-ratio",
+            type=float,
+            default=0.8,
+            help="Fraction of requests that are reads.",
+        )
+        parser.add_argument(
+            "--filter-ratio",
+            type=float,
+            default=0.3,
+            help="Fraction of recipe list reads filtered by tags and "
+            "ingredients.",
+        )
+        parser.add_argument(
+            "--upload-ratio",
+            type=float,
+            default=0.1,
+            help="Fraction of writes that are image uploads.",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=10,
+            help="Seconds to wait for a response with --url.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output", help="Write the results as JSON to this file."
+        )
+        parser.add_argument(
+            "--max-error-rate",
+            type=float,
+            help="Fail if more than this fraction of requests failed.",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Entrypoint for command.
+        :param args:
+        :param options:
+        :return:
+        """
+        for ratio in ("read_ratio", "filter_ratio", "upload_ratio"):
+            if not 0 <= options[ratio] <= 1:
+                option = ratio.replace("_", "-")
+                raise CommandError(f"--{option} must be between 0 and 1.")
+        if options["users"] < options["concurrency"]:
+            raise CommandError(
+                "--users must be at least --concurrency, workers do not "
+                "share users."
+            )
+
+        with ExitStack() as stack:
+            if options["url"]:
+                self.target = HttpTarget(options["url"], options["timeout"])
+            else:
+                self.target = ClientTarget()
+                stack.enter_context(
+                    override_settings(
+                        # The test client sends requests for "testserver".
+                        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+                    )
+                )
+
+            try:
+                self.users = self._setup(options)
+            except (LoadTestError, OSError, http.client.HTTPException) as e:
+                raise CommandError(f"Setup failed: {e}")
+            finally:
+                self.target.close()
+
+            self.stdout.write(
+                f"Created {len(self.users)} users, running "
+                f"{options['concurrency']} workers."
+            )
+            report = self._run(options)
+
+        for name, result in report["operations"].items():
+            self.stdout.write(self._describe(name, result))
+        self.stdout.write(self._describe("total", report["total"]))
+
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(report, file, indent=2)
+
+        max_error_rate = options["max_error_rate"]
+        if (
+            max_error_rate is not None
+            and report["total"]["error_rate"] > max_error_rate
+        ):
+            raise CommandError(
+                f"Error rate {report['total']['error_rate']:.2%} is above "
+                f"{max_error_rate:.2%}."
+            )
+
+        self.stdout.write(self.style.SUCCESS("Load test finished."))
+
+    def _expect(self, status, content, expected, what):
+        if status != expected:
+            raise LoadTestError(f"{what} returned {status}: {content[:200]}")
+
+        return json.loads(content)
+
+    def _setup(self, options):
+        """
+        Register the virtual users and create their recipes.
+        :param options:
+        :return: list of user dicts
+        """
+        run = uuid.uuid4().hex[:8]
+        rng = random.Random(options["seed"])
+        users = []
+
+        for i in range(options["users"]):
+            email = f"loadtest-{run}-{i}@example.com"
+            credentials = {"email": email, "password": PASSWORD}
+            status, content = self.target.send(
+                "POST",
+                "/api/users/create/",
+                data={**credentials, "name": f"Load test {i}"},
+            )
+            self._expect(status, content, 201, "User creation")
+            status, content = self.target.send(
+                "POST", "/api/users/token/", data=credentials
+            )
+            token = self._expect(status, content, 200, "Login")["token"]
+            user = {
+                "credentials": credentials,
+                "token": token,
+                "recipes": [],
+                "tags": set(),
+                "ingredients": set(),
+            }
+
+            for _ in range(options["recipes"]):
+                status = self._create_recipe(rng, user)
+                if status != 201:
+                    raise LoadTestError(f"Recipe creation returned {status}.")
+
+            users.append(user)
+
+        return users
+
+    def _create_recipe(self, rng, user):
+        """
+        Create a recipe for `user` and remember its IDs.
+        :param rng:
+        :param user:
+        :return: status code
+        """
+        payload = {
+            "title": f"Load test recipe {rng.randrange(10**6)}",
+            "time_minutes": rng.randint(5, 120),
+            "price": f"{rng.uniform(1, 50):.2f}",
+            "tags": [
+                {"name": name} for name in rng.sample(TAG_NAMES, 2)
+            ],
+            "ingredients": [
+                {"name": name} for name in rng.sample(INGREDIENT_NAMES, 3)
+            ],
+        }
+        status, content = self.target.send(
+            "POST",
+            "/api/recipe/recipes/",
+            token=user["token"],
+            data=payload,
+        )
+        if status != 201:
+            return status
+
+        recipe = json.loads(content)
+        user["recipes"].append(recipe["id"])
+        user["tags"].update(tag["id"] for tag in recipe["tags"])
+        user["ingredients"].update(
+            item["id"] for item in recipe["ingredients"]
+        )
+
+        return status
+
+    def _choose(self, rng, options):
+        """
+        Draw the next operation of the workload.
+        :param rng:
+        :param options:
+        :return:
+        """
+        if rng.random() < options["read_ratio"]:
+            name = rng.choice(READS)
+            if name == "recipe-list" and (
+                rng.random() < options["filter_ratio"]
+            ):
+                return "recipe-list-filtered"
+            return name
+
+        if rng.random() < options["upload_ratio"]:
+            return "recipe-image-upload"
+
+        return rng.choice(WRITES)
+
+    def _perform(self, name, rng, user):
+        """
+        Send one request of operation `name` for `user`.
+        :param name:
+        :param rng:
+        :param user:
+        :return: status code
+        """
+        token = user["token"]
+        recipes = user["recipes"]
+
+        def recipe_url(suffix=""):
+            return f"/api/recipe/recipes/{rng.choice(recipes)}/{suffix}"
+
+        def some(ids):
+            ids = sorted(ids)
+            return ",".join(
+                str(i) for i in rng.sample(ids, min(2, len(ids)))
+            )
+
+        if name == "recipe-list":
+            return self.target.send("GET", "/api/recipe/recipes/", token)[0]
+        if name == "recipe-list-filtered":
+            query = urlencode(
+                {
+                    "tags": some(user["tags"]),
+                    "ingredients": some(user["ingredients"]),
+                }
+            )
+            path = f"/api/recipe/recipes/?{query}"
+            return self.target.send("GET", path, token)[0]
+        if name in ("tag-list", "ingredient-list"):
+            path = f"/api/recipe/{name.split('-')[0]}s/?assigned_only=" + (
+                "1" if rng.random() < 0.5 else "0"
+            )
+            return self.target.send("GET", path, token)[0]
+        if name == "user-me":
+            return self.target.send("GET", "/api/users/me/", token)[0]
+        if name == "user-token":
+            return self.target.send(
+                "POST", "/api/users/token/", data=user["credentials"]
+            )[0]
+        if name == "recipe-create":
+            return self._create_recipe(rng, user)
+
+        if not recipes:
+            # Everything got deleted, make something to work on.
+            return self._create_recipe(rng, user)
+        if name == "recipe-detail":
+            return self.target.send("GET", recipe_url(), token)[0]
+        if name == "recipe-update":
+            return self.target.send(
+                "PATCH",
+                recipe_url(),
+                token,
+                data={"time_minutes": rng.randint(5, 120)},
+            )[0]
+        if name == "recipe-delete":
+            # Keep the initial number of recipes per user about stable.
+            recipe_id = recipes.pop(rng.randrange(len(recipes)))
+            path = f"/api/recipe/recipes/{recipe_id}/"
+            return self.target.send("DELETE", path, token)[0]
+
+        return self.target.send(
+            "POST", recipe_url("upload-image/"), token, image=self._image()
+        )[0]
+
+    def _image(self):
+        """
+        Return a 256x256 JPEG, created on first use.
+        :return:
+        """
+        if not hasattr(self, "image"):
+            from PIL import Image
+
+            rng = random.Random(0)
+            pixels = rng.randbytes(256 * 256 * 3)
+            output = io.BytesIO()
+            Image.frombytes("RGB", (256, 256), pixels).save(
+                output, format="JPEG"
+            )
+            self.image = output.getvalue()
+
+        return self.image
+
+    def _run(self, options):
+        """
+        Run the workers and aggregate their samples.
+        :param options:
+        :return: report dict
+        """
+        self._image()
+        budget = options["requests"]
+        sent = itertools.count()
+        # Per worker: operation -> list of (seconds, status code)
+        samples = [{} for _ in range(options["concurrency"])]
+
+        def worker(index):
+            rng = random.Random(f"{options['seed']}-{index}")
+            # Each worker keeps to its own users, so no two threads share
+            # a recipe list.
+            users = self.users[index :: options["concurrency"]]
+
+            try:
+                while time.perf_counter() < deadline and (
+                    budget is None or next(sent) < budget
+                ):
+                    name = self._choose(rng, options)
+                    start = time.perf_counter()
+                    try:
+                        status = self._perform(name, rng, rng.choice(users))
+                    except (OSError, http.client.HTTPException):
+                        status = 0
+                    elapsed = time.perf_counter() - start
+                    samples[index].setdefault(name, []).append(
+                        (elapsed, status)
+                    )
+            finally:
+                self.target.close()
+
+        threads = [
+            threading.Thread(target=worker, args=(i,))
+            for i in range(options["concurrency"])
+        ]
+        start = time.perf_counter()
+        deadline = start + options["duration"]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        merged = {}
+        for worker_samples in samples:
+            for name, values in worker_samples.items():
+                merged.setdefault(name, []).extend(values)
+
+        return {
+            "meta": {
+                "target": options["url"] or "in-process",
+                "concurrency": options["concurrency"],
+                "elapsed": elapsed,
+                "read_ratio": options["read_ratio"],
+                "filter_ratio": options["filter_ratio"],
+                "upload_ratio": options["upload_ratio"],
+                "users": options["users"],
+                "seed": options["seed"],
+            },
+            "operations": {
+                name: self._summarize(merged[name], elapsed)
+                for name in OPERATIONS
+                if name in merged
+            },
+            "total": self._summarize(
+                list(itertools.chain.from_iterable(merged.values())), elapsed
+            ),
+        }
+
+    def _summarize(self, values, elapsed):
+        """
+        Summarize (seconds, status code) samples of one operation.
+        :param values:
+        :param elapsed: wall time of the run
+        :return:
+        """
+        summary = summarize([seconds for seconds, _ in values])
+        errors = {}
+        for _, status in values:
+            if not 200 <= status < 400:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+
+        summary["throughput"] = len(values) / elapsed if elapsed else 0.0
+        summary["errors"] = errors
+        summary["error_rate"] = (
+            sum(errors.values()) / len(values) if values else 0.0
+        )
+
+        return summary
+
+    def _describe(self, name, result):
+        line = (
+            f"{format_summary(name, result)} "
+            f"throughput={result['throughput']:.1f}req/s "
+            f"errors={result['error_rate']:.1%}"
+        )
+        if result["errors"]:
+            codes = ", ".join(
+                f"{status}: {count}"
+                for status, count in sorted(result["errors"].items())
+            )
+            line += f" ({codes})"
+
+        return line
@@ -0,0 +1,79 @@
+"""
+Django command to delete expired auth tokens.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from core.authentication import expired_token_q, token_usage
+
+
+class Command(BaseCommand):
+    """
+    Delete expired tokens in small batches.
+
+    Every batch runs in its own short transaction so row locks are held
+    only briefly and concurrent logins are never blocked for long.
+    """
+
+    help = "Delete expired auth tokens in bounded batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of tokens deleted per transaction.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.0,
+            help="Seconds to pause between batches.",
+        )
+        parser.add_argument(
+            "--vacuum",
+            action="store_true",
+            help="Run VACUUM ANALYZE on the token tables afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Entrypoint for command.
+        :param args:
+        :param options:
+        :return:
+        """
+        batch_size = options["batch_size"]
+        token_usage.flush()
+        now = timezone.now()
+        expired = Token.objects.filter(expired_token_q(now))
+        total = 0
+
+        while True:
+            keys = list(expired.values_list("key", flat=True)[:batch_size])
+            if not keys:
+                break
+
+            with transaction.atomic():
+                Token.objects.filter(key__in=keys).delete()
+
+            total += len(keys)
+            self.stdout.write(f"Deleted {total} expired tokens...")
+
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        if options["vacuum"] and connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("VACUUM ANALYZE core_tokenactivity")
+                cursor.execute("VACUUM ANALYZE authtoken_token")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Pruned {total} expired tokens.")
+        )
@@ -0,0 +1,171 @@
+"""
+Django command to run background jobs.
+"""
+
+import logging
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections, connection
+
+from core import jobs
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Run queued jobs in a pool of threads until interrupted.
+
+    Every thread claims and runs one job at a time on its own database
+    connection. Database errors are logged and retried after
+    JOB_POLL_INTERVAL. Should a thread die anyway, the others are stopped
+    and the command fails, so it gets restarted. SIGINT and SIGTERM let
+    running jobs finish before exiting.
+    """
+
+    help = "Run background jobs from the database queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.JOB_WORKER_CONCURRENCY,
+            help="Number of jobs run at the same time.",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Exit once no job is due instead of waiting for more.",
+        )
+        parser.add_argument(
+            "--stats-interval",
+            type=float,
+            default=60.0,
+            help="Seconds between job timing summaries.",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Entrypoint for command.
+        :param args:
+        :param options:
+        :return:
+        """
+        jobs.autodiscover()
+        self.burst = options["burst"]
+        self.stop = threading.Event()
+        self.metrics = jobs.JobMetrics()
+        concurrency = options["concurrency"]
+        self.interval = options["stats_interval"]
+        self.next_report = time.monotonic() + self.interval
+
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *_: self.stop.set())
+
+        self.stdout.write(f"Worker started with {concurrency} threads.")
+
+        if concurrency == 1:
+            self._work(maintain=True)
+        else:
+            threads = [
+                threading.Thread(target=self._work_thread, daemon=True)
+                for _ in range(concurrency)
+            ]
+            for thread in threads:
+                thread.start()
+
+            died = False
+            while any(thread.is_alive() for thread in threads):
+                self.stop.wait(1.0)
+                self._maintain()
+                if not (self.burst or self.stop.is_set()) and not all(
+                    thread.is_alive() for thread in threads
+                ):
+                    died = True
+                    self.stop.set()
+
+            for thread in threads:
+                thread.join()
+
+            if died:
+                self._report()
+                raise CommandError("A worker thread stopped unexpectedly.")
+
+        self._report()
+        self.stdout.write(self.style.SUCCESS("Worker stopped."))
+
+    def _work_thread(self):
+        """
+        Run jobs on a connection owned by this thread.
+        :return:
+        """
+        try:
+            self._work()
+        except Exception:
+            logger.exception("Worker thread failed.")
+        finally:
+            connection.close()
+
+    def _work(self, maintain=False):
+        """
+        Claim and run jobs until stopped.
+        :param maintain: also do the periodic maintenance
+        :return:
+        """
+        while not self.stop.is_set():
+            try:
+                if not connection.in_atomic_block:
+                    close_old_connections()
+
+                if maintain:
+                    self._maintain()
+
+                claimed = jobs.claim()
+            except DatabaseError:
+                # E.g. the database restarting, the next round reconnects.
+                logger.warning("Could not claim jobs.", exc_info=True)
+                self.stop.wait(settings.JOB_POLL_INTERVAL)
+                continue
+
+            if not claimed:
+                if self.burst:
+                    return
+                self.stop.wait(settings.JOB_POLL_INTERVAL)
+                continue
+
+            for job in claimed:
+                try:
+                    jobs.run(job, self.metrics)
+                except DatabaseError:
+                    # Its lease runs out and it is claimed again.
+                    logger.warning(
+                        "Could not record job %s.", job, exc_info=True
+                    )
+
+    def _maintain(self):
+        """
+        Report timings and prune finished jobs every stats interval.
+        :return:
+        """
+        if time.monotonic() < self.next_report:
+            return
+
+        self._report()
+        self.next_report = time.monotonic() + self.interval
+        try:
+            jobs.prune()
+        except DatabaseError:
+            logger.warning("Could not prune jobs.", exc_info=True)
+
+    def _report(self):
+        """
+        Write the job timing summary.
+        :return:
+        """
+        for line in self.metrics.summary():
+            self.stdout.write(line)
@@ -0,0 +1,440 @@
+"""
+Django command to bulk-load synthetic users, recipes, tags and ingredients.
+"""
+
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from contextlib import ExitStack
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+
+from ingredient.models import Ingredient
+from recipe.models import Recipe
+from tag.models import Tag
+
+ADJECTIVES = [
+    "Spicy", "Creamy", "Smoky", "Crispy", "Roasted", "Grilled", "Quick",
+    "Slow-cooked", "Lemon", "Garlic", "Sweet", "Tangy", "Herby", "Rustic",
+]
+DISHES = [
+    "chicken", "lentil soup", "risotto", "tacos", "curry", "salad",
+    "lasagne", "stir fry", "pancakes", "chili", "pie", "noodles", "stew",
+    "flatbread", "salmon", "dumplings", "omelette", "burger",
+]
+TAG_NAMES = [
+    "Vegan", "Vegetarian", "Dinner", "Lunch", "Breakfast", "Dessert",
+    "Quick", "Healthy", "Comfort", "Gluten free", "Spicy", "Summer",
+    "Winter", "Party", "Budget", "Kids", "Meal prep", "Baking",
+]
+INGREDIENT_NAMES = [
+    "Salt", "Pepper", "Olive oil", "Garlic", "Onion", "Butter", "Flour",
+    "Sugar", "Eggs", "Milk", "Tomato", "Rice", "Chicken", "Lemon", "Basil",
+    "Cumin", "Paprika", "Carrot", "Potato", "Cheese", "Cream", "Ginger",
+    "Chili", "Soy sauce", "Honey", "Beans", "Spinach", "Mushroom",
+]
+
+# Longest chunk of COPY data handed to the driver at once.
+COPY_BUFFER = 2**20
+
+
+def _encode(value):
+    """
+    Encode a value for COPY in text format.
+    :param value:
+    :return:
+    """
+    if value is None:
+        return r"\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+
+    return str(value)
+
+
+class Table:
+    """
+    COPY layout of a model's table.
+
+    Rows give values for `fields` only, the other columns get the field
+    default, except an auto primary key left to its sequence.
+    """
+
+    def __init__(self, model, fields, constants=None):
+        constants = constants or {}
+        columns = []
+        template = []
+
+        for field in model._meta.concrete_fields:
+            if field.attname in fields:
+                template.append(f"{{{fields.index(field.attname)}}}")
+            elif field.primary_key:
+                continue
+            else:
+                value = constants.get(field.attname, field.get_default())
+                template.append(
+                    _encode(value).replace("{", "{{").replace("}", "}}")
+                )
+            columns.append(connection.ops.quote_name(field.column))
+
+        self.name = model._meta.db_table
+        self.sql = (
+            f"COPY {connection.ops.quote_name(self.name)} "
+            f"({', '.join(columns)}) FROM STDIN"
+        )
+        self.template = "\t".join(template) + "\n"
+
+    def line(self, *values):
+        return self.template.format(*values)
+
+
+class LineReader:
+    """
+    File-like object reading the lines of a generator, for `copy_expert`.
+    """
+
+    def __init__(self, lines):
+        self._lines = lines
+        self.rows = 0
+
+    def read(self, size=-1):
+        chunk = []
+        length = 0
+
+        for line in self._lines:
+            chunk.append(line)
+            length += len(line)
+            self.rows += 1
+            if size > 0 and length >= size:
+                break
+
+        return "".join(chunk)
+
+
+def skewed_count(rng, mean, limit):
+    """
+    Draw a count from a long-tailed distribution with the given mean.
+    Most draws are below the mean, a few are many times larger.
+    :param rng:
+    :param mean:
+    :param limit: largest count returned
+    :return:
+    """
+    if mean <= 0:
+        return 0
+
+    sigma = 1.0
+    value = rng.lognormvariate(math.log(mean) - sigma**2 / 2, sigma)
+
+    return min(max(round(value), 1), limit)
+
+
+def popular_picks(rng, population, k):
+    """
+    Pick `k` distinct indexes below `population`, favouring low ones, so a
+    few tags and ingredients of each user are used by most recipes.
+    :param rng:
+    :param population:
+    :param k:
+    :return:
+    """
+    k = min(k, population)
+    picks = set()
+
+    while len(picks) < k:
+        picks.add(int(population * rng.random() ** 2))
+
+    return picks
+
+
+def plan(users, options):
+    """
+    Draw tag, ingredient and recipe counts per user and split the users
+    into chunks loaded by one worker each.
+    :param users: number of users
+    :param options:
+    :return: list of chunk dicts
+    """
+    rng = random.Random(options["seed"])
+    counts = [
+        (
+            skewed_count(rng, options["tags_per_user"], 200),
+            skewed_count(rng, options["ingredients_per_user"], 500),
+            skewed_count(
+                rng,
+                options["recipes_per_user"],
+                options["recipes_per_user"] * 50,
+            ),
+        )
+        for _ in range(users)
+    ]
+    first_user = _next_id(get_user_model())
+    firsts = [_next_id(model) for model in (Tag, Ingredient, Recipe)]
+    offsets = [
+        list(accumulate((count[i] for count in counts), initial=0))
+        for i in range(3)
+    ]
+    size = options["chunk_size"]
+
+    return [
+        {
+            "index": start // size,
+            "seed": options["seed"],
+            "password": options["password_hash"],
+            "first_user": first_user + start,
+            "firsts": [firsts[i] + offsets[i][start] for i in range(3)],
+            "counts": counts[start : start + size],
+        }
+        for start in range(0, users, size)
+    ]
+
+
+def _next_id(model):
+    last = model.objects.order_by("-pk").values_list("pk", flat=True).first()
+
+    return (last or 0) + 1
+
+
+def reserve(chunks):
+    """
+    Move the ID sequences of the seeded tables past the planned ranges, so
+    rows inserted while the chunks load get IDs above them.
+    :param chunks: `plan` result
+    :return:
+    """
+    if not chunks:
+        return
+
+    last = chunks[-1]
+    ends = [last["first_user"] + len(last["counts"]) - 1] + [
+        last["firsts"][i] + sum(counts[i] for counts in last["counts"]) - 1
+        for i in range(3)
+    ]
+
+    models = [get_user_model(), Tag, Ingredient, Recipe]
+    with connection.cursor() as cursor:
+        for model, end in zip(models, ends):
+            column = [model._meta.db_table, model._meta.pk.column]
+            # Never moved back, IDs above the rows may have been handed out.
+            cursor.execute(
+                "SELECT setval(pg_get_serial_sequence(%s, %s), "
+                "GREATEST(%s, nextval(pg_get_serial_sequence(%s, %s))))",
+                [*column, end, *column],
+            )
+
+
+def _rows(chunk):
+    """
+    Generate the COPY lines of a chunk, per table in foreign key order.
+    :param chunk:
+    :return: list of (Table, line generator)
+    """
+    rng = random.Random(f"{chunk['seed']}-{chunk['index']}")
+    users = Table(
+        get_user_model(),
+        ["id", "email", "name"],
+        {"password": chunk["password"]},
+    )
+    tags = Table(Tag, ["id", "user_id", "name"])
+    ingredients = Table(Ingredient, ["id", "user_id", "name"])
+    recipes = Table(
+        Recipe,
+        ["id", "user_id", "title", "description", "time_minutes", "price"],
+    )
+    recipe_tags = Table(Recipe.tags.through, ["recipe_id", "tag_id"])
+    recipe_ingredients = Table(
+        Recipe.ingredients.through, ["recipe_id", "ingredient_id"]
+    )
+
+    def each_user():
+        # (user id, [first tag, ingredient and recipe id], counts)
+        firsts = list(chunk["firsts"])
+
+        for offset, counts in enumerate(chunk["counts"]):
+            yield chunk["first_user"] + offset, list(firsts), counts
+            firsts = [first + count for first, count in zip(firsts, counts)]
+
+    def user_lines():
+        for user_id, _, _ in each_user():
+            yield users.line(
+                user_id, f"seed-{user_id}@example.com", f"User {user_id}"
+            )
+
+    def attr_lines(table, names, position):
+        for user_id, firsts, counts in each_user():
+            for i in range(counts[position]):
+                name = names[i % len(names)]
+                if i >= len(names):
+                    name = f"{name} {i // len(names) + 1}"
+                yield table.line(firsts[position] + i, user_id, name)
+
+    def recipe_lines():
+        for user_id, firsts, counts in each_user():
+            for recipe_id in range(firsts[2], firsts[2] + counts[2]):
+                yield recipes.line(
+                    recipe_id,
+                    user_id,
+                    f"{rng.choice(ADJECTIVES)} {rng.choice(DISHES)}",
+                    "" if rng.random() < 0.3 else "Mix, cook and serve.",
+                    min(round(rng.lognormvariate(3.4, 0.6)), 600),
+                    f"{min(rng.lognormvariate(2.3, 0.7), 999.99):.2f}",
+                )
+
+    def link_lines(table, position, low, high):
+        # Seeded apart, so links do not depend on the recipe columns.
+        links = random.Random(f"{chunk['seed']}-{chunk['index']}-{position}")
+        for _, firsts, counts in each_user():
+            for recipe_id in range(firsts[2], firsts[2] + counts[2]):
+                k = links.randint(low, high)
+                for pick in popular_picks(links, counts[position], k):
+                    yield table.line(recipe_id, firsts[position] + pick)
+
+    return [
+        (users, user_lines()),
+        (tags, attr_lines(tags, TAG_NAMES, 0)),
+        (ingredients, attr_lines(ingredients, INGREDIENT_NAMES, 1)),
+        (recipes, recipe_lines()),
+        (recipe_tags, link_lines(recipe_tags, 0, 0, 4)),
+        (recipe_ingredients, link_lines(recipe_ingredients, 1, 3, 12)),
+    ]
+
+
+def load_chunk(chunk):
+    """
+    COPY one chunk in its own transaction.
+    :param chunk:
+    :return: rows loaded per table
+    """
+    loaded = {}
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for table, lines in _rows(chunk):
+            reader = LineReader(lines)
+            cursor.copy_expert(table.sql, reader, size=COPY_BUFFER)
+            loaded[table.name] = reader.rows
+
+    return loaded
+
+
+class Command(BaseCommand):
+    """
+    Generate users with skewed numbers of tags, ingredients and recipes and
+    load them with COPY.
+
+    IDs are assigned up front from the largest existing ones, so chunks of
+    users load in parallel worker processes without coordinating. The
+    tables are locked while the ranges are planned and their sequences
+    moved past them, so rows written meanwhile get other IDs. PostgreSQL
+    only.
+    """
+
+    help = "Bulk-load synthetic data for benchmarks and capacity planning."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, required=True)
+        parser.add_argument(
+            "--recipes-per-user",
+            type=int,
+            default=20,
+            help="Mean number of recipes per user.",
+        )
+        parser.add_argument(
+            "--tags-per-user",
+            type=int,
+            default=10,
+            help="Mean number of tags per user.",
+        )
+        parser.add_argument(
+            "--ingredients-per-user",
+            type=int,
+            default=30,
+            help="Mean number of ingredients per user.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Users loaded per transaction.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Processes loading chunks in parallel.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--password",
+            default="password123",
+            help="Password of every generated user.",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Entrypoint for command.
+        :param args:
+        :param options:
+        :return:
+        """
+        if connection.vendor != "postgresql":
+            raise CommandError("seed_data needs PostgreSQL for COPY.")
+
+        start = time.perf_counter()
+        options["password_hash"] = make_password(options["password"])
+        models = [get_user_model(), Tag, Ingredient, Recipe]
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Writers wait until the ID ranges are planned and reserved.
+            tables = ", ".join(
+                connection.ops.quote_name(model._meta.db_table)
+                for model in models
+            )
+            cursor.execute(f"LOCK TABLE {tables} IN SHARE ROW EXCLUSIVE MODE")
+            chunks = plan(options["users"], options)
+            reserve(chunks)
+
+        workers = min(options["workers"], len(chunks))
+        totals = {}
+
+        with ExitStack() as stack:
+            if workers > 1:
+                # Forked workers must not share the parent's connection.
+                connections.close_all()
+                pool = stack.enter_context(
+                    multiprocessing.get_context("fork").Pool(workers)
+                )
+                results = pool.imap_unordered(load_chunk, chunks)
+            else:
+                results = map(load_chunk, chunks)
+
+            for done, loaded in enumerate(results, 1):
+                for table, rows in loaded.items():
+                    totals[table] = totals.get(table, 0) + rows
+                self.stdout.write(
+                    f"Loaded {done}/{len(chunks)} chunks, "
+                    f"{sum(totals.values())} rows."
+                )
+
+        with connection.cursor() as cursor:
+            for table in totals:
+                cursor.execute(f"ANALYZE {connection.ops.quote_name(table)}")
+
+        elapsed = time.perf_counter() - start
+        rows = sum(totals.values())
+        for table, count in totals.items():
+            self.stdout.write(f"  {table}: {count}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Loaded {rows} rows in {elapsed:.1f}s "
+                f"({rows / elapsed * 60:,.0f} rows/min)."
+            )
+        )
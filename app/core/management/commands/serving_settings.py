@@ -0,0 +1,60 @@
+"""
+Django command to print recommended application server settings.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.serving import (
+    available_cpus,
+    recommended_threads,
+    recommended_workers,
+)
+
+
+class Command(BaseCommand):
+    """
+    Print GUNICORN_* settings sized for this host.
+    """
+
+    help = "Print recommended gunicorn settings for the host's cores."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--cpus",
+            type=int,
+            help="Size for this many cores instead of the available ones.",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Entrypoint for command.
+        :param args:
+        :param options:
+        :return:
+        """
+        cpus = options["cpus"] or available_cpus()
+        workers = recommended_workers(cpus)
+        threads = recommended_threads()
+        connections = workers * threads
+
+        self.stdout.write(f"# {cpus} CPUs available")
+        self.stdout.write(f"GUNICORN_WORKERS={workers}")
+        self.stdout.write(f"GUNICORN_THREADS={threads}")
+        self.stdout.write("GUNICORN_MAX_REQUESTS=1000")
+        self.stdout.write("GUNICORN_MAX_REQUESTS_JITTER=100")
+        self.stdout.write("GUNICORN_KEEPALIVE=5")
+
+        if settings.DB_POOL_MAX_SIZE:
+            self.stdout.write(
+                f"# Up to {workers * settings.DB_POOL_MAX_SIZE} database "
+                f"connections ({workers} workers x "
+                f"DB_POOL_MAX_SIZE={settings.DB_POOL_MAX_SIZE}), keep "
+                "DB_POOL_MAX_SIZE at or below GUNICORN_THREADS."
+            )
+        else:
+            self.stdout.write(
+                f"# Up to {connections} database connections "
+                f"({workers} workers x {threads} threads), make sure "
+                "Postgres max_connections allows for them."
+            )
@@ -0,0 +1,69 @@
+"""
+Django command to inspect the slow-query log.
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.models import SlowQuery
+
+
+class Command(BaseCommand):
+    """
+    List the latest slow queries, optionally with their plans.
+    """
+
+    help = "List the latest slow queries."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=20,
+            help="Number of entries listed.",
+        )
+        parser.add_argument(
+            "--route",
+            help="Only list entries of this route name.",
+        )
+        parser.add_argument(
+            "--plans",
+            action="store_true",
+            help="Print the captured EXPLAIN plans.",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete all entries instead.",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Entrypoint for command.
+        :param args:
+        :param options:
+        :return:
+        """
+        if options["clear"]:
+            deleted, _ = SlowQuery.objects.all().delete()
+            self.stdout.write(
+                self.style.SUCCESS(f"Deleted {deleted} slow queries.")
+            )
+            return
+
+        entries = SlowQuery.objects.order_by("-id")
+        if options["route"]:
+            entries = entries.filter(route=options["route"])
+
+        for entry in entries[: options["limit"]]:
+            self.stdout.write(
+                f"{entry.created:%Y-%m-%d %H:%M:%S} "
+                f"{entry.duration * 1000:.0f}ms "
+                f"{entry.method} {entry.route or '-'} "
+                f"user={entry.user_id} db={entry.database}"
+            )
+            self.stdout.write(f"  {entry.sql}")
+            if entry.params:
+                self.stdout.write(f"  params: {entry.params}")
+            if options["plans"] and entry.plan:
+                for line in entry.plan.splitlines():
+                    self.stdout.write(f"    {line}")
@@ -0,0 +1,159 @@
+"""
+Django command to profile application startup.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def parse_importtime(output):
+    """
+    Parse `python -X importtime` output.
+    :param output:
+    :return: list of (module, self seconds, cumulative seconds)
+    """
+    imports = []
+
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+
+        imports.append(
+            (
+                fields[2].strip(),
+                int(fields[0]) / 1e6,
+                int(fields[1]) / 1e6,
+            )
+        )
+
+    return imports
+
+
+class Command(BaseCommand):
+    """
+    Start the app in a fresh interpreter and report where the time went.
+    """
+
+    help = (
+        "Report per-module import time and time spent in AppConfig.ready, "
+        "URLconf loading and the first request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=15,
+            help="Number of modules and packages listed.",
+        )
+        parser.add_argument(
+            "--path",
+            default="/api/recipe/recipes/",
+            help="Path of the first request.",
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Print the report as JSON.",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Entrypoint for command.
+        :param args:
+        :param options:
+        :return:
+        """
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-X",
+                "importtime",
+                "-m",
+                "core.startup",
+                options["path"],
+            ],
+            cwd=settings.BASE_DIR,
+            env=os.environ.copy(),
+            capture_output=True,
+            text=True,
+        )
+
+        if result.returncode:
+            raise CommandError(f"Startup probe failed:\n{result.stderr}")
+
+        report = json.loads(result.stdout)
+        imports = parse_importtime(result.stderr)
+        packages = defaultdict(float)
+        for module, self_time, _ in imports:
+            packages[module.split(".")[0]] += self_time
+
+        report["imports"] = {
+            "total": sum(self_time for _, self_time, _ in imports),
+            "count": len(imports),
+            "packages": dict(
+                sorted(packages.items(), key=lambda item: -item[1])[
+                    : options["limit"]
+                ]
+            ),
+            "slowest": [
+                {"module": module, "cumulative": cumulative}
+                for module, _, cumulative in sorted(
+                    imports, key=lambda item: -item[2]
+                )[: options["limit"]]
+            ],
+        }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self._write_report(report)
+
+    def _write_report(self, report):
+        """
+        Print the report as text.
+        :param report:
+        :return:
+        """
+        imports = report["imports"]
+        self.stdout.write(
+            f"Imports: {imports['count']} modules in "
+            f"{imports['total'] * 1000:.1f}ms"
+        )
+
+        self.stdout.write("Import time by package:")
+        for package, seconds in imports["packages"].items():
+            self.stdout.write(f"  {seconds * 1000:8.1f}ms  {package}")
+
+        self.stdout.write("Slowest imports, including their own imports:")
+        for entry in imports["slowest"]:
+            self.stdout.write(
+                f"  {entry['cumulative'] * 1000:8.1f}ms  {entry['module']}"
+            )
+
+        self.stdout.write("AppConfig.ready:")
+        for label, seconds in sorted(
+            report["ready"].items(), key=lambda item: -item[1]
+        ):
+            self.stdout.write(f"  {seconds * 1000:8.1f}ms  {label}")
+
+        self.stdout.write(f"django.setup(): {report['setup'] * 1000:.1f}ms")
+        self.stdout.write(f"URLconf: {report['urlconf'] * 1000:.1f}ms")
+        self.stdout.write(
+            f"First request: {report['first_request'] * 1000:.1f}ms "
+            f"(status {report['status']})"
+        )
+        self.stdout.write(
+            "Loaded heavy modules: " + (", ".join(report["loaded"]) or "none")
+        )
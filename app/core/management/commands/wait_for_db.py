@@ -2,18 +2,58 @@
 Django command to wait for the database to be available.
 """
 
+import random
+import socket
 import time
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
 from django.db.utils import OperationalError
 from psycopg2 import OperationalError as Psycopg2OpError
 
 
+class PendingMigrations(Exception):
+    """
+    The database is up but not fully migrated yet.
+    """
+
+
 class Command(BaseCommand):
     """
     Django command to wait for a database.
+
+    Probes with a TCP connect followed by `SELECT 1`, retrying with
+    exponential backoff and jitter until the database answers or the
+    timeout runs out.
     """
 
+    help = "Wait until the database accepts queries."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=60.0,
+            help="Seconds to wait before giving up, 0 waits forever.",
+        )
+        parser.add_argument(
+            "--migrations",
+            action="store_true",
+            help="Also wait until all migrations are applied.",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database alias to wait for.",
+        )
+        parser.add_argument(
+            "--max-delay",
+            type=float,
+            default=2.0,
+            help="Longest pause in seconds between two probes.",
+        )
+
     def handle(self, *args, **options):
         """
         Entrypoint for command.
@@ -22,14 +62,84 @@ class Command(BaseCommand):
         :return:
         """
         self.stdout.write("Waiting for the database...")
-        db_up = False
+        alias = options["database"]
+        timeout = options["timeout"]
+        deadline = time.monotonic() + timeout if timeout else None
+        attempt = 0
 
-        while db_up is False:
+        while True:
             try:
-                self.check(databases=["default"])
-                db_up = True
-            except (Psycopg2OpError, OperationalError):
+                self.probe(alias)
+
+                if options["migrations"]:
+                    pending = self.pending_migrations(alias)
+                    if pending:
+                        raise PendingMigrations(
+                            f"{pending} migrations not applied"
+                        )
+
+                break
+            except (
+                OSError,
+                Psycopg2OpError,
+                OperationalError,
+                PendingMigrations,
+            ) as exc:
+                connections[alias].close()
+                delay = self.retry_delay(attempt, options["max_delay"])
+                attempt += 1
+
+                expired = deadline and time.monotonic() + delay > deadline
+                if expired:
+                    raise CommandError(
+                        f"Database unavailable after {timeout:g}s: {exc}"
+                    )
+
                 self.stdout.write("Database unavailable, please wait...")
-                time.sleep(1)
+                time.sleep(delay)
 
         self.stdout.write(self.style.SUCCESS("Database available!"))
+
+    def probe(self, alias):
+        """
+        Raise unless the database answers a trivial query.
+
+        The TCP connect fails fast with a short timeout while the server
+        or its host name is not up yet, where the driver could block.
+        :param alias:
+        :return:
+        """
+        connection = connections[alias]
+        host = connection.settings_dict.get("HOST")
+
+        if connection.vendor == "postgresql" and host and "/" not in host:
+            port = int(connection.settings_dict.get("PORT") or 5432)
+            with socket.create_connection((host, port), timeout=1):
+                pass
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+
+    def pending_migrations(self, alias):
+        """
+        Return the number of migrations not applied yet.
+        :param alias:
+        :return:
+        """
+        executor = MigrationExecutor(connections[alias])
+        targets = executor.loader.graph.leaf_nodes()
+
+        return len(executor.migration_plan(targets))
+
+    def retry_delay(self, attempt, max_delay):
+        """
+        Return the pause before the next probe.
+        Doubles from 50ms per attempt up to `max_delay`, with jitter.
+        :param attempt:
+        :param max_delay:
+        :return:
+        """
+        delay = min(max_delay, 0.05 * 2**attempt)
+
+        return random.uniform(delay / 2, delay)
@@ -0,0 +1,433 @@
+"""
+Per-route request metrics in the Prometheus text format.
+
+`MetricsMiddleware` records, per URL route name and method, histograms of
+request latency, database queries and time, serializer time and response
+size. Each process aggregates in memory. With METRICS_DIR set, processes
+periodically write their totals to their own file there, and /metrics
+merges the files of all processes, including ones that have exited.
+"""
+
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .responses import observe_stream
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# Histogram name -> (help text, bucket upper bounds).
+HISTOGRAMS = {
+    "http_request_duration_seconds": (
+        "Time to serve a request.",
+        DURATION_BUCKETS,
+    ),
+    "http_request_db_queries": (
+        "Database queries per request.",
+        QUERY_BUCKETS,
+    ),
+    "http_request_db_seconds": (
+        "Time spent in database queries per request.",
+        DURATION_BUCKETS,
+    ),
+    "http_request_serializer_seconds": (
+        "Time spent serializing objects per request, without queries.",
+        DURATION_BUCKETS,
+    ),
+    "http_response_size_bytes": (
+        "Size of the response body.",
+        SIZE_BUCKETS,
+    ),
+}
+
+# File in METRICS_DIR holding the totals of exited processes.
+ARCHIVE = "archive.json"
+LOCK = ".lock"
+
+
+class RequestMetrics:
+    """
+    What the current request spent on queries and serialization.
+    """
+
+    __slots__ = ("queries", "db_time", "serializer_time", "serializing")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class Registry:
+    """
+    Histograms of this process, keyed by (name, route, method).
+
+    Each value holds the count per bucket, +Inf last, followed by the sum
+    of all observations.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._values = {}
+        self._last_flush = time.monotonic()
+        self._exit_hook = False
+
+    def observe(self, route, method, observations):
+        """
+        Add one observation per histogram for a request.
+        :param route:
+        :param method:
+        :param observations: dict of histogram name to value
+        :return:
+        """
+        with self._lock:
+            for name, value in observations.items():
+                buckets = HISTOGRAMS[name][1]
+                key = (name, route, method)
+                counts = self._values.get(key)
+                if counts is None:
+                    counts = self._values[key] = [0] * (len(buckets) + 2)
+                counts[bisect_left(buckets, value)] += 1
+                counts[-1] += value
+
+            due = (
+                time.monotonic() - self._last_flush
+                >= settings.METRICS_FLUSH_INTERVAL
+            )
+
+        if due and settings.METRICS_DIR:
+            self.flush(settings.METRICS_DIR)
+
+    def snapshot(self):
+        """
+        Return a copy of the histograms.
+        :return:
+        """
+        with self._lock:
+            return {key: list(counts) for key, counts in self._values.items()}
+
+    def flush(self, directory):
+        """
+        Write the totals of this process to its file in `directory`.
+        Skipped while another thread is already writing.
+        :param directory:
+        :return:
+        """
+        if not self._flush_lock.acquire(blocking=False):
+            return
+
+        try:
+            with self._lock:
+                self._last_flush = time.monotonic()
+
+            if not self._exit_hook:
+                atexit.register(self._flush_on_exit)
+                self._exit_hook = True
+
+            _write(_process_file(directory, os.getpid()), self.snapshot())
+        finally:
+            self._flush_lock.release()
+
+    def _flush_on_exit(self):
+        if settings.METRICS_DIR:
+            self.flush(settings.METRICS_DIR)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+registry = Registry()
+
+
+def _process_file(directory, pid):
+    return os.path.join(directory, f"{pid}.json")
+
+
+def _write(path, values):
+    """
+    Atomically replace the file at `path` with `values`.
+    :param path:
+    :param values:
+    :return:
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump([[*key, counts] for key, counts in values.items()], file)
+    os.replace(tmp_path, path)
+
+
+def _read(path):
+    try:
+        with open(path) as file:
+            return {
+                (name, route, method): counts
+                for name, route, method, counts in json.load(file)
+            }
+    except FileNotFoundError:
+        return {}
+
+
+def _merge(into, values):
+    for key, counts in values.items():
+        total = into.get(key)
+        if total is None or len(total) != len(counts):
+            into[key] = list(counts)
+        else:
+            into[key] = [a + b for a, b in zip(total, counts)]
+
+    return into
+
+
+@contextmanager
+def _locked(directory, operation):
+    with open(os.path.join(directory, LOCK), "a") as lock:
+        fcntl.flock(lock, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def collect():
+    """
+    Return the histograms of every process.
+    :return:
+    """
+    directory = settings.METRICS_DIR
+    if not directory:
+        return registry.snapshot()
+
+    registry.flush(directory)
+    values = {}
+
+    with _locked(directory, fcntl.LOCK_SH):
+        for entry in sorted(os.listdir(directory)):
+            if entry.endswith(".json"):
+                _merge(values, _read(os.path.join(directory, entry)))
+
+    return values
+
+
+def mark_process_dead(directory, pid):
+    """
+    Fold the file of the exited process `pid` into the archive.
+    Called by the Gunicorn master so the file of a recycled worker is
+    neither lost nor left behind.
+    :param directory:
+    :param pid:
+    :return:
+    """
+    path = _process_file(directory, pid)
+    if not os.path.exists(path):
+        return
+
+    with _locked(directory, fcntl.LOCK_EX):
+        archive = os.path.join(directory, ARCHIVE)
+        _write(archive, _merge(_read(archive), _read(path)))
+        os.remove(path)
+
+
+def reset(directory):
+    """
+    Create `directory` and remove the files of a previous run.
+    :param directory:
+    :return:
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    for entry in os.listdir(directory):
+        if entry.endswith((".json", ".tmp")):
+            os.remove(os.path.join(directory, entry))
+
+
+def _label(value):
+    return (
+        value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    )
+
+
+def render(values):
+    """
+    Render histograms in the Prometheus text exposition format.
+    :param values:
+    :return:
+    """
+    lines = []
+
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+
+        for (key_name, route, method), counts in sorted(values.items()):
+            if key_name != name:
+                continue
+
+            labels = f'route="{_label(route)}",method="{_label(method)}"'
+            cumulative = 0
+            for bound, count in zip((*buckets, "+Inf"), counts):
+                cumulative += count
+                lines.append(
+                    f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f"{name}_sum{{{labels}}} {counts[-1]}")
+            lines.append(f"{name}_count{{{labels}}} {cumulative}")
+
+    return "\n".join(lines) + "\n"
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting queries and their time.
+    """
+    start = time.perf_counter()
+
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder = _current.get()
+        if recorder is not None:
+            recorder.queries += 1
+            recorder.db_time += time.perf_counter() - start
+
+
+@contextmanager
+def timed_serialization():
+    """
+    Add the time spent in the block, without queries, to the request's
+    serializer time. Nested blocks are counted by the outermost one.
+    :return:
+    """
+    recorder = _current.get()
+    if recorder is None or recorder.serializing:
+        yield
+        return
+
+    recorder.serializing = True
+    db_time = recorder.db_time
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        recorder.serializer_time += elapsed - (recorder.db_time - db_time)
+        recorder.serializing = False
+
+
+class TimedSerializerMixin:
+    """
+    Count the serializer's `to_representation` as serializer time.
+    """
+
+    def to_representation(self, instance):
+        with timed_serialization():
+            return super().to_representation(instance)
+
+
+class MetricsMiddleware:
+    """
+    Record the metrics of every request.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        recorder = RequestMetrics()
+        start = time.perf_counter()
+        with self._watching(recorder):
+            response = self.get_response(request)
+
+        return self._finish(request, response, recorder, start)
+
+    async def __acall__(self, request):
+        recorder = RequestMetrics()
+        start = time.perf_counter()
+        with self._watching(recorder):
+            response = await self.get_response(request)
+
+        return self._finish(request, response, recorder, start)
+
+    @contextmanager
+    def _watching(self, recorder):
+        """
+        Count the queries and serialization of the block for `recorder`.
+        :param recorder:
+        :return:
+        """
+        token = _current.set(recorder)
+
+        try:
+            yield
+        finally:
+            _current.reset(token)
+
+    def _finish(self, request, response, recorder, start):
+        """
+        Record the request, after its content is sent for a streamed
+        response.
+        :param request:
+        :param response:
+        :param recorder:
+        :param start:
+        :return: the response
+        """
+
+        def record(size):
+            match = request.resolver_match
+            observations = {
+                "http_request_duration_seconds": time.perf_counter() - start,
+                "http_request_db_queries": recorder.queries,
+                "http_request_db_seconds": recorder.db_time,
+                "http_request_serializer_seconds": recorder.serializer_time,
+            }
+            if size is not None:
+                observations["http_response_size_bytes"] = size
+
+            registry.observe(
+                match.view_name if match else "unmatched",
+                request.method,
+                observations,
+            )
+
+        if observe_stream(
+            response, lambda: self._watching(recorder), record
+        ):
+            return response
+
+        if not response.streaming:
+            record(len(response.content))
+        elif response.has_header("Content-Length"):
+            record(int(response["Content-Length"]))
+        else:
+            record(None)
+
+        return response
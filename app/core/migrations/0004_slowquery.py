@@ -0,0 +1,31 @@
+# Generated by Django 5.1.1 on 2026-10-19 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('duration', models.FloatField(help_text='Seconds.')),
+                ('database', models.CharField(max_length=100)),
+                ('route', models.CharField(blank=True, max_length=255)),
+                ('method', models.CharField(blank=True, max_length=10)),
+                ('user_id', models.BigIntegerField(blank=True, null=True)),
+                ('sql', models.TextField()),
+                ('params', models.JSONField(blank=True, default=list)),
+                ('plan', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name_plural': 'slow queries',
+            },
+        ),
+    ]
@@ -8,22 +8,45 @@ from django.contrib.auth.models import (
     AbstractBaseUser,
 )
 from django.db import models
+from django.utils import timezone
 
+import hashlib
 import os
-import uuid
+
+
+def content_sha256(file):
+    """
+    Return the SHA-256 hex digest of a file's content.
+    Uses the digest computed while the file was uploaded when available.
+    :param file:
+    :return:
+    """
+    digest = getattr(file, "sha256", None)
+
+    if digest is None:
+        hasher = hashlib.sha256()
+        for chunk in file.chunks():
+            hasher.update(chunk)
+        file.seek(0)
+        digest = hasher.hexdigest()
+
+    return digest
 
 
 def recipe_image_file_path(instance, filename):
     """
-    Generate a file path for new recipe image.
+    Generate a content-addressed file path for a new recipe image.
+    "photo.JPG" -> "uploads/recipe/ab/cd/abcd...ef.jpg"
     :param instance:
     :param filename:
     :return:
     """
-    ext = os.path.splitext(filename)[1]
-    filename = f"{uuid.uuid4()}{ext}"
+    ext = os.path.splitext(filename)[1].lower()
+    digest = content_sha256(instance.image.file)
 
-    return os.path.join("uploads", "recipe", filename)
+    return os.path.join(
+        "uploads", "recipe", digest[:2], digest[2:4], f"{digest}{ext}"
+    )
 
 
 class UserManager(BaseUserManager):
@@ -76,3 +99,89 @@ class User(AbstractBaseUser, PermissionsMixin):
     objects = UserManager()
 
     USERNAME_FIELD = "email"
+
+
+class TokenActivity(models.Model):
+    """
+    Last time an auth token was used to authenticate a request.
+    """
+
+    token = models.OneToOneField(
+        "authtoken.Token",
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name="activity",
+    )
+    last_used = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.token_id} @ {self.last_used.isoformat()}"
+
+
+class Job(models.Model):
+    """
+    Background job run by `manage.py run_worker`.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = "queued"
+        RUNNING = "running"
+        DONE = "done"
+        FAILED = "failed"
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.QUEUED
+    )
+    # When a queued job may start, or when the lease of a running job
+    # expires and it may be claimed again.
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=1)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["run_at"],
+                name="core_job_pending_idx",
+                condition=models.Q(status__in=["queued", "running"]),
+            ),
+            models.Index(
+                fields=["finished"],
+                name="core_job_done_idx",
+                condition=models.Q(status="done"),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+class SlowQuery(models.Model):
+    """
+    SQL statement that exceeded SLOW_QUERY_THRESHOLD during a request.
+    Only the latest SLOW_QUERY_LOG_SIZE entries are kept.
+    """
+
+    created = models.DateTimeField(auto_now_add=True)
+    duration = models.FloatField(help_text="Seconds.")
+    database = models.CharField(max_length=100)
+    route = models.CharField(max_length=255, blank=True)
+    method = models.CharField(max_length=10, blank=True)
+    # Not a foreign key, entries outlive the users they mention.
+    user_id = models.BigIntegerField(null=True, blank=True)
+    sql = models.TextField()
+    params = models.JSONField(default=list, blank=True)
+    plan = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name_plural = "slow queries"
+
+    def __str__(self):
+        return f"{self.duration * 1000:.0f}ms {self.route or '-'}"
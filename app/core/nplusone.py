@@ -0,0 +1,338 @@
+"""
+N+1 query detection.
+
+`NPlusOneMiddleware` fingerprints every statement of a request, that is its
+SQL with literals and IN lists collapsed, and flags a request running the
+same fingerprint more than NPLUSONE_THRESHOLD times. The report names the
+serializer field or the first frame of our code that ran the first of
+them, with its stack. NPLUSONE_DETECTION is "log" to log a warning, "raise"
+to raise `NPlusOneError` from the request, and "" to remove the middleware.
+
+`NPlusOneTestMixin` raises for every request a test case makes, and
+`assertNoNPlusOne` checks code outside requests.
+"""
+
+import logging
+import os
+import re
+import sys
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.views import View
+
+from rest_framework.fields import Field
+
+from . import metrics, profiling, responses, slow_queries
+from .responses import observe_stream
+
+logger = logging.getLogger(__name__)
+
+MODES = ("log", "raise")
+
+# Frames of these directories and modules are left out of reports.
+_LIBRARY_PATHS = tuple(
+    os.path.dirname(module.__file__) + os.sep
+    for module in (sys.modules["django"], sys.modules["rest_framework"])
+) + (os.path.dirname(os.__file__) + os.sep,)
+_INSTRUMENTATION = {
+    module.__file__
+    for module in (metrics, profiling, slow_queries, responses)
+} | {__file__}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\((?:\s*(?:%s|\?)\s*,)*\s*(?:%s|\?)\s*\)")
+_SPACE = re.compile(r"\s+")
+
+# Tracker of the current request.
+_tracker = ContextVar("nplusone_tracker", default=None)
+
+
+class NPlusOneError(Exception):
+    """
+    Raised when a request repeats a query shape too often.
+    """
+
+
+def fingerprint(sql):
+    """
+    Return the shape of a statement, without its literals and with IN
+    lists of any length collapsed.
+    :param sql:
+    :return:
+    """
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _LIST.sub("(...)", sql)
+
+    return _SPACE.sub(" ", sql).strip()
+
+
+def _is_ours(filename):
+    return not filename.startswith(_LIBRARY_PATHS) and (
+        "site-packages" not in filename and filename not in _INSTRUMENTATION
+    )
+
+
+def _culprit(frame):
+    """
+    Name the serializer field running the query, else the innermost frame
+    of our code, and the view it ran in.
+    :param frame: innermost frame
+    :return:
+    """
+    culprit = None
+    code = None
+
+    while frame is not None:
+        obj = frame.f_locals.get("self")
+        if culprit is None and isinstance(obj, Field) and obj.field_name:
+            culprit = f"{type(obj.parent).__name__}.{obj.field_name}"
+        if code is None and _is_ours(frame.f_code.co_filename):
+            code = f"{frame.f_code.co_filename}:{frame.f_lineno}"
+        if isinstance(obj, View):
+            view = type(obj).__name__
+            if getattr(obj, "action", None):
+                view = f"{view}.{obj.action}"
+            return f"{culprit or code or 'unknown'} in {view}"
+        frame = frame.f_back
+
+    return culprit or code or "unknown"
+
+
+class Tracker:
+    """
+    Database execute wrapper counting statements per fingerprint and
+    keeping where each fingerprint first ran.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.counts = Counter()
+        self.origins = {}
+        self.batches = []
+
+    def __call__(self, execute, sql, params, many, context):
+        shape = fingerprint(sql)
+        self.counts[shape] += 1
+
+        if self.counts[shape] == 2:
+            # The first repeat, as the first run alone is not suspicious.
+            frame = sys._getframe(1)
+            stack = [
+                entry
+                for entry in traceback.extract_stack(frame)
+                if _is_ours(entry.filename)
+            ]
+            self.origins[shape] = (
+                _culprit(frame),
+                "".join(traceback.format_list(stack)),
+            )
+
+        return execute(sql, params, many, context)
+
+    def problems(self):
+        """
+        Return the repeated fingerprints over the threshold, counted apart
+        in each batch.
+        :return: list of (fingerprint, count, culprit, stack)
+        """
+        found = {}
+
+        for tracker in (self, *self.batches):
+            for shape, count in tracker.counts.items():
+                if count <= max(self.threshold, found.get(shape, (0,))[0]):
+                    continue
+                origin = tracker.origins.get(shape, ("unknown", ""))
+                found[shape] = (count, *origin)
+
+        return sorted(
+            ((shape, *problem) for shape, problem in found.items()),
+            key=lambda problem: -problem[1],
+        )
+
+    @contextmanager
+    def watching(self):
+        token = _tracker.set(self)
+        try:
+            yield self
+        finally:
+            _tracker.reset(token)
+
+
+@contextmanager
+def batch():
+    """
+    Count the queries of the block apart from the rest of the request, for
+    work repeated once per batch by design, like the prefetches of each
+    chunk of a streamed list. Repeats within the block are still reported.
+    :return:
+    """
+    tracker = _tracker.get()
+    if tracker is None:
+        yield
+        return
+
+    block = Tracker(tracker.threshold)
+    tracker.batches.append(block)
+    with block.watching():
+        yield
+
+
+def track(execute, sql, params, many, context):
+    """
+    Database execute wrapper feeding the current tracker, if any.
+    """
+    tracker = _tracker.get()
+    if tracker is None:
+        return execute(sql, params, many, context)
+
+    return tracker(execute, sql, params, many, context)
+
+
+def describe(problems, where):
+    """
+    Return a report of repeated queries.
+    :param problems: `Tracker.problems` result
+    :param where: what ran them, e.g. the request
+    :return:
+    """
+    lines = [f"Repeated queries in {where}:"]
+
+    for shape, count, culprit, stack in problems:
+        lines.append(f"{count} x {shape}")
+        lines.append(f"  caused by {culprit}")
+        if stack:
+            lines.append("  first repeated at:")
+            lines.extend(f"  {line}" for line in stack.rstrip().splitlines())
+
+    return "\n".join(lines)
+
+
+def check(tracker, where, mode):
+    """
+    Report the problems of a finished tracker.
+    :param tracker:
+    :param where:
+    :param mode: "log" or "raise"
+    :return:
+    """
+    problems = tracker.problems()
+    if not problems:
+        return
+
+    if mode == "raise":
+        raise NPlusOneError(describe(problems, where))
+
+    logger.warning(describe(problems, where))
+
+
+class NPlusOneMiddleware:
+    """
+    Flag requests repeating a query shape more than NPLUSONE_THRESHOLD
+    times. Requests made while a tracker is already active, as in
+    `assertNoNPlusOne`, are left to that one.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.NPLUSONE_DETECTION not in MODES:
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        if _tracker.get() is not None:
+            return self.get_response(request)
+
+        tracker = Tracker(settings.NPLUSONE_THRESHOLD)
+        with tracker.watching():
+            response = self.get_response(request)
+
+        return self._check(request, response, tracker)
+
+    async def __acall__(self, request):
+        if _tracker.get() is not None:
+            return await self.get_response(request)
+
+        tracker = Tracker(settings.NPLUSONE_THRESHOLD)
+        with tracker.watching():
+            response = await self.get_response(request)
+
+        return self._check(request, response, tracker)
+
+    def _check(self, request, response, tracker):
+        """
+        Report the request's repeated queries, after its content is sent
+        for a streamed response. The error of the "raise" mode then ends
+        the stream instead of replacing the response.
+        :param request:
+        :param response:
+        :param tracker:
+        :return: the response
+        """
+
+        def report(size=None):
+            check(
+                tracker,
+                f"{request.method} {request.path}",
+                settings.NPLUSONE_DETECTION,
+            )
+
+        if not observe_stream(response, tracker.watching, report):
+            report()
+
+        return response
+
+
+class NPlusOneTestMixin:
+    """
+    Test case mixin failing requests that repeat a query shape more than
+    `nplusone_threshold` times.
+    """
+
+    nplusone_threshold = 1
+
+    @classmethod
+    def setUpClass(cls):
+        from django.test import override_settings
+
+        overrides = override_settings(
+            NPLUSONE_DETECTION="raise",
+            NPLUSONE_THRESHOLD=cls.nplusone_threshold,
+        )
+        overrides.enable()
+        cls.addClassCleanup(overrides.disable)
+        super().setUpClass()
+
+    @contextmanager
+    def assertNoNPlusOne(self, threshold=None):
+        """
+        Fail if the block repeats a query shape too often.
+        :param threshold: defaults to `nplusone_threshold`
+        :return:
+        """
+        if threshold is None:
+            threshold = self.nplusone_threshold
+
+        tracker = Tracker(threshold)
+        with tracker.watching():
+            yield tracker
+
+        problems = tracker.problems()
+        if problems:
+            self.fail(describe(problems, "block"))
@@ -0,0 +1,150 @@
+"""
+On-demand request profiling for staff.
+
+A staff user who sends `X-Profile: json` (or `?_profile=json`) gets the
+request run under cProfile, and receives a JSON report instead of the
+response. The report has the response status, the duration, every database
+query with its time, and the slowest functions by cumulative time. `prof`
+returns the raw profile for tools like snakeviz or `python -m pstats`.
+Requests without the flag only pay for a header and a query lookup.
+"""
+
+import cProfile
+import io
+import marshal
+import pstats
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, JsonResponse
+
+from rest_framework import exceptions
+
+from .authentication import ExpiringTokenAuthentication
+
+HEADER = "HTTP_X_PROFILE"
+QUERY_PARAM = "_profile"
+FORMATS = ("json", "prof")
+PROF_DISPOSITION = 'attachment; filename="request.prof"'
+
+
+def _staff_user(request):
+    """
+    Return the request's staff user from its session or token, if any.
+    :param request:
+    :return:
+    """
+    user = getattr(request, "user", None)
+
+    if user is None or not user.is_authenticated:
+        try:
+            credentials = ExpiringTokenAuthentication().authenticate(request)
+        except exceptions.AuthenticationFailed:
+            return None
+        user = credentials[0] if credentials else None
+
+    return user if user is not None and user.is_staff else None
+
+
+class QueryLog:
+    """
+    Database execute wrapper listing every statement with its time.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(
+                {
+                    "database": context["connection"].alias,
+                    "sql": sql,
+                    "params": repr(params),
+                    "many": many,
+                    "time": time.perf_counter() - start,
+                }
+            )
+
+
+class ProfilingMiddleware:
+    """
+    Profile requests of staff users who ask for it.
+    Async requests are passed through unprofiled, as cProfile cannot tell
+    them apart from the other tasks on the event loop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.get_response(request)
+
+        output = request.META.get(HEADER) or request.GET.get(QUERY_PARAM)
+        if output not in FORMATS or _staff_user(request) is None:
+            return self.get_response(request)
+
+        log = QueryLog()
+        profiler = cProfile.Profile()
+
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(log))
+
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+                if response.streaming:
+                    # Run what streams after the view. The handler closes
+                    # the response, so request_finished only fires once.
+                    for _ in response.streaming_content:
+                        pass
+            finally:
+                profiler.disable()
+            duration = time.perf_counter() - start
+
+        profiler.create_stats()
+
+        if output == "prof":
+            return HttpResponse(
+                marshal.dumps(profiler.stats),
+                content_type="application/octet-stream",
+                headers={"Content-Disposition": PROF_DISPOSITION},
+            )
+
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats(
+            pstats.SortKey.CUMULATIVE
+        ).print_stats(settings.REQUEST_PROFILING_LIMIT)
+
+        return JsonResponse(
+            {
+                "method": request.method,
+                "path": request.get_full_path(),
+                "status": response.status_code,
+                "duration": duration,
+                "query_count": len(log.queries),
+                "query_time": sum(query["time"] for query in log.queries),
+                "queries": log.queries,
+                "profile": stream.getvalue(),
+            }
+        )
@@ -0,0 +1,55 @@
+"""
+Helpers for middleware handling responses.
+"""
+
+from django.http import FileResponse
+
+
+def observe_stream(response, watching, finish):
+    """
+    Run each step of a streaming response inside `watching()` and call
+    `finish(size)` with the number of bytes sent once it ended.
+    File responses are left alone, as wrapping them would lose the server's
+    sendfile.
+    :param response:
+    :param watching: returns a context manager
+    :param finish:
+    :return: whether the response is observed
+    """
+    if not response.streaming or isinstance(response, FileResponse):
+        return False
+
+    content = response.streaming_content
+
+    def steps():
+        size = 0
+        try:
+            while True:
+                with watching():
+                    chunk = next(content, None)
+                if chunk is None:
+                    break
+                size += len(chunk)
+                yield chunk
+        finally:
+            finish(size)
+
+    async def async_steps():
+        size = 0
+        try:
+            while True:
+                with watching():
+                    try:
+                        chunk = await content.__anext__()
+                    except StopAsyncIteration:
+                        break
+                size += len(chunk)
+                yield chunk
+        finally:
+            finish(size)
+
+    response.streaming_content = (
+        async_steps() if response.is_async else steps()
+    )
+
+    return True
@@ -0,0 +1,129 @@
+"""
+Database routing to read replicas.
+
+Reads go to the primary unless the current request opted in with
+`ReplicaReadMixin`. Users who just wrote something are pinned to the
+primary for DB_READ_YOUR_WRITES_WINDOW seconds so they always see their
+own changes despite replication lag.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from rest_framework.permissions import SAFE_METHODS
+
+# Replica alias the current request reads from, None for the primary.
+_read_replica = ContextVar("read_replica", default=None)
+
+
+def _pin_key(user):
+    return f"db-primary-pin:{user.pk}"
+
+
+def pin_to_primary(user):
+    """
+    Route the user's reads to the primary for the read-your-writes window.
+    :param user:
+    :return:
+    """
+    if settings.DB_READ_YOUR_WRITES_WINDOW and user.is_authenticated:
+        cache.set(_pin_key(user), True, settings.DB_READ_YOUR_WRITES_WINDOW)
+
+
+def is_pinned_to_primary(user):
+    """
+    Return whether the user wrote something within the window.
+    :param user:
+    :return:
+    """
+    return user.is_authenticated and cache.get(_pin_key(user), False)
+
+
+@contextmanager
+def read_from_replica():
+    """
+    Route reads in the block to one randomly chosen replica.
+    Does nothing when no replica is configured.
+    :return:
+    """
+    replicas = settings.DATABASE_REPLICAS
+
+    with read_from(random.choice(replicas) if replicas else None):
+        yield
+
+
+@contextmanager
+def read_from(alias):
+    """
+    Route reads in the block to `alias`, None for the primary.
+    :param alias:
+    :return:
+    """
+    token = _read_replica.set(alias)
+
+    try:
+        yield
+    finally:
+        _read_replica.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Send reads to the replica chosen for the request, everything else to
+    the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == "django_cache":
+            # Pins are written to the primary and must be read from it.
+            return DEFAULT_DB_ALIAS
+
+        return _read_replica.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    Serve safe requests from a read replica.
+
+    The replica is only used once the user is authenticated, so token
+    checks always see the primary, and not for users pinned to the primary
+    after a write. Successful unsafe requests pin the user.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+
+        if request.method in SAFE_METHODS and not is_pinned_to_primary(
+            request.user
+        ):
+            self._replica_context = read_from_replica()
+            self._replica_context.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        context = getattr(self, "_replica_context", None)
+
+        if context is not None:
+            self._replica_context = None
+            context.__exit__(None, None, None)
+        elif request.method not in SAFE_METHODS and response.status_code < 400:
+            pin_to_primary(request.user)
+
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,157 @@
+"""
+Precomputed OpenAPI schema.
+
+Generating the schema walks every view and serializer, so it is done once by
+`manage.py build_schema` and committed as OPENAPI_SCHEMA_FILE. The schema
+view loads that file on first request and serves the rendered bytes from
+memory.
+"""
+
+import hashlib
+import logging
+import threading
+from typing import NamedTuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_cached = None
+
+
+class Rendered(NamedTuple):
+    """
+    One representation of the schema.
+    """
+
+    content: bytes
+    content_type: str
+    etag: str
+
+
+class CachedSchema(NamedTuple):
+    """
+    The schema rendered as YAML and as JSON.
+    """
+
+    yaml: Rendered
+    json: Rendered
+
+
+def _rendered(content, content_type):
+    digest = hashlib.sha256(content).hexdigest()
+
+    return Rendered(content, content_type, f'"{digest}"')
+
+
+def generate_schema():
+    """
+    Generate the schema from the live URLconf, like `manage.py spectacular`.
+    :return: the schema as a dict
+    """
+    from drf_spectacular.settings import spectacular_settings
+
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+
+    return generator.get_schema(request=None, public=True)
+
+
+def render_yaml(schema):
+    """
+    Render `schema` as the YAML written to OPENAPI_SCHEMA_FILE.
+    :param schema:
+    :return: bytes
+    """
+    from drf_spectacular.renderers import OpenApiYamlRenderer
+
+    return OpenApiYamlRenderer().render(schema, renderer_context={})
+
+
+def render(schema, yaml_content=None):
+    """
+    Render `schema` in every served format.
+    :param schema:
+    :param yaml_content: `schema` already rendered as YAML
+    :return: CachedSchema
+    """
+    from drf_spectacular.renderers import OpenApiJsonRenderer
+
+    if yaml_content is None:
+        yaml_content = render_yaml(schema)
+
+    return CachedSchema(
+        yaml=_rendered(
+            yaml_content, "application/vnd.oai.openapi; charset=utf-8"
+        ),
+        json=_rendered(
+            OpenApiJsonRenderer().render(schema, renderer_context={}),
+            "application/vnd.oai.openapi+json",
+        ),
+    )
+
+
+def load():
+    """
+    Render the schema from OPENAPI_SCHEMA_FILE.
+    The file is served as is and only parsed for the JSON rendering. Falls
+    back to generating the schema when the file is missing.
+    :return: CachedSchema
+    """
+    import yaml
+
+    try:
+        with open(settings.OPENAPI_SCHEMA_FILE, "rb") as file:
+            content = file.read()
+    except FileNotFoundError:
+        logger.warning(
+            "%s not found, generating the schema. "
+            "Run `manage.py build_schema` to precompute it.",
+            settings.OPENAPI_SCHEMA_FILE,
+        )
+        return render(generate_schema())
+
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+    return render(yaml.load(content, Loader=loader), content)
+
+
+def get_cached_schema():
+    """
+    Return the rendered schema, loading it on first use.
+    :return: CachedSchema
+    """
+    global _cached
+
+    if _cached is None:
+        with _lock:
+            if _cached is None:
+                _cached = load()
+
+    return _cached
+
+
+def clear_cache():
+    """
+    Drop the rendered schema so the next request loads it again.
+    :return:
+    """
+    global _cached
+
+    with _lock:
+        _cached = None
+
+
+def is_stale(schema=None):
+    """
+    Check whether OPENAPI_SCHEMA_FILE differs from the live schema.
+    :param schema: the live schema, generated when not given
+    :return: True when the file is missing or out of date
+    """
+    schema = generate_schema() if schema is None else schema
+
+    try:
+        with open(settings.OPENAPI_SCHEMA_FILE, "rb") as file:
+            return file.read() != render_yaml(schema)
+    except FileNotFoundError:
+        return True
@@ -0,0 +1,40 @@
+"""
+Sizing of the production application server.
+
+Kept free of Django imports so `gunicorn.conf.py` can use it before the
+application is loaded.
+"""
+
+import os
+
+# Requests mostly wait on the database, so a few threads per worker keep
+# a core busy without the memory cost of more processes.
+THREADS_PER_WORKER = 4
+
+
+def available_cpus():
+    """
+    Return the number of CPUs this process may run on.
+    :return:
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def recommended_workers(cpus=None):
+    """
+    Return the number of worker processes for `cpus` cores.
+    :param cpus: defaults to the available CPUs
+    :return:
+    """
+    return 2 * (cpus or available_cpus()) + 1
+
+
+def recommended_threads():
+    """
+    Return the number of threads per worker process.
+    :return:
+    """
+    return THREADS_PER_WORKER
@@ -0,0 +1,29 @@
+"""
+Signal handlers for the core app.
+"""
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from . import metrics, nplusone, slow_queries
+
+# Execute wrappers of the request instrumentation, outermost first.
+QUERY_WRAPPERS = (metrics.record_query, slow_queries.watch, nplusone.track)
+
+
+@receiver(connection_created)
+def install_query_wrappers(sender, connection, **kwargs):
+    """
+    Install the request instrumentation on every new connection.
+
+    The wrappers find the request they count for in context variables,
+    which `sync_to_async` carries to the thread running the queries, so
+    they see queries of async requests too.
+    :param sender:
+    :param connection:
+    :return:
+    """
+    for wrapper in reversed(QUERY_WRAPPERS):
+        if wrapper not in connection.execute_wrappers:
+            # In front, as `execute_wrapper` blocks pop the last one.
+            connection.execute_wrappers.insert(0, wrapper)
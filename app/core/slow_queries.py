@@ -0,0 +1,264 @@
+"""
+Slow-query log.
+
+`SlowQueryMiddleware` watches every statement of a request and logs the ones
+taking SLOW_QUERY_THRESHOLD seconds or longer, with the route and user.
+Entries are stored as `SlowQuery` rows, of which only the latest
+SLOW_QUERY_LOG_SIZE are kept. Their parameters, which may hold passwords
+or tokens, are only stored with SLOW_QUERY_LOG_PARAMS.
+
+The plan of a SLOW_QUERY_EXPLAIN_RATE share of slow SELECTs on PostgreSQL
+is captured by a background job, off the request. It runs the statement
+again under `EXPLAIN (ANALYZE, BUFFERS)` when its parameters were stored,
+and otherwise takes its generic plan without running it.
+"""
+
+import json
+import logging
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import (
+    iscoroutinefunction,
+    markcoroutinefunction,
+    sync_to_async,
+)
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+
+from . import jobs
+from .models import SlowQuery
+from .responses import observe_stream
+
+logger = logging.getLogger(__name__)
+
+EXPLAIN_JOB = "core.explain_slow_query"
+
+# Row locks EXPLAIN ANALYZE would take again.
+_LOCKING = re.compile(r"\bFOR (?:NO KEY )?(?:UPDATE|SHARE|KEY SHARE)\b")
+
+# Slow statements of the current request, as
+# (database alias, sql, params, many, duration) tuples.
+_slow = ContextVar("slow_queries", default=None)
+
+
+def watch(execute, sql, params, many, context):
+    """
+    Database execute wrapper noting statements over the threshold.
+    """
+    start = time.perf_counter()
+
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        slow = _slow.get()
+        if duration >= settings.SLOW_QUERY_THRESHOLD and slow is not None:
+            slow.append(
+                (context["connection"].alias, sql, params, many, duration)
+            )
+
+
+def explain(alias, sql, params=None, placeholders=0):
+    """
+    Return the plan of a SELECT.
+
+    With `params`, the statement is run again under EXPLAIN ANALYZE.
+    Without, its generic plan is returned, with `placeholders` parameters
+    left as $1, $2, and so on, and nothing is run. Other statements are
+    not explained, as EXPLAIN ANALYZE would repeat their effects.
+    :param alias:
+    :param sql:
+    :param params:
+    :param placeholders: number of parameters of `sql`
+    :return: the plan, or "" when it could not be captured
+    """
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        return ""
+    if sql.lstrip()[:6].upper() != "SELECT":
+        return ""
+
+    if params is None:
+        # Also unescapes %% as the driver would.
+        sql = sql % tuple(f"${i}" for i in range(1, placeholders + 1))
+        statement = f"EXPLAIN (GENERIC_PLAN) {sql}"
+    else:
+        statement = f"EXPLAIN (ANALYZE, BUFFERS) {sql}"
+
+    try:
+        with transaction.atomic(using=alias), connection.cursor() as cursor:
+            cursor.execute(statement, params)
+            return "\n".join(row[0] for row in cursor.fetchall())
+    except DatabaseError:
+        logger.warning("Could not explain slow query.", exc_info=True)
+        return ""
+
+
+@jobs.register(EXPLAIN_JOB)
+def explain_slow_query(slow_query_id, placeholders):
+    """
+    Store the plan of a logged slow query.
+
+    It is analyzed with its parameters when they were stored and it takes
+    no row locks, and only planned otherwise.
+    :param slow_query_id:
+    :param placeholders: number of parameters of the statement
+    :return:
+    """
+    entry = SlowQuery.objects.filter(pk=slow_query_id).first()
+    if entry is None:
+        return
+
+    params = None
+    if len(entry.params) == placeholders and not _LOCKING.search(entry.sql):
+        params = entry.params
+
+    entry.plan = explain(entry.database, entry.sql, params, placeholders)
+    entry.save(update_fields=["plan"])
+
+
+def record(request, slow):
+    """
+    Log and store the slow statements of a finished request, and queue
+    the capture of a SLOW_QUERY_EXPLAIN_RATE share of their plans.
+    :param request:
+    :param slow:
+    :return:
+    """
+    match = request.resolver_match
+    route = match.view_name if match else ""
+    user = getattr(request, "user", None)
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    entries = []
+    explained = []
+
+    for alias, sql, params, many, duration in slow:
+        logger.warning(
+            "Slow query (%.0fms) on %s %s by user %s: %s",
+            duration * 1000,
+            request.method,
+            route or request.path,
+            user_id,
+            sql,
+        )
+
+        entries.append(
+            SlowQuery(
+                duration=duration,
+                database=alias,
+                route=route,
+                method=request.method,
+                user_id=user_id,
+                sql=sql,
+                params=(
+                    json.loads(json.dumps(params or [], default=str))
+                    if settings.SLOW_QUERY_LOG_PARAMS
+                    else []
+                ),
+            )
+        )
+        if (
+            not many
+            and not isinstance(params, dict)
+            and random.random() < settings.SLOW_QUERY_EXPLAIN_RATE
+        ):
+            explained.append((entries[-1], len(params or [])))
+
+    try:
+        with transaction.atomic():
+            SlowQuery.objects.bulk_create(entries)
+            for entry, placeholders in explained:
+                jobs.enqueue(
+                    EXPLAIN_JOB,
+                    slow_query_id=entry.pk,
+                    placeholders=placeholders,
+                )
+        trim()
+    except DatabaseError:
+        logger.exception("Could not store slow queries.")
+
+
+def trim():
+    """
+    Delete all but the latest SLOW_QUERY_LOG_SIZE entries.
+    :return:
+    """
+    size = settings.SLOW_QUERY_LOG_SIZE
+    cutoff = (
+        SlowQuery.objects.order_by("-id")
+        .values_list("id", flat=True)[size : size + 1]
+        .first()
+    )
+
+    if cutoff is not None:
+        SlowQuery.objects.filter(id__lte=cutoff).delete()
+
+
+class SlowQueryMiddleware:
+    """
+    Log statements slower than SLOW_QUERY_THRESHOLD, which 0 disables.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        if not settings.SLOW_QUERY_THRESHOLD:
+            return self.get_response(request)
+
+        slow = []
+        with self._watching(slow):
+            response = self.get_response(request)
+
+        def finish(size=None):
+            if slow:
+                record(request, slow)
+
+        if not observe_stream(response, lambda: self._watching(slow), finish):
+            finish()
+
+        return response
+
+    async def __acall__(self, request):
+        if not settings.SLOW_QUERY_THRESHOLD:
+            return await self.get_response(request)
+
+        slow = []
+        with self._watching(slow):
+            response = await self.get_response(request)
+
+        def finish(size=None):
+            if slow:
+                record(request, slow)
+
+        if not observe_stream(response, lambda: self._watching(slow), finish):
+            await sync_to_async(finish)()
+
+        return response
+
+    @contextmanager
+    def _watching(self, slow):
+        """
+        Collect the slow statements of the block into `slow`.
+        :param slow:
+        :return:
+        """
+        token = _slow.set(slow)
+
+        try:
+            yield
+        finally:
+            _slow.reset(token)
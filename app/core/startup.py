@@ -0,0 +1,92 @@
+"""
+Startup probe run in a fresh interpreter by `manage.py startup_profile`.
+
+Sets Django up, loads the URLconf and serves one request, timing each step
+and every `AppConfig.ready`, then prints the timings as JSON. Run it with
+`python -X importtime` to also get per-module import times on stderr.
+"""
+
+import json
+import sys
+import time
+from wsgiref.util import setup_testing_defaults
+
+# Modules only some requests need, reported when they were imported.
+HEAVY_MODULES = [
+    "PIL.Image",
+    "django.contrib.auth.admin",
+    "drf_spectacular.openapi",
+]
+
+
+def _time_ready(timings):
+    """
+    Wrap the `ready` method of every app config created from now on.
+    :param timings: dict filled with seconds per app label
+    :return:
+    """
+    from django.apps.config import AppConfig
+
+    create = AppConfig.create.__func__
+
+    def timed_create(cls, entry):
+        config = create(cls, entry)
+        ready = config.ready
+
+        def timed_ready():
+            start = time.perf_counter()
+            ready()
+            timings[config.label] = time.perf_counter() - start
+
+        config.ready = timed_ready
+
+        return config
+
+    AppConfig.create = classmethod(timed_create)
+
+
+def main(path):
+    """
+    Time startup and the first request to `path`.
+    :param path:
+    :return:
+    """
+    start = time.perf_counter()
+    import django
+
+    ready = {}
+    _time_ready(ready)
+    django.setup()
+    setup = time.perf_counter() - start
+
+    from django.conf import settings
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.urls import get_resolver
+
+    start = time.perf_counter()
+    get_resolver().url_patterns
+    urlconf = time.perf_counter() - start
+
+    environ = {"PATH_INFO": path, "REQUEST_METHOD": "GET"}
+    setup_testing_defaults(environ)
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, environ["HTTP_HOST"]]
+    statuses = []
+    start = time.perf_counter()
+    WSGIHandler()(environ, lambda status, headers: statuses.append(status))
+    first_request = time.perf_counter() - start
+
+    json.dump(
+        {
+            "setup": setup,
+            "ready": ready,
+            "urlconf": urlconf,
+            "first_request": first_request,
+            "status": int(statuses[0].split()[0]),
+            "loaded": [name for name in HEAVY_MODULES if name in sys.modules],
+        },
+        sys.stdout,
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
@@ -0,0 +1,67 @@
+"""
+File storage backends.
+"""
+
+import os
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage for files named after a hash of their content.
+
+    A name always refers to the same bytes, so saving a file that already
+    exists is a no-op and names are never made unique with a suffix. New
+    files are written to a temporary file in the target directory and
+    renamed into place, so readers never see a partial file.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        """
+        Return `name` unchanged, an existing file has the same content.
+        """
+        validate_file_name(name, allow_relative_path=True)
+
+        return name
+
+    def _save(self, name, content):
+        """
+        Write `content` under `name` unless it is already stored.
+        """
+        full_path = self.path(name)
+
+        if os.path.exists(full_path):
+            return name
+
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+
+        try:
+            if hasattr(content, "temporary_file_path"):
+                os.close(fd)
+                file_move_safe(
+                    content.temporary_file_path(),
+                    tmp_path,
+                    allow_overwrite=True,
+                )
+            else:
+                with os.fdopen(fd, "wb") as tmp_file:
+                    for chunk in content.chunks():
+                        tmp_file.write(chunk)
+
+            os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        return name
+
+
+recipe_image_storage = ContentAddressedStorage()
@@ -0,0 +1,139 @@
+"""
+Streaming JSON list responses.
+
+`StreamingListMixin` makes a viewset's list action fetch its queryset in
+chunks of CHUNK_SIZE rows and serialize and encode one chunk at a time into
+a `StreamingHttpResponse`. A worker then holds one chunk of rows, objects
+and JSON at a time, whatever the size of the list, and starts sending
+before the last row is read. The bytes are the same as a `Response` would
+give. Under ASGI the response gets an async iterator taking each chunk in
+the request's sync thread, as the server would otherwise read a sync one
+whole before sending it.
+
+Queries of a streamed list run after the view returned, while the server
+sends the response. Middleware watching queries follows them with
+`core.responses.observe_stream`. The status and headers are sent first, so
+a database error past that point cannot become an error response. The
+server then drops the connection without ending the chunked body, and the
+client is left with truncated JSON.
+"""
+
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from . import nplusone
+from .routers import read_from
+
+# Rows fetched per round trip while streaming querysets.
+CHUNK_SIZE = 500
+
+
+async def _iterate_async(iterator):
+    """
+    Yield the items of a sync iterator, each taken with `sync_to_async`.
+    :param iterator:
+    :return:
+    """
+    take = sync_to_async(next)
+
+    while (item := await take(iterator, None)) is not None:
+        yield item
+
+
+class StreamingJSONRenderer(JSONRenderer):
+    """
+    JSON renderer that can also encode a list chunk by chunk.
+    """
+
+    def render_chunks(
+        self, chunks, accepted_media_type=None, renderer_context=None
+    ):
+        """
+        Yield the JSON of a list given as lists of items.
+        :param chunks: iterable of lists of items
+        :param accepted_media_type:
+        :param renderer_context:
+        :return:
+        """
+        separator = b"," if self.compact else b", "
+        first = True
+
+        yield b"["
+        for chunk in chunks:
+            if not chunk:
+                continue
+            # Render the chunk as a list and drop its brackets.
+            content = self.render(
+                chunk, accepted_media_type, renderer_context
+            )[1:-1]
+            yield content if first else separator + content
+            first = False
+        yield b"]"
+
+
+class StreamingListMixin:
+    """
+    Stream the list action of a viewset as JSON.
+
+    Other formats, indented JSON and paginated lists get a normal
+    `Response`.
+    """
+
+    renderer_classes = [
+        StreamingJSONRenderer if renderer is JSONRenderer else renderer
+        for renderer in api_settings.DEFAULT_RENDERER_CLASSES
+    ]
+
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        renderer_context = self.get_renderer_context()
+
+        if (
+            not isinstance(renderer, StreamingJSONRenderer)
+            or renderer.get_indent(
+                request.accepted_media_type, renderer_context
+            )
+            or self.paginator is not None
+        ):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        # Keep reading from the database chosen for the request, as the
+        # rows are fetched after the view returned.
+        alias = queryset.db
+
+        content = renderer.render_chunks(
+            self._serialized_chunks(queryset.using(alias), alias),
+            request.accepted_media_type,
+            renderer_context,
+        )
+        if isinstance(request._request, ASGIRequest):
+            content = _iterate_async(content)
+
+        return StreamingHttpResponse(
+            content, content_type=renderer.media_type
+        )
+
+    def _serialized_chunks(self, queryset, alias):
+        """
+        Yield the serialized objects of `queryset`, a chunk at a time.
+        :param queryset:
+        :param alias: database prefetches read from
+        :return:
+        """
+        objects = queryset.iterator(chunk_size=CHUNK_SIZE)
+
+        while True:
+            # Each chunk runs the same prefetches, which are no N+1.
+            with read_from(alias), nplusone.batch():
+                chunk = list(islice(objects, CHUNK_SIZE))
+                if not chunk:
+                    return
+                data = self.get_serializer(chunk, many=True).data
+            yield data
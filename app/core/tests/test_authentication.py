@@ -0,0 +1,192 @@
+"""
+Tests for expiring token authentication.
+"""
+
+import os
+import runpy
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+
+from ..authentication import (
+    ExpiringTokenAuthentication,
+    TokenUsageBuffer,
+    issue_token,
+    token_usage,
+)
+from ..models import TokenActivity
+
+
+def create_token(email="user@example.com", age=timedelta(0)):
+    """
+    Create and return a token created `age` ago.
+    :param email:
+    :param age:
+    :return:
+    """
+    user = get_user_model().objects.create_user(email, "test_pass123")
+    token = Token.objects.create(user=user)
+    Token.objects.filter(pk=token.pk).update(
+        created=timezone.now() - age
+    )
+    token.refresh_from_db()
+
+    return token
+
+
+@override_settings(AUTH_TOKEN_TTL=3600, AUTH_TOKEN_IDLE_TTL=600)
+class ExpiringTokenAuthenticationTests(TestCase):
+    """
+    Test token expiry rules.
+    """
+
+    def setUp(self):
+        self.auth = ExpiringTokenAuthentication()
+
+    def test_fresh_token_authenticates(self):
+        """
+        Test a recently created token is accepted.
+        :return:
+        """
+        token = create_token()
+
+        user, auth_token = self.auth.authenticate_credentials(token.key)
+
+        self.assertEqual(user, token.user)
+        self.assertEqual(auth_token, token)
+
+    def test_token_past_ttl_rejected(self):
+        """
+        Test a token older than the TTL is rejected even if used recently.
+        :return:
+        """
+        token = create_token(age=timedelta(hours=2))
+        TokenActivity.objects.create(token=token, last_used=timezone.now())
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(token.key)
+
+    def test_idle_token_rejected(self):
+        """
+        Test a token unused for longer than the idle TTL is rejected.
+        :return:
+        """
+        token = create_token(age=timedelta(minutes=30))
+        TokenActivity.objects.create(
+            token=token, last_used=timezone.now() - timedelta(minutes=20)
+        )
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(token.key)
+
+    def test_recent_activity_keeps_token_alive(self):
+        """
+        Test a token past the idle TTL since creation but used recently.
+        :return:
+        """
+        token = create_token(age=timedelta(minutes=30))
+        TokenActivity.objects.create(
+            token=token, last_used=timezone.now() - timedelta(minutes=1)
+        )
+
+        user, _ = self.auth.authenticate_credentials(token.key)
+
+        self.assertEqual(user, token.user)
+
+    def test_issue_token_replaces_expired_token(self):
+        """
+        Test logging in again replaces an expired token.
+        :return:
+        """
+        token = create_token(age=timedelta(hours=2))
+
+        new_token = issue_token(token.user)
+
+        self.assertNotEqual(new_token.key, token.key)
+        self.assertFalse(Token.objects.filter(key=token.key).exists())
+
+    def test_issue_token_reuses_live_token(self):
+        """
+        Test logging in keeps a token that has not expired.
+        :return:
+        """
+        token = create_token()
+
+        self.assertEqual(issue_token(token.user).key, token.key)
+
+
+class TokenUsageBufferTests(TestCase):
+    """
+    Test batched last-used tracking.
+    """
+
+    @override_settings(
+        AUTH_TOKEN_USAGE_BATCH_SIZE=2, AUTH_TOKEN_USAGE_FLUSH_INTERVAL=3600
+    )
+    def test_flushes_when_batch_full(self):
+        """
+        Test timestamps are buffered until the batch is full.
+        :return:
+        """
+        buffer = TokenUsageBuffer()
+        first = create_token("one@example.com")
+        second = create_token("two@example.com")
+        now = timezone.now()
+
+        buffer.touch(first.key, now)
+        buffer.touch(first.key, now)
+
+        self.assertEqual(TokenActivity.objects.count(), 0)
+
+        buffer.touch(second.key, now)
+
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(TokenActivity.objects.count(), 2)
+
+    def test_flush_updates_existing_and_skips_deleted(self):
+        """
+        Test flushing upserts timestamps and ignores deleted tokens.
+        :return:
+        """
+        buffer = TokenUsageBuffer()
+        token = create_token()
+        old = timezone.now() - timedelta(days=1)
+        TokenActivity.objects.create(token=token, last_used=old)
+        now = timezone.now()
+
+        buffer._pending = {token.key: now, "deleted-token": now}
+        written = buffer.flush()
+
+        self.assertEqual(written, 1)
+        self.assertEqual(TokenActivity.objects.get(token=token).last_used, now)
+
+    @override_settings(
+        AUTH_TOKEN_USAGE_BATCH_SIZE=100, AUTH_TOKEN_USAGE_FLUSH_INTERVAL=3600
+    )
+    def test_flushed_when_worker_exits(self):
+        """
+        Test the gunicorn worker exit hook writes the buffered usage.
+        :return:
+        """
+        token = create_token()
+        now = timezone.now()
+        token_usage.touch(token.key, now)
+        self.addCleanup(token_usage._pending.clear)
+        with patch.dict(os.environ):
+            config = runpy.run_path(
+                os.path.join(settings.BASE_DIR, "gunicorn.conf.py")
+            )
+
+        self.assertFalse(TokenActivity.objects.exists())
+
+        config["worker_exit"](None, None)
+
+        self.assertEqual(len(token_usage), 0)
+        self.assertEqual(TokenActivity.objects.get(token=token).last_used, now)
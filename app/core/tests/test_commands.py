@@ -2,44 +2,522 @@
 Test custom Django management commands.
 """
 
+from datetime import timedelta
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+from io import StringIO
+from unittest import skipIf, skipUnless
 from unittest.mock import patch
 
-from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.core.management.color import no_style
+from django.db import connection
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.utils import timezone
 from psycopg2 import OperationalError as Psycopg2Error
 
+from rest_framework.authtoken.models import Token
 
-@patch("core.management.commands.wait_for_db.Command.check")
+from ..benchmark import percentile
+from ..models import SlowQuery
+from ..management.commands import loadtest, seed_data
+from ..management.commands.seed_data import plan
+from ..management.commands.startup_profile import parse_importtime
+from recipe.models import Recipe
+from tag.models import Tag
+
+
+@patch("core.management.commands.wait_for_db.Command.probe")
 class CommandTests(SimpleTestCase):
     """
     Test commands.
     """
 
-    def test_wait_for_db_ready(self, patched_check):
+    def test_wait_for_db_ready(self, patched_probe):
         """
         Test waiting for a database if database ready.
-        :param patched_check:
+        :param patched_probe:
         :return:
         """
-        patched_check.return_value = True
+        patched_probe.return_value = None
 
-        call_command("wait_for_db")
+        call_command("wait_for_db", stdout=StringIO())
 
-        patched_check.assert_called_once_with(databases=["default"])
+        patched_probe.assert_called_once_with("default")
 
     @patch("time.sleep")
-    def test_wait_for_db_delay(self, patched_sleep, patched_check):
+    def test_wait_for_db_delay(self, patched_sleep, patched_probe):
         """
         Test waiting for a database when getting OperationalError.
-        :param patched_check:
+        :param patched_sleep:
+        :param patched_probe:
+        :return:
+        """
+        patched_probe.side_effect = (
+            [ConnectionRefusedError, Psycopg2Error]
+            + [OperationalError] * 3
+            + [None]
+        )
+
+        call_command("wait_for_db", stdout=StringIO())
+
+        self.assertEqual(patched_probe.call_count, 6)
+        delays = [call.args[0] for call in patched_sleep.call_args_list]
+        self.assertEqual(len(delays), 5)
+        self.assertLess(delays[0], 0.1)
+        self.assertGreater(delays[-1], delays[0])
+
+    @patch("time.sleep")
+    def test_wait_for_db_timeout(self, patched_sleep, patched_probe):
+        """
+        Test giving up once the timeout would be exceeded.
+        :param patched_sleep:
+        :param patched_probe:
+        :return:
+        """
+        patched_probe.side_effect = OperationalError
+
+        with self.assertRaises(CommandError):
+            call_command("wait_for_db", timeout=1, stdout=StringIO())
+
+        self.assertTrue(patched_sleep.called)
+
+    @patch("time.sleep")
+    @patch(
+        "core.management.commands.wait_for_db.Command.pending_migrations"
+    )
+    def test_wait_for_migrations(
+        self, patched_pending, patched_sleep, patched_probe
+    ):
+        """
+        Test waiting until no migration is pending.
+        :param patched_pending:
+        :param patched_sleep:
+        :param patched_probe:
+        :return:
+        """
+        patched_pending.side_effect = [3, 1, 0]
+
+        call_command("wait_for_db", migrations=True, stdout=StringIO())
+
+        self.assertEqual(patched_pending.call_count, 3)
+        self.assertEqual(patched_sleep.call_count, 2)
+
+
+@override_settings(AUTH_TOKEN_TTL=3600, AUTH_TOKEN_IDLE_TTL=0)
+class PruneTokensCommandTests(TestCase):
+    """
+    Test the prune_tokens command.
+    """
+
+    def test_prune_tokens_deletes_expired_only(self):
+        """
+        Test expired tokens are deleted in batches and live ones kept.
+        :return:
+        """
+        expired_keys = []
+        for i in range(5):
+            user = get_user_model().objects.create_user(
+                f"old{i}@example.com", "test_pass123"
+            )
+            token = Token.objects.create(user=user)
+            expired_keys.append(token.key)
+        Token.objects.update(created=timezone.now() - timedelta(hours=2))
+        live_user = get_user_model().objects.create_user(
+            "live@example.com", "test_pass123"
+        )
+        live_token = Token.objects.create(user=live_user)
+
+        call_command("prune_tokens", batch_size=2, stdout=StringIO())
+
+        self.assertFalse(Token.objects.filter(key__in=expired_keys).exists())
+        self.assertTrue(Token.objects.filter(key=live_token.key).exists())
+
+
+class BenchDbConnectionsCommandTests(TransactionTestCase):
+    """
+    Test the bench_db_connections command.
+    """
+
+    def test_reports_each_mode(self):
+        """
+        Test both modes are measured and connection settings restored.
         :return:
         """
-        patched_check.side_effect = (
-            [Psycopg2Error] * 2 + [OperationalError] * 3 + [True]
+        settings_dict = connection.settings_dict
+        original = (settings_dict["CONN_MAX_AGE"], settings_dict["OPTIONS"])
+        out = StringIO()
+
+        call_command("bench_db_connections", requests=3, stdout=out)
+
+        self.assertIn("new connection per request: n=3", out.getvalue())
+        self.assertIn("persistent connection: n=3", out.getvalue())
+        self.assertEqual(
+            (settings_dict["CONN_MAX_AGE"], settings_dict["OPTIONS"]),
+            original,
+        )
+
+    def test_percentile(self):
+        """
+        Test nearest-rank percentiles.
+        :return:
+        """
+        samples = list(range(1, 101))
+
+        self.assertEqual(percentile(samples, 50), 50)
+        self.assertEqual(percentile(samples, 99), 99)
+        self.assertEqual(percentile(samples, 100), 100)
+        self.assertEqual(percentile([], 50), 0.0)
+
+
+class ServingSettingsCommandTests(SimpleTestCase):
+    """
+    Test the serving_settings command.
+    """
+
+    @patch("core.management.commands.serving_settings.available_cpus")
+    def test_sized_for_available_cpus(self, patched_cpus):
+        """
+        Test workers are sized for the host's cores.
+        :param patched_cpus:
+        :return:
+        """
+        patched_cpus.return_value = 2
+        out = StringIO()
+
+        call_command("serving_settings", stdout=out)
+
+        self.assertIn("GUNICORN_WORKERS=5\n", out.getvalue())
+        self.assertIn("GUNICORN_THREADS=4\n", out.getvalue())
+
+
+class StartupProfileCommandTests(SimpleTestCase):
+    """
+    Test the startup_profile command.
+    """
+
+    def test_parse_importtime(self):
+        """
+        Test import times are parsed into seconds.
+        :return:
+        """
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   json.decoder\n"
+            "import time:      2000 |       2120 | json\n"
+            "Unauthorized: /api/recipe/recipes/\n"
         )
 
-        call_command("wait_for_db")
+        self.assertEqual(
+            parse_importtime(output),
+            [("json.decoder", 0.00012, 0.00012), ("json", 0.002, 0.00212)],
+        )
 
-        self.assertEqual(patched_check.call_count, 6)
-        patched_check.assert_called_with(databases=["default"])
+    def test_heavy_modules_not_loaded_at_startup(self):
+        """
+        Test Pillow and the admin stay unloaded for an API request.
+        :return:
+        """
+        out = StringIO()
+
+        call_command("startup_profile", "--json", stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(report["status"], 401)
+        self.assertNotIn("PIL.Image", report["loaded"])
+        self.assertNotIn("django.contrib.auth.admin", report["loaded"])
+        self.assertGreater(report["imports"]["count"], 0)
+
+
+class SlowQueriesCommandTests(TestCase):
+    """
+    Test the slow_queries command.
+    """
+
+    def test_lists_and_clears(self):
+        """
+        Test entries are listed with their plans, then deleted.
+        :return:
+        """
+        SlowQuery.objects.create(
+            duration=0.5,
+            database="default",
+            route="recipe:tag-list",
+            method="GET",
+            user_id=1,
+            sql="SELECT 1",
+            plan="Result  (cost=0.00..0.01 rows=1 width=4)",
+        )
+        out = StringIO()
+
+        call_command("slow_queries", "--plans", stdout=out)
+        call_command("slow_queries", "--clear", stdout=StringIO())
+
+        self.assertIn("500ms GET recipe:tag-list user=1", out.getvalue())
+        self.assertIn("    Result  (cost=", out.getvalue())
+        self.assertFalse(SlowQuery.objects.exists())
+
+
+class BenchApiCommandTests(TestCase):
+    """
+    Test the bench_api command.
+    """
+
+    def test_results_and_baseline(self):
+        """
+        Test results are written and compared with a baseline.
+        :return:
+        """
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        output = os.path.join(tmp.name, "results.json")
+        options = {
+            "users": 2,
+            "recipes": 3,
+            "tags": 2,
+            "ingredients": 2,
+            "iterations": 2,
+            "warmup": 0,
+            "stdout": StringIO(),
+        }
+
+        call_command("bench_api", output=output, **options)
+
+        with open(output) as file:
+            results = json.load(file)
+        self.assertEqual(results["meta"]["dataset"]["users"], 2)
+        for result in results["scenarios"].values():
+            self.assertEqual(result["count"], 2)
+            self.assertGreater(result["queries"]["mean"], 0)
+        self.assertFalse(get_user_model().objects.exists())
+
+        results["scenarios"]["recipe-list"]["queries"]["mean"] = 0
+        with open(output, "w") as file:
+            json.dump(results, file)
+
+        with self.assertRaisesMessage(CommandError, "recipe-list"):
+            call_command(
+                "bench_api",
+                scenarios=["recipe-list"],
+                baseline=output,
+                max_regression=1000,
+                **options,
+            )
+
+
+class SeedDataCommandTests(TestCase):
+    """
+    Test the seed_data command.
+    """
+
+    def test_plan(self):
+        """
+        Test chunks get consecutive ID ranges after the existing rows.
+        :return:
+        """
+        user = get_user_model().objects.create_user("user@example.com")
+        options = {
+            "seed": 1,
+            "tags_per_user": 5,
+            "ingredients_per_user": 10,
+            "recipes_per_user": 20,
+            "chunk_size": 2,
+            "password_hash": "",
+        }
+
+        chunks = plan(5, options)
+
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(chunks[0]["first_user"], user.id + 1)
+        self.assertEqual(chunks[0]["firsts"], [1, 1, 1])
+        for before, after in zip(chunks, chunks[1:]):
+            self.assertEqual(
+                after["first_user"], before["first_user"] + 2
+            )
+            self.assertEqual(
+                after["firsts"],
+                [
+                    first + sum(counts[i] for counts in before["counts"])
+                    for i, first in enumerate(before["firsts"])
+                ],
+            )
+        self.assertEqual(plan(5, options), chunks)
+
+    @skipIf(connection.vendor == "postgresql", "Tests the fallback.")
+    def test_needs_postgresql(self):
+        """
+        Test other databases are refused.
+        :return:
+        """
+        with self.assertRaisesMessage(CommandError, "PostgreSQL"):
+            call_command("seed_data", users=1, stdout=StringIO())
+
+    @skipUnless(connection.vendor == "postgresql", "COPY is PostgreSQL only.")
+    def test_seed(self):
+        """
+        Test rows of all tables are loaded and usable by the ORM.
+        :return:
+        """
+        out = StringIO()
+
+        call_command(
+            "seed_data",
+            users=3,
+            recipes_per_user=5,
+            workers=1,
+            chunk_size=2,
+            stdout=out,
+        )
+
+        self.assertEqual(get_user_model().objects.count(), 3)
+        user = get_user_model().objects.first()
+        self.assertTrue(user.check_password("password123"))
+        recipes = Recipe.objects.filter(user=user)
+        for recipe in recipes:
+            self.assertFalse(recipe.tags.exclude(user=user).exists())
+            self.assertTrue(recipe.ingredients.exists())
+        self.assertEqual(
+            Recipe.objects.count(),
+            int(re.search(r"recipe_recipe: (\d+)", out.getvalue())[1]),
+        )
+        Tag.objects.create(user=user, name="Created after seeding")
+
+    @skipUnless(connection.vendor == "postgresql", "COPY is PostgreSQL only.")
+    def test_seed_with_concurrent_writes(self):
+        """
+        Test rows inserted while seeding get IDs outside the loaded ranges.
+        :return:
+        """
+        user = get_user_model().objects.create_user("user@example.com")
+        # Sequences are not rolled back with the tests that drew from them.
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Tag]):
+                cursor.execute(sql)
+        written = []
+        load = seed_data.load_chunk
+
+        def load_chunk(chunk):
+            written.append(Tag.objects.create(user=user, name="Meanwhile"))
+            return load(chunk)
+
+        with patch.object(seed_data, "load_chunk", load_chunk):
+            call_command(
+                "seed_data",
+                users=3,
+                recipes_per_user=5,
+                workers=1,
+                chunk_size=2,
+                stdout=StringIO(),
+            )
+
+        self.assertEqual(len(written), 2)
+        seeded = Tag.objects.exclude(name="Meanwhile")
+        self.assertGreater(
+            min(tag.id for tag in written),
+            max(seeded.values_list("id", flat=True)),
+        )
+        self.assertEqual(get_user_model().objects.count(), 4)
+
+
+class LoadtestCommandTests(TransactionTestCase):
+    """
+    Test the loadtest command.
+    """
+
+    def test_in_process(self):
+        """
+        Test a run through the test client reports every request.
+        :return:
+        """
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        output = os.path.join(tmp.name, "results.json")
+
+        with override_settings(MEDIA_ROOT=tmp.name):
+            call_command(
+                "loadtest",
+                requests=30,
+                concurrency=1,
+                users=1,
+                recipes=2,
+                read_ratio=0.5,
+                upload_ratio=0.5,
+                output=output,
+                max_error_rate=0,
+                stdout=StringIO(),
+            )
+
+        with open(output) as file:
+            results = json.load(file)
+        self.assertEqual(results["total"]["count"], 30)
+        self.assertEqual(results["total"]["error_rate"], 0)
+        self.assertEqual(
+            sum(op["count"] for op in results["operations"].values()), 30
+        )
+        self.assertEqual(get_user_model().objects.count(), 1)
+
+    def test_concurrent_workers(self):
+        """
+        Test workers share the request budget and keep to their own users.
+        :return:
+        """
+        performed = []
+        perform = loadtest.Command._perform
+
+        def record(command, name, rng, user):
+            performed.append(
+                (threading.get_ident(), user["credentials"]["email"])
+            )
+            return perform(command, name, rng, user)
+
+        stdout = StringIO()
+        with patch.object(loadtest.Command, "_perform", record):
+            call_command(
+                "loadtest",
+                requests=24,
+                concurrency=3,
+                users=4,
+                recipes=1,
+                read_ratio=1,
+                max_error_rate=0,
+                stdout=stdout,
+            )
+
+        self.assertEqual(len(performed), 24)
+        self.assertIn("total: n=24 ", stdout.getvalue())
+        workers = {}
+        for thread, email in performed:
+            self.assertEqual(workers.setdefault(email, thread), thread)
+
+    def test_failed_create_status(self):
+        """
+        Test a failed recipe creation reports the status it got.
+        :return:
+        """
+        command = loadtest.Command()
+        command.target = loadtest.ClientTarget()
+        self.addCleanup(command.target.close)
+        user = {"token": "invalid", "recipes": []}
+
+        status = command._perform("recipe-create", random.Random(0), user)
+
+        self.assertEqual(status, 401)
+
+    def test_users_per_worker(self):
+        """
+        Test workers are refused to share users.
+        :return:
+        """
+        with self.assertRaisesMessage(CommandError, "--users"):
+            call_command("loadtest", users=1, concurrency=2)
@@ -0,0 +1,193 @@
+"""
+Tests for background jobs.
+"""
+
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .. import jobs
+from ..models import Job
+
+calls = []
+
+
+@jobs.register("test.record")
+def record(value):
+    calls.append(value)
+
+
+@jobs.register("test.fail")
+def fail():
+    raise RuntimeError("Boom.")
+
+
+@jobs.register("test.outlast_lease")
+def outlast_lease():
+    time.sleep(0.9)
+    calls.extend(jobs.claim())
+
+
+@override_settings(JOB_RETRY_DELAY=10, JOB_TIMEOUT=60)
+class JobTests(TestCase):
+    """
+    Test queueing and running jobs.
+    """
+
+    def setUp(self):
+        calls.clear()
+
+    def test_claim_and_run(self):
+        """
+        Test a due job is claimed once and marked done after running.
+        :return:
+        """
+        job = jobs.enqueue("test.record", value=1)
+
+        claimed = jobs.claim()
+
+        self.assertEqual([job.pk], [claimed_job.pk for claimed_job in claimed])
+        self.assertEqual(jobs.claim(), [])
+        self.assertTrue(jobs.run(claimed[0]))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.DONE)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.duration)
+        self.assertEqual(calls, [1])
+
+    def test_delayed_job_not_claimed(self):
+        """
+        Test jobs are not claimed before they are due.
+        :return:
+        """
+        jobs.enqueue("test.record", delay=60, value=1)
+
+        self.assertEqual(jobs.claim(), [])
+
+    def test_failure_retried_with_backoff(self):
+        """
+        Test a failed job is queued again later until out of attempts.
+        :return:
+        """
+        job = jobs.enqueue("test.fail", max_attempts=2)
+
+        self.assertFalse(jobs.run(jobs.claim()[0]))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.QUEUED)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=4))
+        self.assertIn("Boom.", job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertFalse(jobs.run(jobs.claim()[0]))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_expired_lease_reclaimed(self):
+        """
+        Test a job left running by a dead worker is claimed again.
+        :return:
+        """
+        job = jobs.enqueue("test.record", max_attempts=2, value=1)
+        jobs.claim()
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+
+        claimed = jobs.claim()
+
+        self.assertEqual(claimed[0].attempts, 2)
+
+    def test_run_worker_burst(self):
+        """
+        Test the worker runs due jobs and reports timings.
+        :return:
+        """
+        jobs.enqueue("test.record", value=1)
+        jobs.enqueue("test.record", value=2)
+        out = StringIO()
+
+        call_command("run_worker", concurrency=1, burst=True, stdout=out)
+
+        self.assertEqual(sorted(calls), [1, 2])
+        self.assertFalse(Job.objects.exclude(status=Job.Status.DONE).exists())
+        self.assertIn("test.record: 2 run, 0 failed", out.getvalue())
+
+    @override_settings(JOB_POLL_INTERVAL=0)
+    def test_run_worker_survives_database_errors(self):
+        """
+        Test the worker logs database errors and keeps claiming jobs.
+        :return:
+        """
+        jobs.enqueue("test.record", value=1)
+        claim = jobs.claim
+        failures = [DatabaseError("Server closed the connection.")]
+
+        def flaky_claim():
+            if failures:
+                raise failures.pop()
+            return claim()
+
+        with patch.object(jobs, "claim", flaky_claim), self.assertLogs(
+            "core.management.commands.run_worker", "WARNING"
+        ) as logs:
+            call_command(
+                "run_worker", concurrency=1, burst=True, stdout=StringIO()
+            )
+
+        self.assertIn("Could not claim jobs.", logs.output[0])
+        self.assertEqual(calls, [1])
+
+    def test_run_worker_fails_when_thread_dies(self):
+        """
+        Test the worker stops with an error once one of its threads died.
+        :return:
+        """
+        with patch.object(
+            jobs, "claim", side_effect=RuntimeError("Boom.")
+        ), self.assertLogs("core.management.commands.run_worker", "ERROR"):
+            with self.assertRaisesMessage(CommandError, "unexpectedly"):
+                call_command("run_worker", concurrency=2, stdout=StringIO())
+
+    def test_prune_finished_jobs(self):
+        """
+        Test finished jobs past the retention period are deleted.
+        :return:
+        """
+        old = jobs.enqueue("test.record", value=1)
+        Job.objects.filter(pk=old.pk).update(
+            status=Job.Status.DONE,
+            finished=timezone.now() - timedelta(days=30),
+        )
+        jobs.enqueue("test.record", value=2)
+
+        self.assertEqual(jobs.prune(), 1)
+        self.assertEqual(Job.objects.count(), 1)
+
+
+@override_settings(JOB_TIMEOUT=0.3)
+class JobLeaseTests(TransactionTestCase):
+    """
+    Test leases of running jobs, renewed from another connection.
+    """
+
+    def setUp(self):
+        calls.clear()
+
+    def test_running_job_not_reclaimed(self):
+        """
+        Test a job running past JOB_TIMEOUT keeps its lease.
+        :return:
+        """
+        job = jobs.enqueue("test.outlast_lease")
+
+        self.assertTrue(jobs.run(jobs.claim()[0]))
+
+        self.assertEqual(calls, [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.DONE)
+        self.assertEqual(job.attempts, 1)
@@ -0,0 +1,147 @@
+"""
+Tests for the media serving view.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+CONTENT = b"0123456789" * 10
+DIGEST = hashlib.sha256(CONTENT).hexdigest()
+IMMUTABLE_PATH = f"uploads/recipe/{DIGEST[:2]}/{DIGEST[2:4]}/{DIGEST}.jpg"
+LEGACY_PATH = "uploads/recipe/legacy.jpg"
+
+
+def media_url(path):
+    """
+    Create and return the URL of a media file.
+    :param path:
+    :return:
+    """
+    return reverse("media", args=[path])
+
+
+class ServeMediaTests(TestCase):
+    """
+    Test serving media files.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, MEDIA_SENDFILE_BACKEND=""
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+        for path in (IMMUTABLE_PATH, LEGACY_PATH, "tmp/upload.jpg"):
+            full_path = os.path.join(self.media_root, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "wb") as file:
+                file.write(CONTENT)
+
+    def test_serve_immutable_file(self):
+        """
+        Test content-addressed files are cached for long with a hash ETag.
+        :return:
+        """
+        res = self.client.get(media_url(IMMUTABLE_PATH))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b"".join(res.streaming_content), CONTENT)
+        self.assertEqual(res["ETag"], f'"{DIGEST}"')
+        self.assertIn("immutable", res["Cache-Control"])
+        self.assertEqual(res["Content-Type"], "image/jpeg")
+
+    def test_serve_legacy_file(self):
+        """
+        Test other files get an mtime ETag and a short cache lifetime.
+        :return:
+        """
+        res = self.client.get(media_url(LEGACY_PATH))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn("immutable", res["Cache-Control"])
+        self.assertTrue(res["ETag"])
+
+    def test_if_none_match_not_modified(self):
+        """
+        Test a matching ETag returns 304 without a body.
+        :return:
+        """
+        res = self.client.get(
+            media_url(IMMUTABLE_PATH), HTTP_IF_NONE_MATCH=f'"{DIGEST}"'
+        )
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.content, b"")
+
+    def test_range_request(self):
+        """
+        Test a byte range is returned as partial content.
+        :return:
+        """
+        res = self.client.get(
+            media_url(IMMUTABLE_PATH), HTTP_RANGE="bytes=5-14"
+        )
+
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(b"".join(res.streaming_content), CONTENT[5:15])
+        self.assertEqual(res["Content-Range"], f"bytes 5-14/{len(CONTENT)}")
+
+    def test_suffix_range_request(self):
+        """
+        Test a suffix range returns the end of the file.
+        :return:
+        """
+        res = self.client.get(
+            media_url(IMMUTABLE_PATH), HTTP_RANGE="bytes=-3"
+        )
+
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(b"".join(res.streaming_content), CONTENT[-3:])
+
+    def test_unsatisfiable_range(self):
+        """
+        Test a range past the end of the file is rejected.
+        :return:
+        """
+        res = self.client.get(
+            media_url(IMMUTABLE_PATH), HTTP_RANGE="bytes=500-600"
+        )
+
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res["Content-Range"], f"bytes */{len(CONTENT)}")
+
+    @override_settings(
+        MEDIA_SENDFILE_BACKEND="nginx",
+        MEDIA_ACCEL_REDIRECT_PREFIX="/protected-media/",
+    )
+    def test_accel_redirect_offload(self):
+        """
+        Test files are handed to nginx when offloading is enabled.
+        :return:
+        """
+        res = self.client.get(media_url(IMMUTABLE_PATH))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.content, b"")
+        self.assertEqual(
+            res["X-Accel-Redirect"], f"/protected-media/{IMMUTABLE_PATH}"
+        )
+        self.assertEqual(res["ETag"], f'"{DIGEST}"')
+
+    def test_only_uploads_served(self):
+        """
+        Test files outside the uploads directory are not served.
+        :return:
+        """
+        for path in ("tmp/upload.jpg", "uploads/../tmp/upload.jpg"):
+            res = self.client.get(media_url(path))
+
+            self.assertEqual(res.status_code, 404)
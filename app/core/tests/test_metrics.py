@@ -0,0 +1,227 @@
+"""
+Tests for request metrics.
+"""
+
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from tag.models import Tag
+
+from .. import metrics
+from .utils import serve_async
+
+METRICS_URL = reverse("metrics")
+TAGS_URL = reverse("recipe:tag-list")
+ASYNC_TAGS_URL = reverse("recipe:async-tag-list")
+
+
+def sample(text, line):
+    """
+    Return the value of the metric `line` in exposition `text`.
+    :param text:
+    :param line:
+    :return:
+    """
+    for row in text.splitlines():
+        if row.startswith(f"{line} "):
+            return float(row.split()[-1])
+
+    raise AssertionError(f"{line} not in metrics")
+
+
+@override_settings(METRICS_TOKEN="secret")
+class MetricsMiddlewareTests(TestCase):
+    """
+    Test recording and serving request metrics.
+    """
+
+    def _metrics(self):
+        return self.client.get(
+            METRICS_URL, headers={"authorization": "Bearer secret"}
+        ).content.decode()
+
+    def setUp(self):
+        metrics.registry.clear()
+        self.addCleanup(metrics.registry.clear)
+        self.user = get_user_model().objects.create_user(
+            "user@example.com", "test_pass123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_records_per_route(self):
+        """
+        Test requests are recorded under their route name and method.
+        :return:
+        """
+        Tag.objects.create(user=self.user, name="Vegan")
+
+        self.client.get(TAGS_URL).getvalue()
+        res = self.client.get(TAGS_URL)
+        content = res.getvalue()
+        text = self._metrics()
+
+        labels = 'route="recipe:tag-list",method="GET"'
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sample(text, f"http_request_duration_seconds_count{{{labels}}}"),
+            2,
+        )
+        self.assertGreaterEqual(
+            sample(text, f"http_request_db_queries_sum{{{labels}}}"), 2
+        )
+        self.assertEqual(
+            sample(text, f"http_response_size_bytes_sum{{{labels}}}"),
+            2 * len(content),
+        )
+        self.assertEqual(
+            sample(
+                text,
+                f"http_request_serializer_seconds_count{{{labels}}}",
+            ),
+            2,
+        )
+
+    def test_unmatched_route(self):
+        """
+        Test unknown URLs share one label.
+        :return:
+        """
+        self.client.get("/nope/")
+
+        text = self._metrics()
+
+        self.assertIn('route="unmatched",method="GET"', text)
+
+    def test_token_required(self):
+        """
+        Test metrics need the bearer token once one is configured.
+        :return:
+        """
+        denied = self.client.get(METRICS_URL)
+        allowed = self.client.get(
+            METRICS_URL, headers={"authorization": "Bearer secret"}
+        )
+
+        self.assertEqual(denied.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(allowed.status_code, status.HTTP_200_OK)
+
+    @override_settings(METRICS_TOKEN="")
+    def test_hidden_without_token(self):
+        """
+        Test metrics are not served without a token, unless debugging.
+        :return:
+        """
+        hidden = self.client.get(METRICS_URL)
+        with override_settings(DEBUG=True):
+            shown = self.client.get(METRICS_URL)
+
+        self.assertEqual(hidden.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(shown.status_code, status.HTTP_200_OK)
+
+
+class MetricsAsgiTests(TransactionTestCase):
+    """
+    Test recording requests served over ASGI.
+    """
+
+    def setUp(self):
+        metrics.registry.clear()
+        self.addCleanup(metrics.registry.clear)
+        user = get_user_model().objects.create_user(
+            "user@example.com", "test_pass123"
+        )
+        Tag.objects.create(user=user, name="Vegan")
+        token = Token.objects.create(user=user)
+        self.headers = {"authorization": f"Token {token.key}"}
+
+    def test_queries_counted(self):
+        """
+        Test queries run in the executor thread are counted, for async
+        views and for sync views alike.
+        :return:
+        """
+        for url, route in (
+            (ASYNC_TAGS_URL, "recipe:async-tag-list"),
+            (TAGS_URL, "recipe:tag-list"),
+        ):
+            res = serve_async(url, headers=self.headers)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+            values = metrics.registry.snapshot()
+            for name in ("http_request_db_queries", "http_request_db_seconds"):
+                self.assertGreater(values[(name, route, "GET")][-1], 0)
+
+
+class MetricsAggregationTests(SimpleTestCase):
+    """
+    Test merging the metrics of several processes.
+    """
+
+    def setUp(self):
+        metrics.registry.clear()
+        self.addCleanup(metrics.registry.clear)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+        metrics.reset(self.directory)
+
+    def _process(self, pid, duration):
+        """
+        Write the metrics file of another process.
+        :param pid:
+        :param duration:
+        :return:
+        """
+        registry = metrics.Registry()
+        registry.observe(
+            "user:token", "POST", {"http_request_duration_seconds": duration}
+        )
+        metrics._write(
+            metrics._process_file(self.directory, pid), registry.snapshot()
+        )
+
+    def test_merges_live_and_exited_processes(self):
+        """
+        Test every process is counted, including exited ones.
+        :return:
+        """
+        self._process(1, 0.02)
+        self._process(2, 3)
+        metrics.mark_process_dead(self.directory, 1)
+
+        with override_settings(METRICS_DIR=self.directory):
+            metrics.registry.observe(
+                "user:token", "POST", {"http_request_duration_seconds": 0.2}
+            )
+            text = metrics.render(metrics.collect())
+
+        labels = 'route="user:token",method="POST"'
+        name = "http_request_duration_seconds"
+        self.assertEqual(sample(text, f"{name}_count{{{labels}}}"), 3)
+        self.assertAlmostEqual(sample(text, f"{name}_sum{{{labels}}}"), 3.22)
+        self.assertEqual(
+            sample(text, f'{name}_bucket{{{labels},le="0.025"}}'), 1
+        )
+        self.assertEqual(
+            sample(text, f'{name}_bucket{{{labels},le="0.25"}}'), 2
+        )
+        self.assertEqual(
+            sample(text, f'{name}_bucket{{{labels},le="+Inf"}}'), 3
+        )
+        self.assertFalse(
+            os.path.exists(metrics._process_file(self.directory, 1))
+        )
@@ -3,7 +3,9 @@ Tests for models.
 """
 
 from decimal import Decimal
+import hashlib
 
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
@@ -12,8 +14,6 @@ from tag.models import Tag
 from ingredient.models import Ingredient
 from recipe.models import Recipe
 
-from unittest.mock import patch
-
 
 def create_user(email="user@example.com", password="testpass123"):
     """
@@ -110,15 +110,17 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(ingredient), ingredient.name)
 
-    @patch("core.models.uuid.uuid4")
-    def test_recipe_file_name_uuid(self, mock_uuid):
+    def test_recipe_file_name_content_hash(self):
         """
-        Test generating an image path.
-        :param mock_uuid:
+        Test image paths are derived from the image content.
         :return:
         """
-        uuid = "test-uuid"
-        mock_uuid.return_value = uuid
-        file_path = recipe_image_file_path(None, "example.jpg")
-
-        self.assertEqual(file_path, f"uploads/recipe/{uuid}.jpg")
+        content = b"image content"
+        recipe = Recipe(image=SimpleUploadedFile("example.JPG", content))
+        file_path = recipe_image_file_path(recipe, "example.JPG")
+
+        digest = hashlib.sha256(content).hexdigest()
+        self.assertEqual(
+            file_path,
+            f"uploads/recipe/{digest[:2]}/{digest[2:4]}/{digest}.jpg",
+        )
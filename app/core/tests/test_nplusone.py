@@ -0,0 +1,196 @@
+"""
+Tests for N+1 query detection.
+"""
+
+import json
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .. import streaming
+from ..nplusone import NPlusOneError, NPlusOneTestMixin, fingerprint
+from recipe.models import Recipe
+from recipe.serializers import RecipeSerializer
+from recipe.views import RecipeViewSet
+from tag.models import Tag
+from .utils import serve_async
+
+RECIPES_URL = reverse("recipe:recipe-list")
+
+
+def unprefetched(self):
+    return Recipe.objects.filter(user=self.request.user)
+
+
+class FingerprintTests(SimpleTestCase):
+    """
+    Test query fingerprints.
+    """
+
+    def test_literals_collapsed(self):
+        """
+        Test statements differing in literals and IN lists match.
+        :return:
+        """
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE a = 'x' AND b IN (%s, %s)"),
+            fingerprint("SELECT *  FROM t\nWHERE a = 'y''s' AND b IN (%s)"),
+        )
+        self.assertEqual(
+            fingerprint("SELECT * FROM t LIMIT 21"),
+            "SELECT * FROM t LIMIT ?",
+        )
+
+    def test_shapes_kept(self):
+        """
+        Test statements on other columns differ.
+        :return:
+        """
+        self.assertNotEqual(
+            fingerprint("SELECT * FROM t WHERE a = %s"),
+            fingerprint("SELECT * FROM t WHERE b = %s"),
+        )
+
+
+class NPlusOneMiddlewareTests(NPlusOneTestMixin, TestCase):
+    """
+    Test flagging requests with repeated queries.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            "user@example.com", "test_pass123"
+        )
+        for title in ("Curry", "Soup", "Pie"):
+            recipe = Recipe.objects.create(
+                user=self.user, title=title, time_minutes=5, price="1.00"
+            )
+            recipe.tags.add(Tag.objects.create(user=self.user, name=title))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_prefetched_list(self):
+        """
+        Test the recipe list runs no query per recipe.
+        :return:
+        """
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(json.loads(res.getvalue())), 3)
+
+    @patch.object(streaming, "CHUNK_SIZE", 1)
+    def test_streamed_chunks_counted_apart(self):
+        """
+        Test the prefetches repeated for each chunk of a streamed list
+        pass.
+        :return:
+        """
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(json.loads(res.getvalue())), 3)
+
+    @patch.object(streaming, "CHUNK_SIZE", 2)
+    @patch.object(RecipeViewSet, "get_queryset", unprefetched)
+    def test_repeats_within_chunk_raise(self):
+        """
+        Test repeats within one chunk of a streamed list are flagged.
+        :return:
+        """
+        with self.assertRaisesMessage(NPlusOneError, "2 x SELECT"):
+            self.client.get(RECIPES_URL).getvalue()
+
+    @patch.object(RecipeViewSet, "get_queryset", unprefetched)
+    def test_raises_with_culprit(self):
+        """
+        Test a repeated query names the serializer field and view.
+        :return:
+        """
+        with self.assertRaisesMessage(
+            NPlusOneError, "RecipeSerializer.tags in RecipeViewSet.list"
+        ):
+            self.client.get(RECIPES_URL).getvalue()
+
+    @override_settings(NPLUSONE_DETECTION="log")
+    @patch.object(RecipeViewSet, "get_queryset", unprefetched)
+    def test_logs(self):
+        """
+        Test the log mode only warns.
+        :return:
+        """
+        with self.assertLogs("core.nplusone", "WARNING") as logs:
+            res = self.client.get(RECIPES_URL)
+            res.getvalue()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("3 x SELECT", logs.output[0])
+        self.assertIn("RecipeSerializer.ingredients", logs.output[0])
+
+    @override_settings(NPLUSONE_THRESHOLD=3)
+    @patch.object(RecipeViewSet, "get_queryset", unprefetched)
+    def test_threshold(self):
+        """
+        Test repeats up to the threshold pass.
+        :return:
+        """
+        res = self.client.get(RECIPES_URL)
+        res.getvalue()
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_assert_no_n_plus_one(self):
+        """
+        Test the assertion fails on code outside requests.
+        :return:
+        """
+        with self.assertRaisesMessage(AssertionError, "RecipeSerializer.tags"):
+            with self.assertNoNPlusOne():
+                RecipeSerializer(Recipe.objects.all(), many=True).data
+
+        with self.assertNoNPlusOne():
+            RecipeSerializer(
+                Recipe.objects.prefetch_related("tags", "ingredients"),
+                many=True,
+            ).data
+
+
+class NPlusOneAsgiTests(TransactionTestCase):
+    """
+    Test flagging requests served over ASGI, with their queries run in the
+    executor thread.
+    """
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            "user@example.com", "test_pass123"
+        )
+        for title in ("Curry", "Soup", "Pie"):
+            recipe = Recipe.objects.create(
+                user=user, title=title, time_minutes=5, price="1.00"
+            )
+            recipe.tags.add(Tag.objects.create(user=user, name=title))
+        token = Token.objects.create(user=user)
+        self.headers = {"authorization": f"Token {token.key}"}
+
+    @override_settings(NPLUSONE_DETECTION="log", NPLUSONE_THRESHOLD=1)
+    @patch.object(RecipeViewSet, "get_queryset", unprefetched)
+    def test_logs(self):
+        """
+        Test repeated queries of the executor thread are reported.
+        :return:
+        """
+        with self.assertLogs("core.nplusone", "WARNING") as logs:
+            res = serve_async(RECIPES_URL, headers=self.headers)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("3 x SELECT", logs.output[0])
+        self.assertIn("RecipeSerializer.tags", logs.output[0])
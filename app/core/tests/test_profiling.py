@@ -0,0 +1,100 @@
+"""
+Tests for request profiling.
+"""
+
+import marshal
+
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from tag.models import Tag
+
+TAGS_URL = reverse("recipe:tag-list")
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """
+    Test profiling requests on demand.
+    """
+
+    def setUp(self):
+        self.staff = get_user_model().objects.create_user(
+            "staff@example.com", "test_pass123", is_staff=True
+        )
+        self.user = get_user_model().objects.create_user(
+            "user@example.com", "test_pass123"
+        )
+        Tag.objects.create(user=self.staff, name="Vegan")
+
+    def _headers(self, user, **headers):
+        token = Token.objects.create(user=user)
+        return {"authorization": f"Token {token.key}", **headers}
+
+    def test_staff_gets_report(self):
+        """
+        Test a staff user gets the profile and queries of a request.
+        :return:
+        """
+        res = self.client.get(
+            TAGS_URL, headers=self._headers(self.staff, x_profile="json")
+        )
+
+        report = res.json()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(report["status"], status.HTTP_200_OK)
+        self.assertEqual(report["path"], TAGS_URL)
+        self.assertEqual(report["query_count"], len(report["queries"]))
+        self.assertTrue(
+            any("tag_tag" in query["sql"] for query in report["queries"])
+        )
+        self.assertIn("cumulative", report["profile"])
+
+    def test_request_finished_once(self):
+        """
+        Test a profiled streamed response does not finish the request early.
+        :return:
+        """
+        finished = []
+
+        def receiver(**kwargs):
+            finished.append(kwargs)
+
+        request_finished.connect(receiver)
+        self.addCleanup(request_finished.disconnect, receiver)
+
+        self.client.get(
+            TAGS_URL, headers=self._headers(self.staff, x_profile="json")
+        )
+
+        self.assertEqual(len(finished), 1)
+
+    def test_query_flag_and_raw_profile(self):
+        """
+        Test the query flag returns the raw profile.
+        :return:
+        """
+        res = self.client.get(
+            TAGS_URL, {"_profile": "prof"}, headers=self._headers(self.staff)
+        )
+
+        stats = marshal.loads(res.content)
+        self.assertEqual(res["Content-Type"], "application/octet-stream")
+        self.assertTrue(
+            any(name == "get_queryset" for _, _, name in stats)
+        )
+
+    def test_non_staff_not_profiled(self):
+        """
+        Test the flag is ignored for other users.
+        :return:
+        """
+        res = self.client.get(
+            TAGS_URL, headers=self._headers(self.user, x_profile="json")
+        )
+
+        self.assertEqual(res.getvalue(), b"[]")
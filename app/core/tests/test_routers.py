@@ -0,0 +1,173 @@
+"""
+Tests for read replica routing.
+"""
+
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from .. import routers
+from ..routers import ReplicaRouter, pin_to_primary, read_from_replica
+from recipe.models import Recipe
+
+RECIPE_URL = reverse("recipe:recipe-list")
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"])
+class ReplicaRouterTests(SimpleTestCase):
+    """
+    Test routing decisions.
+    """
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_reads_use_primary_by_default(self):
+        """
+        Test reads go to the primary outside `read_from_replica`.
+        :return:
+        """
+        self.assertIsNone(self.router.db_for_read(Recipe))
+
+    def test_reads_use_replica_in_block(self):
+        """
+        Test reads in a `read_from_replica` block go to a replica.
+        :return:
+        """
+        with read_from_replica():
+            self.assertEqual(self.router.db_for_read(Recipe), "replica_1")
+            self.assertEqual(self.router.db_for_write(Recipe), "default")
+
+        self.assertIsNone(self.router.db_for_read(Recipe))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        """
+        Test reads stay on the primary when no replica is configured.
+        :return:
+        """
+        with read_from_replica():
+            self.assertIsNone(self.router.db_for_read(Recipe))
+
+    def test_cache_reads_use_primary(self):
+        """
+        Test the database cache is read from the primary, where pins are
+        written.
+        :return:
+        """
+        model = DatabaseCache("test_pins", {}).cache_model_class
+
+        with read_from_replica():
+            self.assertEqual(self.router.db_for_read(model), "default")
+
+    def test_replicas_not_migrated(self):
+        """
+        Test migrations only run on the primary.
+        :return:
+        """
+        self.assertFalse(self.router.allow_migrate("replica_1", "core"))
+        self.assertIsNone(self.router.allow_migrate("default", "core"))
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"])
+class ReplicaReadMixinTests(TestCase):
+    """
+    Test API views route reads to replicas.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            "user@example.com", "test_pass123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.routed = []
+
+        def record_read(router, model, **hints):
+            # Record the routing decision but use the test database.
+            self.routed.append(routers._read_replica.get())
+
+        patcher = patch.object(ReplicaRouter, "db_for_read", record_read)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_safe_request_reads_replica(self):
+        """
+        Test listing recipes reads from the replica.
+        :return:
+        """
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn("replica_1", self.routed)
+
+    def test_write_pins_user_to_primary(self):
+        """
+        Test reads right after a write go to the primary.
+        :return:
+        """
+        payload = {
+            "title": "Sample recipe",
+            "time_minutes": 5,
+            "price": Decimal("2.50"),
+        }
+        res = self.client.post(RECIPE_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.routed.clear()
+
+        self.client.get(RECIPE_URL)
+
+        self.assertTrue(self.routed)
+        self.assertNotIn("replica_1", self.routed)
+
+    @override_settings(DB_READ_YOUR_WRITES_WINDOW=0)
+    def test_pinning_disabled(self):
+        """
+        Test a zero window never pins users.
+        :return:
+        """
+        self.client.patch(reverse("user:me"), {"name": "New name"})
+        self.routed.clear()
+
+        self.client.get(reverse("user:me"))
+        self.client.get(RECIPE_URL)
+
+        self.assertIn("replica_1", self.routed)
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "test_pins",
+        }
+    }
+)
+class DatabaseCachePinTests(ReplicaReadMixinTests):
+    """
+    Test pinning with the database cache shared by all processes.
+    """
+
+    def setUp(self):
+        call_command("createcachetable", verbosity=0)
+        super().setUp()
+
+    def test_pin_seen_by_other_processes(self):
+        """
+        Test a pin is visible to a cache with no state of this process.
+        :return:
+        """
+        pin_to_primary(self.user)
+
+        other_process = DatabaseCache("test_pins", {})
+        self.assertTrue(other_process.get(routers._pin_key(self.user)))
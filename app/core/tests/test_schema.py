@@ -0,0 +1,114 @@
+"""
+Tests for the precomputed OpenAPI schema.
+"""
+
+import json
+import tempfile
+from pathlib import Path
+
+import yaml
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+
+from .. import schema
+
+SCHEMA_URL = reverse("api-schema")
+DOCS_URL = reverse("api-docs")
+
+
+class SchemaDriftTests(SimpleTestCase):
+    """
+    Test the committed schema file.
+    """
+
+    def test_schema_file_up_to_date(self):
+        """
+        Test the schema file matches the live schema.
+        :return:
+        """
+        self.assertFalse(
+            schema.is_stale(),
+            "The OpenAPI schema is out of date, "
+            "run `python manage.py build_schema`.",
+        )
+
+
+class SchemaViewTests(SimpleTestCase):
+    """
+    Test serving the schema from memory.
+    """
+
+    def setUp(self):
+        schema.clear_cache()
+        self.addCleanup(schema.clear_cache)
+
+    def test_serves_yaml_by_default(self):
+        """
+        Test the schema is served as YAML with an ETag.
+        :return:
+        """
+        res = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res["Content-Type"].startswith("application/vnd.oai"))
+        self.assertIn("ETag", res)
+        paths = yaml.safe_load(res.content)["paths"]
+        self.assertIn("/api/recipe/recipes/", paths)
+
+    def test_serves_json(self):
+        """
+        Test JSON is served when asked for.
+        :return:
+        """
+        by_format = self.client.get(SCHEMA_URL, {"format": "json"})
+        by_accept = self.client.get(
+            SCHEMA_URL, headers={"accept": "application/json"}
+        )
+        default = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(by_format.content, by_accept.content)
+        self.assertEqual(
+            json.loads(by_format.content), yaml.safe_load(default.content)
+        )
+        self.assertNotEqual(by_format["ETag"], default["ETag"])
+
+    def test_not_modified(self):
+        """
+        Test a matching If-None-Match gets an empty 304.
+        :return:
+        """
+        etag = self.client.get(SCHEMA_URL)["ETag"]
+
+        res = self.client.get(SCHEMA_URL, headers={"if-none-match": etag})
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b"")
+
+    def test_served_from_memory(self):
+        """
+        Test the file is read once and not regenerated.
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "schema.yml"
+            path.write_text("openapi: 3.0.3\npaths: {}\n")
+
+            with override_settings(OPENAPI_SCHEMA_FILE=path):
+                first = self.client.get(SCHEMA_URL)
+                path.unlink()
+                second = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(yaml.safe_load(second.content)["paths"], {})
+
+    def test_docs_use_cached_schema(self):
+        """
+        Test the docs page loads the schema from the cached view.
+        :return:
+        """
+        res = self.client.get(DOCS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(SCHEMA_URL, res.content.decode())
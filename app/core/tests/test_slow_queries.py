@@ -0,0 +1,177 @@
+"""
+Tests for the slow-query log.
+"""
+
+import unittest
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .. import jobs
+from ..models import Job, SlowQuery
+from ..slow_queries import EXPLAIN_JOB, explain, explain_slow_query
+from .utils import serve_async
+
+TAGS_URL = reverse("recipe:tag-list")
+ASYNC_TAGS_URL = reverse("recipe:async-tag-list")
+
+
+@override_settings(SLOW_QUERY_THRESHOLD=1e-9, SLOW_QUERY_EXPLAIN_RATE=0)
+class SlowQueryMiddlewareTests(TestCase):
+    """
+    Test logging slow queries of requests.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            "user@example.com", "test_pass123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_slow_queries_logged(self):
+        """
+        Test statements over the threshold are stored with their request.
+        :return:
+        """
+        with self.assertLogs("core.slow_queries", "WARNING"):
+            self.client.get(TAGS_URL).getvalue()
+
+        entry = SlowQuery.objects.filter(sql__contains="tag_tag").get()
+        self.assertEqual(entry.route, "recipe:tag-list")
+        self.assertEqual(entry.method, "GET")
+        self.assertEqual(entry.user_id, self.user.id)
+        self.assertEqual(entry.database, "default")
+        self.assertEqual(entry.plan, "")
+
+    @override_settings(SLOW_QUERY_LOG_SIZE=2)
+    def test_only_latest_kept(self):
+        """
+        Test the log keeps the latest SLOW_QUERY_LOG_SIZE entries.
+        :return:
+        """
+        with self.assertLogs("core.slow_queries", "WARNING"):
+            for _ in range(3):
+                self.client.get(TAGS_URL).getvalue()
+
+        self.assertEqual(SlowQuery.objects.count(), 2)
+
+    @override_settings(SLOW_QUERY_THRESHOLD=0)
+    def test_disabled(self):
+        """
+        Test a threshold of 0 disables the log.
+        :return:
+        """
+        self.client.get(TAGS_URL).getvalue()
+
+        self.assertFalse(SlowQuery.objects.exists())
+
+    def test_params_not_stored(self):
+        """
+        Test parameters are only stored when asked for.
+        :return:
+        """
+        with self.assertLogs("core.slow_queries", "WARNING"):
+            self.client.get(TAGS_URL).getvalue()
+        with self.settings(SLOW_QUERY_LOG_PARAMS=True):
+            with self.assertLogs("core.slow_queries", "WARNING"):
+                self.client.get(TAGS_URL).getvalue()
+
+        first, second = SlowQuery.objects.filter(
+            sql__contains="tag_tag"
+        ).order_by("id")
+        self.assertEqual(first.params, [])
+        self.assertEqual(second.params, [self.user.id])
+
+    @override_settings(SLOW_QUERY_EXPLAIN_RATE=1)
+    def test_plan_captured_by_job(self):
+        """
+        Test plans are captured by a job rather than during the request.
+        :return:
+        """
+        with self.assertLogs("core.slow_queries", "WARNING"):
+            self.client.get(TAGS_URL).getvalue()
+
+        entry = SlowQuery.objects.filter(sql__contains="tag_tag").get()
+        self.assertEqual(entry.plan, "")
+        job = Job.objects.get(
+            name=EXPLAIN_JOB, payload__slow_query_id=entry.pk
+        )
+        self.assertEqual(job.payload["placeholders"], 1)
+
+        self.assertTrue(jobs.run(job))
+
+        entry.refresh_from_db()
+        if connection.vendor == "postgresql":
+            self.assertIn("$1", entry.plan)
+        else:
+            self.assertEqual(entry.plan, "")
+
+    @unittest.skipUnless(
+        connection.vendor == "postgresql", "EXPLAIN is PostgreSQL specific."
+    )
+    def test_explain(self):
+        """
+        Test plans are captured for SELECTs only, and only analyzed with
+        parameters.
+        :return:
+        """
+        sql = "SELECT * FROM tag_tag WHERE id = %s AND name LIKE '%%a'"
+
+        self.assertIn("Buffers", explain("default", sql, [1]))
+        generic = explain("default", sql, placeholders=1)
+        self.assertIn("$1", generic)
+        self.assertNotIn("actual time", generic)
+        self.assertEqual(explain("default", "DELETE FROM tag_tag", []), "")
+
+    @unittest.skipUnless(
+        connection.vendor == "postgresql", "EXPLAIN is PostgreSQL specific."
+    )
+    def test_locking_select_not_analyzed(self):
+        """
+        Test SELECT ... FOR UPDATE only gets a generic plan.
+        :return:
+        """
+        entry = SlowQuery.objects.create(
+            duration=1,
+            database="default",
+            sql="SELECT * FROM tag_tag WHERE id = %s FOR UPDATE",
+            params=[1],
+        )
+
+        explain_slow_query(entry.pk, placeholders=1)
+
+        entry.refresh_from_db()
+        self.assertIn("$1", entry.plan)
+        self.assertNotIn("actual time", entry.plan)
+
+@override_settings(SLOW_QUERY_THRESHOLD=1e-9, SLOW_QUERY_EXPLAIN_RATE=0)
+class SlowQueryAsgiTests(TransactionTestCase):
+    """
+    Test logging slow queries of requests served over ASGI.
+    """
+
+    def test_slow_queries_logged(self):
+        """
+        Test statements run in the executor thread are logged.
+        :return:
+        """
+        user = get_user_model().objects.create_user(
+            "user@example.com", "test_pass123"
+        )
+        token = Token.objects.create(user=user)
+
+        with self.assertLogs("core.slow_queries", "WARNING"):
+            serve_async(
+                ASYNC_TAGS_URL,
+                headers={"authorization": f"Token {token.key}"},
+            )
+
+        entry = SlowQuery.objects.filter(sql__contains="tag_tag").get()
+        self.assertEqual(entry.route, "recipe:async-tag-list")
+        self.assertEqual(entry.user_id, user.id)
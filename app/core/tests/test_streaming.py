@@ -0,0 +1,118 @@
+"""
+Tests for streaming JSON list responses.
+"""
+
+import json
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .. import streaming
+from recipe.serializers import TagSerializer
+from recipe.views import TagViewSet
+from tag.models import Tag
+
+TAGS_URL = reverse("recipe:tag-list")
+
+
+class StreamingListTests(TestCase):
+    """
+    Test list actions streamed as JSON.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            "user@example.com", "test_pass123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_same_bytes_as_response(self):
+        """
+        Test the streamed list is the JSON a `Response` would render.
+        :return:
+        """
+        for name in ("Vegan", "Dessert", 'Quote "and" ünicode'):
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertTrue(res.streaming)
+        self.assertEqual(res["Content-Type"], "application/json")
+        expected = TagSerializer(
+            Tag.objects.order_by("-name"), many=True
+        ).data
+        self.assertEqual(res.getvalue(), JSONRenderer().render(expected))
+
+    @patch.object(streaming, "CHUNK_SIZE", 2)
+    def test_several_chunks(self):
+        """
+        Test lists longer than a chunk keep all items in order.
+        :return:
+        """
+        names = [f"Tag {i}" for i in range(5)]
+        for name in names:
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_URL)
+
+        data = json.loads(res.getvalue())
+        self.assertEqual([tag["name"] for tag in data], names[::-1])
+
+    def test_empty_list(self):
+        """
+        Test an empty list streams as an empty JSON array.
+        :return:
+        """
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.getvalue(), b"[]")
+
+    def test_other_renderers_not_streamed(self):
+        """
+        Test the browsable API and indented JSON get a normal response.
+        :return:
+        """
+        Tag.objects.create(user=self.user, name="Vegan")
+
+        res = self.client.get(TAGS_URL, {"format": "api"})
+        self.assertFalse(res.streaming)
+
+        res = self.client.get(
+            TAGS_URL, HTTP_ACCEPT="application/json; indent=2"
+        )
+        self.assertFalse(res.streaming)
+        self.assertIn(b'\n  {\n    "id"', res.content)
+
+    @patch.object(streaming, "CHUNK_SIZE", 1)
+    async def test_chunks_sent_one_at_a_time_under_asgi(self):
+        """
+        Test an ASGI request gets each chunk serialized as it is sent.
+        :return:
+        """
+        for name in ("Vegan", "Quick", "Dessert"):
+            await Tag.objects.acreate(user=self.user, name=name)
+        token = await Token.objects.acreate(user=self.user)
+
+        with patch.object(
+            TagViewSet,
+            "get_serializer",
+            autospec=True,
+            side_effect=TagViewSet.get_serializer,
+        ) as get_serializer:
+            res = await self.async_client.get(
+                TAGS_URL, headers={"authorization": f"Token {token.key}"}
+            )
+            sent = [
+                get_serializer.call_count
+                async for _ in res.streaming_content
+            ]
+
+        self.assertTrue(res.is_async)
+        self.assertEqual(sent, [0, 1, 2, 3, 3])
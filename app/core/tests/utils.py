@@ -0,0 +1,42 @@
+"""
+Helpers shared by tests.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.test import AsyncClient
+
+
+def serve_async(path, **extra):
+    """
+    GET `path` through the ASGI handler on an event loop of its own thread,
+    as an ASGI server would. Sync code of the request then runs in the
+    executor thread of `sync_to_async`, with its own connections, instead
+    of the test's thread. Tests using it must commit their data.
+    :param path:
+    :param extra: passed to `AsyncClient.get`
+    :return: the response, with streamed content already consumed
+    """
+
+    async def get():
+        try:
+            response = await AsyncClient().get(path, **extra)
+            if response.streaming:
+                # Send the content, as the server does after the handler.
+                content = b"".join([chunk async for chunk in response])
+                response.streaming_content = [content]
+            return response
+        finally:
+            await sync_to_async(connections.close_all)()
+
+    def run():
+        try:
+            return asyncio.run(get())
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(1) as pool:
+        return pool.submit(run).result()
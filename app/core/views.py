@@ -0,0 +1,252 @@
+"""
+Views for serving media files, the API schema and metrics.
+"""
+
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    StreamingHttpResponse,
+)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.encoding import iri_to_uri
+from django.utils.http import http_date
+from django.utils.module_loading import import_string
+from django.views.decorators.http import require_safe
+
+from . import metrics as request_metrics
+from .schema import get_cached_schema
+
+# Files named after a SHA-256 of their content never change.
+IMMUTABLE_NAME = re.compile(r"(?:^|/)(?P<digest>[0-9a-f]{64})(?:_\d+)?\.\w+$")
+RANGE_HEADER = re.compile(r"^bytes=(?P<start>\d*)-(?P<end>\d*)$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+CHUNK_SIZE = 64 * 2**10
+
+
+def _parse_range(header, size):
+    """
+    Parse a single-range `Range` header against a file of `size` bytes.
+    "bytes=0-99" -> (0, 99)
+    :param header:
+    :param size:
+    :return: (start, end) inclusive, None to send the whole file, or
+        False if the range cannot be satisfied
+    """
+    match = RANGE_HEADER.match(header.strip())
+    if not match or not (match["start"] or match["end"]):
+        # Malformed or multiple ranges, which may be ignored.
+        return None
+
+    if match["start"]:
+        start = int(match["start"])
+        end = int(match["end"]) if match["end"] else size - 1
+    else:
+        start = max(size - int(match["end"]), 0)
+        end = size - 1
+
+    if start > end or start >= size:
+        return False
+
+    return start, min(end, size - 1)
+
+
+def _read_range(path, start, length):
+    """
+    Yield `length` bytes of the file at `path` starting at `start`.
+    :param path:
+    :param start:
+    :param length:
+    :return:
+    """
+    with open(path, "rb") as file:
+        file.seek(start)
+
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve an uploaded file from MEDIA_ROOT.
+
+    Content-addressed files get their hash as ETag and are cached for a
+    year, other files use their mtime and size. With
+    MEDIA_SENDFILE_BACKEND set the bytes are left to the front-end server
+    via X-Accel-Redirect or X-Sendfile.
+    :param request:
+    :param path:
+    :return:
+    """
+    path = posixpath.normpath(path).lstrip("/")
+
+    if not path.startswith("uploads/") or "/." in f"/{path}":
+        raise Http404
+
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        file_stat = os.stat(full_path)
+    except (SuspiciousFileOperation, FileNotFoundError, NotADirectoryError):
+        raise Http404
+
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404
+
+    immutable = IMMUTABLE_NAME.search(path)
+    if immutable:
+        etag = f'"{immutable["digest"]}"'
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        etag = f'"{file_stat.st_mtime_ns:x}-{file_stat.st_size:x}"'
+        cache_control = f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}"
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(file_stat.st_mtime),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(file_stat.st_mtime)
+    )
+    if response is not None:
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    content_type = mimetypes.guess_type(full_path)[0]
+    content_type = content_type or "application/octet-stream"
+    backend = settings.MEDIA_SENDFILE_BACKEND
+
+    if backend == "nginx":
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = iri_to_uri(
+            settings.MEDIA_ACCEL_REDIRECT_PREFIX + path
+        )
+    elif backend == "xsendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = full_path
+    else:
+        byte_range = None
+        if_range = request.headers.get("If-Range")
+        if "Range" in request.headers and if_range in (None, etag):
+            byte_range = _parse_range(
+                request.headers["Range"], file_stat.st_size
+            )
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{file_stat.st_size}"
+            return response
+
+        if byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                _read_range(full_path, start, length),
+                status=206,
+                content_type=content_type,
+            )
+            response["Content-Length"] = str(length)
+            response["Content-Range"] = (
+                f"bytes {start}-{end}/{file_stat.st_size}"
+            )
+        else:
+            response = FileResponse(
+                open(full_path, "rb"), content_type=content_type
+            )
+
+    for header, value in headers.items():
+        response[header] = value
+
+    return response
+
+
+def lazy_view(view_path, **initkwargs):
+    """
+    Return a view that imports the class-based view `view_path` when it is
+    first requested, keeping its imports out of startup.
+    :param view_path: dotted path of the view class
+    :param initkwargs: passed to `as_view`
+    :return:
+    """
+    view = None
+
+    def wrapper(request, *args, **kwargs):
+        nonlocal view
+
+        if view is None:
+            view = import_string(view_path).as_view(**initkwargs)
+
+        return view(request, *args, **kwargs)
+
+    # Only safe methods are routed here, which CSRF checks skip anyway.
+    wrapper.csrf_exempt = True
+
+    return wrapper
+
+
+@require_safe
+def openapi_schema(request):
+    """
+    Serve the precomputed OpenAPI schema from memory.
+
+    Renders YAML by default and JSON for `?format=json` or a JSON `Accept`
+    header, like `SpectacularAPIView`.
+    :param request:
+    :return:
+    """
+    schema = get_cached_schema()
+    wanted = request.GET.get("format") or request.headers.get("Accept", "")
+    rendered = schema.json if "json" in wanted else schema.yaml
+
+    response = get_conditional_response(request, etag=rendered.etag)
+    if response is None:
+        response = HttpResponse(
+            rendered.content, content_type=rendered.content_type
+        )
+        response["Content-Length"] = str(len(rendered.content))
+
+    response["ETag"] = rendered.etag
+    # Clients may keep the schema but must revalidate it with the ETag.
+    response["Cache-Control"] = "public, no-cache"
+    response["Vary"] = "Accept"
+
+    return response
+
+
+@require_safe
+def metrics(request):
+    """
+    Serve the request metrics of all processes for Prometheus, to requests
+    bearing METRICS_TOKEN, or to anyone with DEBUG on and no token set.
+    :param request:
+    :return:
+    """
+    token = settings.METRICS_TOKEN
+    if not token and not settings.DEBUG:
+        return HttpResponse(status=404)
+    if token and not constant_time_compare(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    ):
+        return HttpResponse(status=401, headers={"WWW-Authenticate": "Bearer"})
+
+    return HttpResponse(
+        request_metrics.render(request_metrics.collect()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -0,0 +1,73 @@
+"""
+Gunicorn configuration for serving the app in production.
+
+Every setting can be overridden with a GUNICORN_* environment variable.
+Send SIGHUP to the master process to reload workers gracefully.
+"""
+
+import os
+
+from core import metrics
+from core.serving import recommended_threads, recommended_workers
+
+wsgi_app = "app.wsgi:application"
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+
+# Empty values, as the deploy compose file passes when unset, mean the
+# recommended counts.
+workers = int(os.environ.get("GUNICORN_WORKERS") or recommended_workers())
+threads = int(os.environ.get("GUNICORN_THREADS") or recommended_threads())
+worker_class = "gthread" if threads > 1 else "sync"
+
+# GUNICORN_ASGI=1 serves app/asgi.py instead, with one event loop per
+# worker multiplexing the async views. Sync views then run in the worker's
+# sync_to_async thread pool, paying a thread handoff per request, and
+# CONN_MAX_AGE is forced to 0 (see settings.py), so every request opens its
+# own database connection unless DB_POOL_MAX_SIZE pools them. Keep
+# sync-heavy traffic on WSGI workers.
+if bool(int(os.environ.get("GUNICORN_ASGI", 0))):
+    wsgi_app = "app.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+
+# Recycle workers after a jittered number of requests to bound memory
+# growth without restarting them all at once.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+# Keep-alive should outlast the idle timeout of the proxy in front.
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+
+# Heartbeat files on tmpfs so a slow disk never gets workers killed.
+worker_tmp_dir = os.environ.get("GUNICORN_WORKER_TMP_DIR", "/dev/shm")
+# Loading the app before forking shares its memory between workers. It
+# opens no database connection, so none is shared across processes.
+preload_app = bool(int(os.environ.get("GUNICORN_PRELOAD", 1)))
+
+# Workers write their request metrics to files under METRICS_DIR, which
+# /metrics merges. Files of exited workers are folded into an archive so
+# their counts survive worker recycling.
+metrics_dir = os.environ.setdefault(
+    "METRICS_DIR", os.path.join(worker_tmp_dir, "app-metrics")
+)
+
+
+def on_starting(server):
+    metrics.reset(metrics_dir)
+
+
+def child_exit(server, worker):
+    metrics.mark_process_dead(metrics_dir, worker.pid)
+
+
+def worker_exit(server, worker):
+    # Run in the worker, which has loaded the app by then.
+    from core.authentication import flush_token_usage
+
+    flush_token_usage()
+
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+errorlog = os.environ.get("GUNICORN_ERROR_LOG", "-")
+
@@ -0,0 +1,182 @@
+"""
+Async read-only views for the recipe APIs.
+
+These serve the same data as the list and retrieve actions of the recipe,
+tag and ingredient viewsets, but as native async views using the async ORM,
+so under ASGI a worker keeps serving other requests while one waits on the
+database.
+"""
+
+from contextlib import ExitStack
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.http import require_safe
+
+from rest_framework import exceptions
+from rest_framework.utils.encoders import JSONEncoder
+
+from core import nplusone
+from core.authentication import ExpiringTokenAuthentication
+from core.routers import is_pinned_to_primary, read_from_replica
+from core.streaming import CHUNK_SIZE
+from ingredient.models import Ingredient
+from tag.models import Tag
+from . import serializers
+from .models import Recipe
+from .views import filter_recipe_attrs, filter_recipes
+
+
+def _json(data, status=200, headers=None):
+    return JsonResponse(
+        data, encoder=JSONEncoder, safe=False, status=status, headers=headers
+    )
+
+
+def _error(exc):
+    """
+    Render a REST framework exception like its views do.
+    :param exc:
+    :return:
+    """
+    headers = None
+    if exc.status_code == 401:
+        headers = {"WWW-Authenticate": ExpiringTokenAuthentication.keyword}
+
+    return _json(
+        {"detail": exc.detail}, status=exc.status_code, headers=headers
+    )
+
+
+def async_api_view(view):
+    """
+    Authenticate a safe request by token and run `view` on a replica.
+    :param view:
+    :return:
+    """
+
+    @require_safe
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            credentials = await ExpiringTokenAuthentication().aauthenticate(
+                request
+            )
+        except exceptions.AuthenticationFailed as exc:
+            return _error(exc)
+
+        if credentials is None:
+            return _error(exceptions.NotAuthenticated())
+
+        request.user, request.auth = credentials
+
+        if await sync_to_async(is_pinned_to_primary)(request.user):
+            return await view(request, *args, **kwargs)
+
+        with read_from_replica():
+            return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+async def _serialize_list(queryset, serializer_class, request):
+    """
+    Serialize every object of `queryset`, fetched in chunks.
+    :param queryset:
+    :param serializer_class:
+    :param request:
+    :return:
+    """
+    objects = []
+
+    with ExitStack() as chunk:
+        # Each chunk runs the same prefetches, which are no N+1.
+        chunk.enter_context(nplusone.batch())
+        async for obj in queryset.aiterator(chunk_size=CHUNK_SIZE):
+            objects.append(obj)
+            if len(objects) % CHUNK_SIZE == 0:
+                chunk.close()
+                chunk.enter_context(nplusone.batch())
+
+    return serializer_class(
+        objects, many=True, context={"request": request}
+    ).data
+
+
+@async_api_view
+async def recipe_list(request):
+    """
+    List the user's recipes, filtered like `RecipeViewSet.list`.
+    :param request:
+    :return:
+    """
+    queryset = filter_recipes(
+        Recipe.objects.all(), request.user, request.GET
+    ).prefetch_related("tags", "ingredients")
+
+    return _json(
+        await _serialize_list(
+            queryset, serializers.RecipeSerializer, request
+        )
+    )
+
+
+@async_api_view
+async def recipe_detail(request, pk):
+    """
+    Retrieve one of the user's recipes.
+    :param request:
+    :param pk:
+    :return:
+    """
+    recipe = (
+        await Recipe.objects.filter(user=request.user, pk=pk)
+        .prefetch_related("tags", "ingredients")
+        .afirst()
+    )
+
+    if recipe is None:
+        return _error(
+            exceptions.NotFound("No Recipe matches the given query.")
+        )
+
+    serializer = serializers.RecipeDetailSerializer(
+        recipe, context={"request": request}
+    )
+
+    return _json(serializer.data)
+
+
+@async_api_view
+async def tag_list(request):
+    """
+    List the user's tags, filtered like `TagViewSet.list`.
+    :param request:
+    :return:
+    """
+    queryset = filter_recipe_attrs(
+        Tag.objects.all(), request.user, request.GET
+    )
+
+    return _json(
+        await _serialize_list(queryset, serializers.TagSerializer, request)
+    )
+
+
+@async_api_view
+async def ingredient_list(request):
+    """
+    List the user's ingredients, filtered like `IngredientViewSet.list`.
+    :param request:
+    :return:
+    """
+    queryset = filter_recipe_attrs(
+        Ingredient.objects.all(), request.user, request.GET
+    )
+
+    return _json(
+        await _serialize_list(
+            queryset, serializers.IngredientSerializer, request
+        )
+    )
@@ -0,0 +1,545 @@
+"""
+Image processing for recipe images.
+
+Pillow is imported inside the functions that use it, so processes that
+never handle an image do not pay for loading it.
+"""
+
+import hashlib
+import logging
+import math
+import os
+import tempfile
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions
+
+from .uploadhandlers import ImageUploadFile, UploadTooLarge, upload_temp_dir
+
+logger = logging.getLogger(__name__)
+
+FORMAT_EXTENSIONS = {
+    "JPEG": "jpg",
+    "PNG": "png",
+    "WEBP": "webp",
+}
+
+BASE83_CHARACTERS = (
+    "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+    "#$%*+,-.:;=?@[]^_{|}~"
+)
+
+# Size the image is reduced to before computing colour and placeholder.
+SAMPLE_SIZE = 32
+
+# Formats re-encoded at ingest, others are stored as uploaded.
+INGEST_FORMATS = ("JPEG", "PNG", "WEBP")
+METADATA_KEYS = ("exif", "xmp", "XML:com.adobe.xmp", "comment", "photoshop")
+
+DERIVATIVES_JOB = "recipe.derivatives"
+
+
+def derivative_name(name, size, image_format):
+    """
+    Return the storage name of a resized copy of the image `name`.
+    "uploads/recipe/x.jpg" -> "uploads/derivatives/recipe/x_128.webp"
+    :param name:
+    :param size:
+    :param image_format:
+    :return:
+    """
+    stem = os.path.splitext(os.path.relpath(name, "uploads"))[0]
+    ext = FORMAT_EXTENSIONS[image_format]
+
+    return os.path.join("uploads", "derivatives", f"{stem}_{size}.{ext}")
+
+
+def derivative_source_stem(name):
+    """
+    Return the name, without extension, of the image a derivative is of.
+    "uploads/derivatives/recipe/x_128.webp" -> "uploads/recipe/x"
+    :param name:
+    :return:
+    """
+    stem = os.path.splitext(os.path.relpath(name, "uploads/derivatives"))[0]
+
+    return os.path.join("uploads", stem.rpartition("_")[0])
+
+
+def derivative_specs():
+    """
+    Return the configured (size, format) pairs.
+    :return:
+    """
+    return [
+        (size, image_format)
+        for size in settings.RECIPE_IMAGE_DERIVATIVE_SIZES
+        for image_format in settings.RECIPE_IMAGE_DERIVATIVE_FORMATS
+    ]
+
+
+def derivative_names(name):
+    """
+    Return every configured derivative name of the image `name`.
+    :param name:
+    :return:
+    """
+    return [
+        derivative_name(name, size, image_format)
+        for size, image_format in derivative_specs()
+    ]
+
+
+def delete_derivatives(storage, name):
+    """
+    Delete the derivatives of the image `name` from `storage`.
+    :param storage:
+    :param name:
+    :return:
+    """
+    if not name:
+        return
+
+    for derivative in derivative_names(name):
+        storage.delete(derivative)
+
+
+def _encode_base83(value, length):
+    """
+    Encode an integer as `length` base 83 characters.
+    :param value:
+    :param length:
+    :return:
+    """
+    return "".join(
+        BASE83_CHARACTERS[value // 83 ** (length - i) % 83]
+        for i in range(1, length + 1)
+    )
+
+
+def _srgb_to_linear(value):
+    """
+    Convert an 8-bit sRGB channel to linear light.
+    """
+    v = value / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value):
+    """
+    Convert a linear light value to an 8-bit sRGB channel.
+    """
+    v = min(max(value, 0.0), 1.0)
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _quantise_ac(value, max_value):
+    """
+    Quantise a BlurHash AC component to 0..18.
+    """
+    scaled = math.copysign(abs(value / max_value) ** 0.5, value)
+    return max(0, min(18, int(scaled * 9 + 9.5)))
+
+
+def blurhash(image, components_x=4, components_y=3):
+    """
+    Encode a small RGB image as a BlurHash placeholder string.
+    See https://github.com/woltapp/blurhash for the format.
+    :param image: RGB image, ideally no more than 32 pixels a side
+    :param components_x:
+    :param components_y:
+    :return:
+    """
+    width, height = image.size
+    pixels = [
+        tuple(_srgb_to_linear(channel) for channel in pixel)
+        for pixel in image.getdata()
+    ]
+    cos_x = [
+        [math.cos(math.pi * i * x / width) for x in range(width)]
+        for i in range(components_x)
+    ]
+    cos_y = [
+        [math.cos(math.pi * j * y / height) for y in range(height)]
+        for j in range(components_y)
+    ]
+
+    factors = []
+    for j in range(components_y):
+        for i in range(components_x):
+            normalisation = 1 if i == 0 and j == 0 else 2
+            total = [0.0, 0.0, 0.0]
+            for y in range(height):
+                row = y * width
+                for x in range(width):
+                    basis = cos_x[i][x] * cos_y[j][y]
+                    pixel = pixels[row + x]
+                    total[0] += basis * pixel[0]
+                    total[1] += basis * pixel[1]
+                    total[2] += basis * pixel[2]
+            scale = normalisation / (width * height)
+            factors.append([channel * scale for channel in total])
+
+    dc, ac = factors[0], factors[1:]
+    result = _encode_base83((components_x - 1) + (components_y - 1) * 9, 1)
+
+    if ac:
+        actual_max = max(abs(channel) for factor in ac for channel in factor)
+        quantised = max(0, min(82, int(actual_max * 166 - 0.5)))
+        max_value = (quantised + 1) / 166
+    else:
+        quantised, max_value = 0, 1
+    result += _encode_base83(quantised, 1)
+
+    r, g, b = (_linear_to_srgb(channel) for channel in dc)
+    result += _encode_base83((r << 16) + (g << 8) + b, 4)
+
+    for factor in ac:
+        r, g, b = (_quantise_ac(channel, max_value) for channel in factor)
+        result += _encode_base83(r * 19 * 19 + g * 19 + b, 2)
+
+    return result
+
+
+def _dominant_color(image):
+    """
+    Return the most common colour of an RGB image as "#rrggbb".
+    :param image:
+    :return:
+    """
+    quantized = image.quantize(colors=5)
+    count, index = max(quantized.getcolors())
+    r, g, b = quantized.getpalette()[index * 3 : index * 3 + 3]
+
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def image_metadata(file):
+    """
+    Read the details clients need to lay out an image before loading it.
+    :param file: uploaded or stored image file
+    :return: dict of Recipe image fields
+    """
+    from PIL import ExifTags, Image, ImageOps
+
+    file.seek(0)
+
+    with Image.open(file) as image:
+        image_format = image.format
+        width, height = image.size
+        if image.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8):
+            # Report the size the image is displayed at.
+            width, height = height, width
+
+        image.draft("RGB", (SAMPLE_SIZE, SAMPLE_SIZE))
+        sample = _to_rgb(ImageOps.exif_transpose(image))
+        sample.thumbnail((SAMPLE_SIZE, SAMPLE_SIZE))
+
+    file.seek(0)
+
+    return {
+        "image_width": width,
+        "image_height": height,
+        "image_format": image_format,
+        "image_size": file.size,
+        "image_color": _dominant_color(sample),
+        "image_placeholder": blurhash(sample),
+    }
+
+
+def _downscale(image, max_dimension):
+    """
+    Shrink an image to fit in a `max_dimension` square.
+
+    Uses the cheap integer `reduce()` to get close to the target and a
+    high quality resample only for the remaining step.
+    :param image:
+    :param max_dimension:
+    :return:
+    """
+    from PIL import Image
+
+    factor = max(image.size) // max_dimension
+    if factor >= 2:
+        image = image.reduce(factor)
+
+    if max(image.size) > max_dimension:
+        image = image.copy()
+        image.thumbnail(
+            (max_dimension, max_dimension), Image.Resampling.LANCZOS
+        )
+
+    return image
+
+
+def ingest_image(upload):
+    """
+    Prepare an uploaded image for storage.
+
+    Rejects images over RECIPE_IMAGE_MAX_PIXELS before decoding them,
+    downscales images larger than RECIPE_IMAGE_MAX_DIMENSION (letting the
+    JPEG decoder skip detail with `draft()` first), applies and drops the
+    EXIF orientation and re-encodes without EXIF, XMP or comments.
+    :param upload: uploaded image file
+    :return: (file to store, bytes saved)
+    """
+    from PIL import Image, ImageOps
+
+    max_dimension = settings.RECIPE_IMAGE_MAX_DIMENSION
+    upload.seek(0)
+
+    with Image.open(upload) as original:
+        if original.width * original.height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            raise UploadTooLarge(_("Uploaded image has too many pixels."))
+
+        image_format = original.format
+        if image_format not in INGEST_FORMATS or getattr(
+            original, "is_animated", False
+        ):
+            upload.seek(0)
+            return upload, 0
+
+        has_metadata = bool(original.getexif()) or any(
+            key in original.info for key in METADATA_KEYS
+        )
+        oversized = max(original.size) > max_dimension
+        icc_profile = original.info.get("icc_profile")
+
+        if oversized and image_format == "JPEG":
+            original.draft("RGB", (max_dimension, max_dimension))
+
+        try:
+            image = ImageOps.exif_transpose(original)
+            if oversized:
+                image = _downscale(image, max_dimension)
+        except (OSError, SyntaxError) as exc:
+            raise exceptions.ValidationError(
+                {"image": [_("Upload a valid image.")]}
+            ) from exc
+
+        options = {"optimize": True}
+        if image_format in ("JPEG", "WEBP"):
+            options["quality"] = settings.RECIPE_IMAGE_QUALITY
+        if image_format == "JPEG":
+            options["progressive"] = True
+            if image.mode not in ("RGB", "L", "CMYK"):
+                image = _to_rgb(image)
+        if icc_profile:
+            options["icc_profile"] = icc_profile
+
+        ingested = ImageUploadFile(
+            upload.name, upload.content_type, upload.charset, upload_temp_dir()
+        )
+        image.save(ingested, format=image_format, **options)
+
+    ingested.flush()
+    ingested.size = os.path.getsize(ingested.temporary_file_path())
+    if not oversized and not has_metadata and ingested.size >= upload.size:
+        # Re-encoding would not help, keep the original bytes.
+        ingested.close()
+        upload.seek(0)
+        return upload, 0
+
+    hasher = hashlib.sha256()
+    for chunk in ingested.chunks():
+        hasher.update(chunk)
+    ingested.seek(0)
+    ingested.sha256 = hasher.hexdigest()
+
+    bytes_saved = upload.size - ingested.size
+    logger.info(
+        "Ingested %s: %d -> %d bytes (%d saved).",
+        upload.name,
+        upload.size,
+        ingested.size,
+        bytes_saved,
+    )
+    upload.close()
+
+    return ingested, bytes_saved
+
+
+def _to_rgb(image):
+    """
+    Convert an image to RGB, flattening transparency onto white.
+    :param image:
+    :return:
+    """
+    from PIL import Image
+
+    if image.mode in ("RGB", "L"):
+        return image.convert("RGB")
+
+    rgba = image.convert("RGBA")
+    background = Image.new("RGB", rgba.size, (255, 255, 255))
+    background.paste(rgba, mask=rgba.getchannel("A"))
+
+    return background
+
+
+def _save_atomic(image, path, image_format, quality):
+    """
+    Encode `image` next to `path` and move it into place in one step.
+    :param image:
+    :param path:
+    :param image_format:
+    :param quality:
+    :return:
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            image.save(
+                tmp_file, format=image_format, quality=quality, optimize=True
+            )
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def generate_derivatives(source_path, targets, quality):
+    """
+    Write resized copies of an image.
+
+    Only deals with file paths so it can run anywhere the media files are
+    mounted.
+    :param source_path: absolute path of the original image
+    :param targets: list of (size, format, absolute path) tuples
+    :param quality: encoder quality for lossy formats
+    :return: list of (size, format) pairs that were written
+    """
+    from PIL import Image, ImageOps
+
+    written = []
+
+    with Image.open(source_path) as original:
+        largest = max(size for size, _, _ in targets)
+        # Let the JPEG decoder scale down while decoding.
+        original.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(original)
+
+        if image.mode not in ("RGB", "L"):
+            image = _to_rgb(image)
+
+        # Resize from the largest size down, reusing the previous result.
+        for size in sorted({size for size, _, _ in targets}, reverse=True):
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+            for target_size, image_format, path in targets:
+                if target_size == size:
+                    _save_atomic(image, path, image_format, quality)
+                    written.append((size, image_format))
+
+    return written
+
+
+def _derivative_targets(storage, name):
+    """
+    Return the (size, format, absolute path) of every derivative of `name`.
+    :param storage:
+    :param name:
+    :return:
+    """
+    return [
+        (
+            size,
+            image_format,
+            storage.path(derivative_name(name, size, image_format)),
+        )
+        for size, image_format in derivative_specs()
+    ]
+
+
+def _derivative_map(name, written):
+    """
+    Build the `Recipe.image_derivatives` value from written derivatives.
+    :param name:
+    :param written:
+    :return:
+    """
+    derivatives = {}
+
+    for size, image_format in written:
+        derivatives.setdefault(str(size), {})[image_format.lower()] = (
+            derivative_name(name, size, image_format)
+        )
+
+    return derivatives
+
+
+def _store_derivatives(recipe_id, name, written):
+    """
+    Record derivatives on the recipe unless its image changed meanwhile.
+    :param recipe_id:
+    :param name:
+    :param written:
+    :return:
+    """
+    from .models import Recipe
+
+    derivatives = _derivative_map(name, written)
+    Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image_derivatives=derivatives
+    )
+
+    return derivatives
+
+
+def build_derivatives(recipe_id, name):
+    """
+    Generate and record the derivatives of a recipe image.
+    Does nothing if the recipe no longer uses that image.
+    :param recipe_id:
+    :param name:
+    :return:
+    """
+    from .models import Recipe
+
+    if not Recipe.objects.filter(pk=recipe_id, image=name).exists():
+        return {}
+
+    storage = Recipe._meta.get_field("image").storage
+    written = generate_derivatives(
+        storage.path(name),
+        _derivative_targets(storage, name),
+        settings.RECIPE_IMAGE_DERIVATIVE_QUALITY,
+    )
+
+    return _store_derivatives(recipe_id, name, written)
+
+
+def schedule_derivatives(recipe):
+    """
+    Generate the configured derivatives of the recipe's image.
+
+    With RECIPE_IMAGE_INLINE_DERIVATIVES set the work runs inline and the
+    recipe is updated in place, otherwise a job is queued and the paths
+    are saved once a worker has run it.
+    :param recipe:
+    :return:
+    """
+    from core import jobs
+
+    name = recipe.image.name
+    targets = _derivative_targets(recipe.image.storage, name)
+
+    if all(os.path.exists(path) for _, _, path in targets):
+        # Another recipe already uploaded the same image.
+        written = [(size, image_format) for size, image_format, _ in targets]
+        recipe.image_derivatives = _store_derivatives(recipe.pk, name, written)
+        return
+
+    if settings.RECIPE_IMAGE_INLINE_DERIVATIVES:
+        recipe.image_derivatives = build_derivatives(recipe.pk, name)
+        return
+
+    jobs.enqueue(DERIVATIVES_JOB, recipe_id=recipe.pk, name=name)
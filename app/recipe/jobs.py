@@ -0,0 +1,18 @@
+"""
+Background jobs for recipes.
+"""
+
+from core import jobs
+
+from . import images
+
+
+@jobs.register(images.DERIVATIVES_JOB)
+def build_derivatives(recipe_id, name):
+    """
+    Generate the derivatives of a recipe image.
+    :param recipe_id:
+    :param name:
+    :return:
+    """
+    images.build_derivatives(recipe_id, name)
@@ -0,0 +1,160 @@
+"""
+Django command to compare sync and async recipe API throughput.
+"""
+
+import asyncio
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+
+from core.benchmark import format_summary, summarize
+from recipe.models import Recipe
+from tag.models import Tag
+
+
+class Command(BaseCommand):
+    """
+    Request the sync and async recipe lists at the same concurrency.
+
+    Sync requests run in a thread pool like threaded WSGI workers, async
+    requests as tasks on one event loop like an ASGI worker. A throwaway
+    user with sample recipes is created for the run and deleted after.
+    """
+
+    help = "Compare sync and async recipe list throughput."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=500,
+            help="Number of requests per mode.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=50,
+            help="Number of requests in flight at once.",
+        )
+        parser.add_argument(
+            "--recipes",
+            type=int,
+            default=20,
+            help="Number of recipes the listed user has.",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Entrypoint for command.
+        :param args:
+        :param options:
+        :return:
+        """
+        user = get_user_model().objects.create_user(
+            f"bench-{uuid.uuid4().hex}@example.com", uuid.uuid4().hex
+        )
+
+        # The test clients send requests for the "testserver" host.
+        allowed_hosts = override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+        )
+
+        try:
+            self.authorization = f"Token {self._seed(user, options)}"
+            requests = options["requests"]
+            concurrency = options["concurrency"]
+
+            for label, run in (
+                ("sync", self._run_sync),
+                ("async", self._run_async),
+            ):
+                start = time.perf_counter()
+                with allowed_hosts:
+                    samples = run(requests, concurrency)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"{format_summary(label, summarize(samples))} "
+                    f"throughput={requests / elapsed:.1f}req/s"
+                )
+        finally:
+            user.delete()
+
+        self.stdout.write(self.style.SUCCESS("Benchmark finished."))
+
+    def _seed(self, user, options):
+        """
+        Create the user's sample recipes and return their token key.
+        :param user:
+        :param options:
+        :return:
+        """
+        tag = Tag.objects.create(user=user, name="Bench")
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                user=user,
+                title=f"Recipe {i}",
+                time_minutes=10,
+                price=Decimal("5.00"),
+            )
+            for i in range(options["recipes"])
+        )
+        tag.recipe_set.add(*recipes)
+
+        return Token.objects.create(user=user).key
+
+    def _run_sync(self, requests, concurrency):
+        """
+        Time `requests` sync list requests over a thread pool.
+        :param requests:
+        :param concurrency:
+        :return: latencies in seconds
+        """
+        url = reverse("recipe:recipe-list")
+
+        def request(_):
+            start = time.perf_counter()
+            response = Client().get(url, HTTP_AUTHORIZATION=self.authorization)
+            self._check(response)
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            return list(executor.map(request, range(requests)))
+
+    def _run_async(self, requests, concurrency):
+        """
+        Time `requests` async list requests on one event loop.
+        :param requests:
+        :param concurrency:
+        :return: latencies in seconds
+        """
+        url = reverse("recipe:async-recipe-list")
+
+        async def run():
+            client = AsyncClient()
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def request():
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.get(
+                        url, headers={"authorization": self.authorization}
+                    )
+                    self._check(response)
+                    return time.perf_counter() - start
+
+            return await asyncio.gather(*(request() for _ in range(requests)))
+
+        return asyncio.run(run())
+
+    def _check(self, response):
+        if response.status_code != 200:
+            raise RuntimeError(f"Request failed with {response.status_code}.")
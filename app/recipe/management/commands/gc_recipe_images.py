@@ -0,0 +1,299 @@
+"""
+Django command to delete recipe image files no recipe references.
+"""
+
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from recipe import images
+from recipe.models import ImageBlob, Recipe
+
+IMAGE_DIR = "uploads/recipe"
+DERIVATIVE_DIR = "uploads/derivatives/recipe"
+# Trees walked in order. Derivatives come last so those of the originals
+# deleted in the same run are already gone.
+TREES = (IMAGE_DIR, DERIVATIVE_DIR)
+
+
+class Command(BaseCommand):
+    """
+    Garbage collect orphaned recipe images.
+
+    Directories are walked depth first in sorted order while the files of
+    each directory are streamed with `os.scandir` and checked against the
+    database in batches, so memory stays bounded however many files there
+    are. Progress is saved after every directory when a checkpoint file is
+    given, and a later run resumes after the last finished directory.
+
+    Derivatives are walked too, and deleted when neither a recipe nor a
+    blob has the image they were resized from, which catches those left
+    behind when their original went away without them.
+    """
+
+    help = "Delete recipe image files that no recipe references."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-period",
+            type=float,
+            default=24,
+            help="Hours a file must be unmodified before it is deleted.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of file names checked per query.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="File recording progress, resumed from if it exists.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list the files that would be deleted.",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Entrypoint for command.
+        :param args:
+        :param options:
+        :return:
+        """
+        self.storage = Recipe._meta.get_field("image").storage
+        self.batch_size = options["batch_size"]
+        self.dry_run = options["dry_run"]
+        self.cutoff = time.time() - options["grace_period"] * 3600
+        self.scanned = self.deleted = self.freed = 0
+        checkpoint = options["checkpoint"]
+        resume_after = self._load_checkpoint(checkpoint)
+
+        for index, tree in enumerate(TREES):
+            root = self.storage.path(tree)
+
+            for directory in self._walk(root, ()):
+                position = (index, directory)
+                if resume_after is not None and position <= resume_after:
+                    continue
+
+                self._collect_directory(tree, root, directory)
+
+                if checkpoint and not self.dry_run:
+                    self._save_checkpoint(checkpoint, tree, directory)
+
+        if checkpoint and not self.dry_run and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        verb = "Would delete" if self.dry_run else "Deleted"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Scanned {self.scanned} files. {verb} {self.deleted} "
+                f"orphans, {self.freed} bytes."
+            )
+        )
+
+    def _walk(self, root, directory):
+        """
+        Yield directories below `root` as tuples of path components.
+        Children are visited in sorted order after their parent.
+        :param root:
+        :param directory:
+        :return:
+        """
+        yield directory
+
+        try:
+            with os.scandir(os.path.join(root, *directory)) as entries:
+                children = sorted(
+                    entry.name
+                    for entry in entries
+                    if entry.is_dir(follow_symlinks=False)
+                    and not entry.name.startswith(".")
+                )
+        except FileNotFoundError:
+            return
+
+        for child in children:
+            yield from self._walk(root, directory + (child,))
+
+    def _files(self, tree, root, directory):
+        """
+        Yield (name, entry) for the image files directly in `directory`.
+        :param tree:
+        :param root:
+        :param directory:
+        :return:
+        """
+        prefix = "/".join((tree,) + directory)
+
+        try:
+            with os.scandir(os.path.join(root, *directory)) as entries:
+                for entry in entries:
+                    # Dot files are uploads still being written.
+                    if entry.name.startswith(".") or not entry.is_file(
+                        follow_symlinks=False
+                    ):
+                        continue
+                    yield f"{prefix}/{entry.name}", entry
+        except FileNotFoundError:
+            return
+
+    def _collect_directory(self, tree, root, directory):
+        """
+        Delete the orphans directly in `directory`.
+        :param tree:
+        :param root:
+        :param directory:
+        :return:
+        """
+        collect = (
+            self._collect_derivatives
+            if tree == DERIVATIVE_DIR
+            else self._collect_batch
+        )
+        batch = []
+
+        for name, entry in self._files(tree, root, directory):
+            self.scanned += 1
+            stat = entry.stat(follow_symlinks=False)
+
+            if stat.st_mtime < self.cutoff:
+                batch.append((name, stat.st_size))
+
+            if len(batch) >= self.batch_size:
+                collect(batch)
+                batch = []
+
+        if batch:
+            collect(batch)
+
+    def _collect_batch(self, batch):
+        """
+        Delete the files in `batch` that no recipe references.
+        :param batch: list of (name, size) tuples
+        :return:
+        """
+        names = [name for name, _ in batch]
+        referenced = set(
+            Recipe.objects.filter(image__in=names).values_list(
+                "image", flat=True
+            )
+        )
+
+        for name, size in batch:
+            if name in referenced:
+                continue
+
+            if self.dry_run:
+                self.stdout.write(f"Would delete {name}")
+            elif not self._delete_orphan(name):
+                continue
+
+            self.deleted += 1
+            self.freed += size
+
+    def _collect_derivatives(self, batch):
+        """
+        Delete the derivatives in `batch` whose original image is gone.
+        :param batch: list of (name, size) tuples
+        :return:
+        """
+        stems = {
+            name: images.derivative_source_stem(name) for name, _ in batch
+        }
+        # Originals are only known by their stem, as the extension of a
+        # derivative is that of its own format.
+        query = Q()
+        for stem in set(stems.values()):
+            query |= Q(name__startswith=f"{stem}.")
+        live = {
+            os.path.splitext(name)[0]
+            for name in ImageBlob.objects.filter(query).values_list(
+                "name", flat=True
+            )
+        }
+        # Legacy images were stored without a blob.
+        query = Q()
+        for stem in set(stems.values()) - live:
+            query |= Q(image__startswith=f"{stem}.")
+        if query:
+            live.update(
+                os.path.splitext(name)[0]
+                for name in Recipe.objects.filter(query).values_list(
+                    "image", flat=True
+                )
+            )
+
+        for name, size in batch:
+            if stems[name] in live:
+                continue
+
+            if self.dry_run:
+                self.stdout.write(f"Would delete {name}")
+            else:
+                self.storage.delete(name)
+
+            self.deleted += 1
+            self.freed += size
+
+    def _delete_orphan(self, name):
+        """
+        Delete an orphan unless an upload started referencing it.
+
+        Locking the blob row, or inserting it when missing, waits for any
+        upload of the same content that is still in progress.
+        :param name:
+        :return: whether the file was deleted
+        """
+        with transaction.atomic():
+            blobs = ImageBlob.objects.select_for_update()
+            blob, _ = blobs.get_or_create(name=name, defaults={"refcount": 0})
+            if Recipe.objects.filter(image=name).exists():
+                return False
+
+            blob.delete()
+            self.storage.delete(name)
+            images.delete_derivatives(self.storage, name)
+
+        return True
+
+    def _load_checkpoint(self, path):
+        """
+        Return the (tree index, directory) last finished in `path`, if any.
+        Checkpoints without a tree predate derivatives being collected.
+        :param path:
+        :return:
+        """
+        if not path or not os.path.exists(path):
+            return None
+
+        with open(path) as checkpoint:
+            state = json.load(checkpoint)
+
+        tree = TREES.index(state.get("tree", IMAGE_DIR))
+
+        return tree, tuple(state["directory"])
+
+    def _save_checkpoint(self, path, tree, directory):
+        """
+        Record `directory` of `tree` as finished.
+        :param path:
+        :param tree:
+        :param directory:
+        :return:
+        """
+        tmp_path = f"{path}.tmp"
+
+        with open(tmp_path, "w") as checkpoint:
+            json.dump(
+                {"tree": tree, "directory": list(directory)}, checkpoint
+            )
+
+        os.replace(tmp_path, path)
@@ -0,0 +1,98 @@
+"""
+Django command to move recipe images to content-addressed storage.
+"""
+
+import os
+import re
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from recipe import images
+from recipe.models import Recipe
+
+CONTENT_ADDRESSED_NAME = re.compile(
+    r"^uploads/recipe/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$"
+)
+
+
+class Command(BaseCommand):
+    """
+    Rewrite recipe images stored under random names.
+    """
+
+    help = "Move recipe images to content-addressed storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of recipes loaded per query.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list the images that would be moved.",
+        )
+        parser.add_argument(
+            "--keep-originals",
+            action="store_true",
+            help="Do not delete the old files after moving them.",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Entrypoint for command.
+        :param args:
+        :param options:
+        :return:
+        """
+        storage = Recipe._meta.get_field("image").storage
+        recipes = Recipe.objects.exclude(image="").exclude(image__isnull=True)
+        last_pk = 0
+        moved = 0
+
+        while True:
+            batch = list(
+                recipes.filter(pk__gt=last_pk).order_by("pk")[
+                    : options["batch_size"]
+                ]
+            )
+            if not batch:
+                break
+
+            last_pk = batch[-1].pk
+
+            for recipe in batch:
+                old_name = recipe.image.name
+
+                if CONTENT_ADDRESSED_NAME.match(old_name):
+                    continue
+
+                if not storage.exists(old_name):
+                    self.stderr.write(f"Missing file {old_name}, skipped.")
+                    continue
+
+                if options["dry_run"]:
+                    self.stdout.write(f"Would move {old_name}")
+                    continue
+
+                with storage.open(old_name) as old_file:
+                    recipe.image = File(
+                        old_file, name=os.path.basename(old_name)
+                    )
+                    metadata = images.image_metadata(recipe.image.file)
+                    for field, value in metadata.items():
+                        setattr(recipe, field, value)
+                    recipe.save(update_fields=["image", *metadata])
+
+                images.delete_derivatives(storage, old_name)
+                if not options["keep_originals"]:
+                    storage.delete(old_name)
+
+                images.schedule_derivatives(recipe)
+                moved += 1
+                self.stdout.write(f"Moved {old_name} to {recipe.image.name}")
+
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} recipe images."))
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.1 on 2026-10-19 10:46
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built without blocking writes to the tables, which
+    # cannot be done in a transaction.
+    atomic = False
+
+    dependencies = [
+        ('ingredient', '0002_user_indexes'),
+        ('recipe', '0007_recipe_image_metadata'),
+        ('tag', '0002_user_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['user', '-id'], name='recipe_user_id_idx'),
+        ),
+        # The auto-created through tables only have (recipe_id, tag_id)
+        # unique indexes, lookups from a tag or ingredient to its recipes
+        # need the reverse order.
+        migrations.RunSQL(
+            'CREATE INDEX CONCURRENTLY recipe_tags_tag_recipe_idx '
+            'ON recipe_recipe_tags (tag_id, recipe_id)',
+            'DROP INDEX CONCURRENTLY recipe_tags_tag_recipe_idx',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX CONCURRENTLY recipe_ingredients_ingredient_recipe_idx '
+            'ON recipe_recipe_ingredients (ingredient_id, recipe_id)',
+            'DROP INDEX CONCURRENTLY recipe_ingredients_ingredient_recipe_idx',
+        ),
+    ]
@@ -2,10 +2,97 @@
 Recipe models.
 """
 
+from functools import partial
+
 from django.conf import settings
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 
 from core.models import recipe_image_file_path
+from core.storage import recipe_image_storage
+
+
+class ImageBlobManager(models.Manager):
+    """
+    Manager for reference-counted image files.
+    """
+
+    def acquire(self, name):
+        """
+        Add a reference to the file `name`.
+
+        Must run in the transaction that stores the reference. The row
+        lock taken here makes a concurrent `release` of the same file wait,
+        so the file cannot be deleted while it is being referenced.
+        :param name:
+        :return:
+        """
+        while not self.filter(pk=name).update(refcount=F("refcount") + 1):
+            try:
+                with transaction.atomic():
+                    self.create(name=name, refcount=1)
+                return
+            except IntegrityError:
+                # A concurrent transaction created the row, count on it.
+                continue
+
+    def release(self, name):
+        """
+        Drop a reference to the file `name`. Once nothing references it,
+        the file and its derivatives are deleted after the transaction
+        commits, so a rollback keeps them.
+        :param name:
+        :return: whether the file is deleted on commit
+        """
+        with transaction.atomic():
+            blob = self.select_for_update().filter(pk=name).first()
+
+            if blob is None:
+                return False
+
+            self.filter(pk=name).update(refcount=F("refcount") - 1)
+
+        if blob.refcount > 1:
+            return False
+
+        transaction.on_commit(partial(self._delete_unreferenced, name))
+
+        return True
+
+    def _delete_unreferenced(self, name):
+        """
+        Delete the file `name` and its derivatives unless it was referenced
+        again since it was released.
+        :param name:
+        :return:
+        """
+        from . import images
+
+        with transaction.atomic():
+            blob = self.select_for_update().filter(pk=name).first()
+
+            # Gone when the orphan collector deleted the file first.
+            if blob is None or blob.refcount > 0:
+                return
+
+            blob.delete()
+            recipe_image_storage.delete(name)
+            images.delete_derivatives(recipe_image_storage, name)
+
+
+class ImageBlob(models.Model):
+    """
+    Stored image file shared by every recipe with the same image content.
+    """
+
+    name = models.CharField(max_length=255, primary_key=True)
+    refcount = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = ImageBlobManager()
+
+    def __str__(self):
+        return self.name
 
 
 class Recipe(models.Model):
@@ -24,7 +111,70 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)
     tags = models.ManyToManyField("tag.Tag")
     ingredients = models.ManyToManyField("ingredient.Ingredient")
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image = models.ImageField(
+        null=True,
+        upload_to=recipe_image_file_path,
+        storage=recipe_image_storage,
+    )
+    image_derivatives = models.JSONField(default=dict, blank=True)
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    image_format = models.CharField(max_length=10, blank=True)
+    image_size = models.PositiveBigIntegerField(null=True, blank=True)
+    image_color = models.CharField(max_length=7, blank=True)
+    image_placeholder = models.CharField(max_length=100, blank=True)
+
+    # Image name as last loaded from or saved to the database, None when
+    # the image column was deferred.
+    _stored_image = ""
+
+    class Meta:
+        indexes = [
+            # Recipe lists filter by user and sort by newest first.
+            models.Index(fields=["user", "-id"], name="recipe_user_id_idx"),
+        ]
 
     def __str__(self):
         return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_image = (
+            instance.__dict__.get("image") or ""
+            if "image" in instance.__dict__
+            else None
+        )
+
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Save the recipe, moving its image reference if the image changed.
+        """
+        image = self.image
+
+        if image and not image._committed:
+            # Content-addressed names are known before the file is stored.
+            name = image.field.generate_filename(self, image.name)
+        else:
+            name = image.name or ""
+
+        with transaction.atomic():
+            if self._stored_image is None:
+                self._stored_image = (
+                    Recipe.objects.filter(pk=self.pk)
+                    .values_list("image", flat=True)
+                    .first()
+                    or ""
+                )
+
+            if name and name != self._stored_image:
+                ImageBlob.objects.acquire(name)
+
+            super().save(*args, **kwargs)
+
+            if self._stored_image and self._stored_image != name:
+                ImageBlob.objects.release(self._stored_image)
+
+        self._stored_image = name
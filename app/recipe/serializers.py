@@ -2,14 +2,19 @@
 Serializers for recipe APIs
 """
 
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_field
+
 from rest_framework import serializers
 
+from core.metrics import TimedSerializerMixin
+from . import images
 from .models import Recipe
 from tag.models import Tag
 from ingredient.models import Ingredient
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for ingredients.
     """
@@ -20,7 +25,7 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ["id"]
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for tags.
     """
@@ -31,13 +36,52 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ["id"]
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+IMAGE_METADATA_FIELDS = [
+    "image_width",
+    "image_height",
+    "image_format",
+    "image_size",
+    "image_color",
+    "image_placeholder",
+]
+
+
+@extend_schema_field(OpenApiTypes.OBJECT)
+class ImageDerivativesField(serializers.ReadOnlyField):
+    """
+    URLs of the resized copies of a recipe image, keyed by size and format.
+    """
+
+    def to_representation(self, value):
+        """
+        Convert stored file names to URLs.
+        :param value:
+        :return:
+        """
+        storage = Recipe._meta.get_field("image").storage
+        request = self.context.get("request")
+        derivatives = {}
+
+        for size, names in value.items():
+            derivatives[size] = {}
+
+            for image_format, name in names.items():
+                url = storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                derivatives[size][image_format] = url
+
+        return derivatives
+
+
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for recipes.
     """
 
     tags = TagSerializer(many=True, required=False)
     ingredients = IngredientSerializer(many=True, required=False)
+    image_derivatives = ImageDerivativesField()
 
     class Meta:
         model = Recipe
@@ -49,8 +93,32 @@ class RecipeSerializer(serializers.ModelSerializer):
             "link",
             "tags",
             "ingredients",
-        ]
-        read_only_fields = ["id"]
+            "image_derivatives",
+        ] + IMAGE_METADATA_FIELDS
+        read_only_fields = ["id"] + IMAGE_METADATA_FIELDS
+
+    def _get_or_create(self, model, items, related):
+        """
+        Add the user's tags or ingredients named in `items` to a recipe,
+        creating the missing ones, in a fixed number of queries.
+        :param model: Tag or Ingredient
+        :param items: validated dicts with a name
+        :param related: the recipe's related manager
+        :return:
+        """
+        auth_user = self.context["request"].user
+        names = list(dict.fromkeys(item["name"] for item in items))
+        if not names:
+            return
+
+        existing = model.objects.filter(user=auth_user, name__in=names)
+        found = {obj.name: obj for obj in existing}
+        created = model.objects.bulk_create(
+            model(user=auth_user, name=name)
+            for name in names
+            if name not in found
+        )
+        related.add(*found.values(), *created)
 
     def _get_or_create_tags(self, tags, recipe):
         """
@@ -59,11 +127,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         :param recipe:
         :return:
         """
-        auth_user = self.context["request"].user
-
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(user=auth_user, **tag)
-            recipe.tags.add(tag_obj)
+        self._get_or_create(Tag, tags, recipe.tags)
 
     def _get_or_create_ingredients(self, ingredients, recipe):
         """
@@ -72,13 +136,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         :param recipe:
         :return:
         """
-        auth_user = self.context["request"].user
-
-        for ingredient in ingredients:
-            ingredient_obj, create = Ingredient.objects.get_or_create(
-                user=auth_user, **ingredient
-            )
-            recipe.ingredients.add(ingredient_obj)
+        self._get_or_create(Ingredient, ingredients, recipe.ingredients)
 
     def create(self, validated_data):
         """
@@ -129,13 +187,33 @@ class RecipeDetailSerializer(RecipeSerializer):
         fields = RecipeSerializer.Meta.fields + ["description"]
 
 
-class RecipeImageSerializer(serializers.ModelSerializer):
+class RecipeImageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for uploading images to recipes.
     """
 
+    image_derivatives = ImageDerivativesField()
+
     class Meta:
         model = Recipe
-        fields = ["id", "image"]
-        read_only_fields = ["id"]
+        fields = ["id", "image", "image_derivatives"] + IMAGE_METADATA_FIELDS
+        read_only_fields = ["id"] + IMAGE_METADATA_FIELDS
         extra_kwargs = {"image": {"required": True}}
+
+    bytes_saved = 0
+
+    def update(self, instance, validated_data):
+        """
+        Store the ingested image along with its precomputed metadata.
+        :param instance:
+        :param validated_data:
+        :return:
+        """
+        image, self.bytes_saved = images.ingest_image(validated_data["image"])
+        validated_data["image"] = image
+        validated_data.update(images.image_metadata(image))
+        instance = super().update(instance, validated_data)
+        # Storage has moved the file, only the handle is left to close.
+        image.close()
+
+        return instance
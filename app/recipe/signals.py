@@ -0,0 +1,20 @@
+"""
+Signal handlers for recipe models.
+"""
+
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import ImageBlob, Recipe
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_image(sender, instance, **kwargs):
+    """
+    Drop the deleted recipe's reference to its image.
+    :param sender:
+    :param instance:
+    :return:
+    """
+    if instance.image:
+        ImageBlob.objects.release(instance.image.name)
@@ -0,0 +1,233 @@
+"""
+Tests for the async recipe APIs.
+"""
+
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from core.nplusone import NPlusOneTestMixin
+from core.tests.utils import serve_async
+from ingredient.models import Ingredient
+from tag.models import Tag
+
+from .. import async_views
+from ..models import Recipe
+
+RECIPES_URL = reverse("recipe:async-recipe-list")
+TAGS_URL = reverse("recipe:async-tag-list")
+INGREDIENTS_URL = reverse("recipe:async-ingredient-list")
+
+
+def detail_url(recipe_id):
+    """
+    Create and return an async recipe detail URL.
+    :param recipe_id:
+    :return:
+    """
+    return reverse("recipe:async-recipe-detail", args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """
+    Create and return a sample recipe.
+    :param user:
+    :param params:
+    :return:
+    """
+    defaults = {
+        "title": "Sample recipe",
+        "time_minutes": 22,
+        "price": Decimal("5.25"),
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class AsyncRecipeApiTests(NPlusOneTestMixin, TestCase):
+    """
+    Test the async recipe, tag and ingredient views.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            "user@example.com", "test_pass123"
+        )
+        self.other = get_user_model().objects.create_user(
+            "other@example.com", "test_pass123"
+        )
+        token = Token.objects.create(user=self.user)
+        self.headers = {"authorization": f"Token {token.key}"}
+
+    async def test_auth_required(self):
+        """
+        Test requests without a token are rejected.
+        :return:
+        """
+        res = await self.async_client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(res.headers["WWW-Authenticate"], "Token")
+
+    async def test_invalid_token_rejected(self):
+        """
+        Test an unknown token is rejected.
+        :return:
+        """
+        res = await self.async_client.get(
+            RECIPES_URL, headers={"authorization": "Token nope"}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(res.json()["detail"], "Invalid token.")
+
+    async def test_list_recipes_filtered(self):
+        """
+        Test listing the user's recipes filtered by tag.
+        :return:
+        """
+        await Recipe.objects.acreate(
+            user=self.other, title="Other", time_minutes=1, price=Decimal("1")
+        )
+        tagged = await Recipe.objects.acreate(
+            user=self.user, title="Tagged", time_minutes=1, price=Decimal("1")
+        )
+        await Recipe.objects.acreate(
+            user=self.user, title="Plain", time_minutes=1, price=Decimal("1")
+        )
+        tag = await Tag.objects.acreate(user=self.user, name="Vegan")
+        await tagged.tags.aadd(tag)
+
+        res = await self.async_client.get(RECIPES_URL, headers=self.headers)
+        filtered = await self.async_client.get(
+            RECIPES_URL, {"tags": str(tag.id)}, headers=self.headers
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [recipe["title"] for recipe in res.json()], ["Plain", "Tagged"]
+        )
+        self.assertEqual(
+            filtered.json()[0]["tags"], [{"id": tag.id, "name": "Vegan"}]
+        )
+        self.assertEqual(len(filtered.json()), 1)
+
+    def test_retrieve_matches_sync_view(self):
+        """
+        Test the async detail view returns what the sync one does.
+        :return:
+        """
+        recipe = create_recipe(user=self.user, description="Tasty")
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name="Salt")
+        )
+        sync_url = reverse("recipe:recipe-detail", args=[recipe.id])
+
+        res = self.client.get(detail_url(recipe.id), headers=self.headers)
+        sync_res = self.client.get(sync_url, headers=self.headers)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), sync_res.json())
+
+    async def test_retrieve_other_users_recipe_not_found(self):
+        """
+        Test another user's recipe cannot be retrieved.
+        :return:
+        """
+        recipe = await Recipe.objects.acreate(
+            user=self.other, title="Other", time_minutes=1, price=Decimal("1")
+        )
+
+        res = await self.async_client.get(
+            detail_url(recipe.id), headers=self.headers
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_list_assigned_tags_and_ingredients(self):
+        """
+        Test tags and ingredients can be limited to assigned ones.
+        :return:
+        """
+        recipe = await Recipe.objects.acreate(
+            user=self.user, title="Soup", time_minutes=1, price=Decimal("1")
+        )
+        tag = await Tag.objects.acreate(user=self.user, name="Dinner")
+        await Tag.objects.acreate(user=self.user, name="Unused")
+        ingredient = await Ingredient.objects.acreate(
+            user=self.user, name="Leek"
+        )
+        await recipe.tags.aadd(tag)
+        await recipe.ingredients.aadd(ingredient)
+
+        tags = await self.async_client.get(
+            TAGS_URL, {"assigned_only": 1}, headers=self.headers
+        )
+        ingredients = await self.async_client.get(
+            INGREDIENTS_URL, headers=self.headers
+        )
+
+        self.assertEqual(tags.json(), [{"id": tag.id, "name": "Dinner"}])
+        self.assertEqual(
+            ingredients.json(), [{"id": ingredient.id, "name": "Leek"}]
+        )
+
+    async def test_write_methods_not_allowed(self):
+        """
+        Test the async views are read only.
+        :return:
+        """
+        res = await self.async_client.post(RECIPES_URL, headers=self.headers)
+
+        self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+class AsyncRecipeAsgiTests(NPlusOneTestMixin, TransactionTestCase):
+    """
+    Test the async views served over ASGI, with their queries run in the
+    executor thread.
+    """
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            "user@example.com", "test_pass123"
+        )
+        for title in ("Curry", "Soup", "Pie"):
+            recipe = create_recipe(user=user, title=title)
+            recipe.tags.add(Tag.objects.create(user=user, name=title))
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=user, name=title)
+            )
+        token = Token.objects.create(user=user)
+        self.headers = {"authorization": f"Token {token.key}"}
+
+    def test_list_recipes(self):
+        """
+        Test the list runs no query per recipe.
+        :return:
+        """
+        res = serve_async(RECIPES_URL, headers=self.headers)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [recipe["title"] for recipe in res.json()],
+            ["Pie", "Soup", "Curry"],
+        )
+
+    @patch.object(async_views, "CHUNK_SIZE", 1)
+    def test_chunks_counted_apart(self):
+        """
+        Test the prefetches repeated for each chunk of the list pass.
+        :return:
+        """
+        res = serve_async(RECIPES_URL, headers=self.headers)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.json()), 3)
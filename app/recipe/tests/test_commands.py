@@ -0,0 +1,195 @@
+"""
+Tests for recipe management commands.
+"""
+
+from decimal import Decimal
+from io import StringIO
+import io
+import json
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from PIL import Image
+
+from ..models import ImageBlob, Recipe
+
+
+def create_recipe_with_legacy_image(user, name):
+    """
+    Create a recipe whose image is stored under a random name.
+    :param user:
+    :param name:
+    :return:
+    """
+    recipe = Recipe.objects.create(
+        user=user, title="Sample", time_minutes=5, price=Decimal("1.00")
+    )
+    image_file = io.BytesIO()
+    Image.new("RGB", (10, 10)).save(image_file, "JPEG")
+    storage = Recipe._meta.get_field("image").storage
+    legacy_name = storage.save(
+        f"uploads/recipe/{name}", ContentFile(image_file.getvalue())
+    )
+    Recipe.objects.filter(pk=recipe.pk).update(image=legacy_name)
+    recipe.refresh_from_db()
+
+    return recipe
+
+
+@override_settings(RECIPE_IMAGE_INLINE_DERIVATIVES=True)
+class MigrateRecipeImagesTests(TestCase):
+    """
+    Test the migrate_recipe_images command.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            "user@example.com", "test_pass123"
+        )
+
+    def test_moves_legacy_images(self):
+        """
+        Test legacy images are moved to shared content-addressed files.
+        :return:
+        """
+        first = create_recipe_with_legacy_image(self.user, "one.jpg")
+        second = create_recipe_with_legacy_image(self.user, "two.jpg")
+        legacy_path = first.image.path
+
+        call_command("migrate_recipe_images", stdout=StringIO())
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertRegex(
+            first.image.name, r"^uploads/recipe/\w\w/\w\w/\w{64}\.jpg$"
+        )
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(os.path.exists(first.image.path))
+        self.assertFalse(os.path.exists(legacy_path))
+        self.assertEqual(ImageBlob.objects.get().refcount, 2)
+
+        first.delete()
+        second.delete()
+
+    def test_dry_run_changes_nothing(self):
+        """
+        Test a dry run leaves images where they are.
+        :return:
+        """
+        recipe = create_recipe_with_legacy_image(self.user, "three.jpg")
+        name = recipe.image.name
+
+        call_command("migrate_recipe_images", dry_run=True, stdout=StringIO())
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image.name, name)
+        recipe.image.delete()
+
+
+class GcRecipeImagesTests(TestCase):
+    """
+    Test the gc_recipe_images command.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            "user@example.com", "test_pass123"
+        )
+        self.storage = Recipe._meta.get_field("image").storage
+
+    def save_file(self, name, age_hours=48):
+        """
+        Store a file under `name` last modified `age_hours` ago.
+        :param name:
+        :param age_hours:
+        :return: absolute path of the file
+        """
+        name = self.storage.save(name, ContentFile(b"image"))
+        path = self.storage.path(name)
+        mtime = time.time() - age_hours * 3600
+        os.utime(path, (mtime, mtime))
+        self.addCleanup(self.storage.delete, name)
+
+        return path
+
+    def test_deletes_old_orphans_only(self):
+        """
+        Test unreferenced files past the grace period are deleted.
+        :return:
+        """
+        recipe = create_recipe_with_legacy_image(self.user, "gc/kept.jpg")
+        orphan = self.save_file("uploads/recipe/gc/orphan.jpg")
+        recent = self.save_file("uploads/recipe/gc/recent.jpg", age_hours=1)
+        ImageBlob.objects.create(name="uploads/recipe/gc/orphan.jpg")
+
+        call_command("gc_recipe_images", stdout=StringIO())
+
+        self.assertTrue(os.path.exists(recipe.image.path))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(recent))
+        self.assertFalse(ImageBlob.objects.exists())
+        recipe.image.delete()
+
+    def test_dry_run_deletes_nothing(self):
+        """
+        Test a dry run only reports orphans.
+        :return:
+        """
+        orphan = self.save_file("uploads/recipe/gc/orphan.jpg")
+        out = StringIO()
+
+        call_command("gc_recipe_images", dry_run=True, stdout=out)
+
+        self.assertTrue(os.path.exists(orphan))
+        self.assertIn("uploads/recipe/gc/orphan.jpg", out.getvalue())
+
+    def test_resumes_from_checkpoint(self):
+        """
+        Test directories finished by an earlier run are skipped.
+        :return:
+        """
+        done = self.save_file("uploads/recipe/gc/aa/orphan.jpg")
+        pending = self.save_file("uploads/recipe/gc/bb/orphan.jpg")
+        checkpoint = os.path.join(self.storage.location, "gc.json")
+        with open(checkpoint, "w") as f:
+            json.dump({"directory": ["gc", "aa"]}, f)
+
+        call_command(
+            "gc_recipe_images", checkpoint=checkpoint, stdout=StringIO()
+        )
+
+        self.assertTrue(os.path.exists(done))
+        self.assertFalse(os.path.exists(pending))
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_deletes_derivatives_of_missing_images(self):
+        """
+        Test derivatives are deleted once no image they are of is live.
+        :return:
+        """
+        recipe = create_recipe_with_legacy_image(self.user, "gc/kept.jpg")
+        kept_stem = os.path.splitext(recipe.image.name)[0]
+        kept = self.save_file(
+            f"uploads/derivatives/{kept_stem[len('uploads/'):]}_128.webp"
+        )
+        ImageBlob.objects.create(name="uploads/recipe/gc/blob.png")
+        blob = self.save_file("uploads/derivatives/recipe/gc/blob_128.webp")
+        orphan = self.save_file(
+            "uploads/derivatives/recipe/gc/orphan_128.webp"
+        )
+        recent = self.save_file(
+            "uploads/derivatives/recipe/gc/recent_128.webp", age_hours=1
+        )
+
+        call_command("gc_recipe_images", stdout=StringIO())
+
+        self.assertTrue(os.path.exists(kept))
+        self.assertTrue(os.path.exists(blob))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(recent))
+        recipe.image.delete()
@@ -0,0 +1,62 @@
+"""
+Tests for recipe image processing.
+"""
+
+import io
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase
+
+from PIL import Image
+
+from ..images import blurhash, image_metadata
+
+
+class ImageMetadataTests(SimpleTestCase):
+    """
+    Test image metadata extraction.
+    """
+
+    def test_blurhash_matches_reference(self):
+        """
+        Test the placeholder matches the reference BlurHash encoder.
+        :return:
+        """
+        image = Image.linear_gradient("L").resize((16, 16)).convert("RGB")
+
+        self.assertEqual(blurhash(image), "LwHetWt7fQt700WBfQWBt7j[fQj[")
+
+    def test_image_metadata(self):
+        """
+        Test size, format, colour and placeholder are extracted.
+        :return:
+        """
+        image_file = io.BytesIO()
+        Image.new("RGB", (40, 20), (255, 0, 0)).save(image_file, "PNG")
+        upload = SimpleUploadedFile("red.png", image_file.getvalue())
+
+        metadata = image_metadata(upload)
+
+        self.assertEqual(metadata["image_width"], 40)
+        self.assertEqual(metadata["image_height"], 20)
+        self.assertEqual(metadata["image_format"], "PNG")
+        self.assertEqual(metadata["image_size"], len(image_file.getvalue()))
+        self.assertEqual(metadata["image_color"], "#ff0000")
+        self.assertEqual(len(metadata["image_placeholder"]), 28)
+
+    def test_image_metadata_exif_orientation(self):
+        """
+        Test rotated photos report their displayed size.
+        :return:
+        """
+        image_file = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        Image.new("RGB", (40, 20)).save(image_file, "JPEG", exif=exif)
+        upload = SimpleUploadedFile("rotated.jpg", image_file.getvalue())
+
+        metadata = image_metadata(upload)
+
+        self.assertEqual(
+            (metadata["image_width"], metadata["image_height"]), (20, 40)
+        )
@@ -2,6 +2,7 @@
 Tests for the ingredients API.
 """
 
+import json
 from decimal import Decimal
 
 from django.contrib.auth import get_user_model
@@ -11,6 +12,7 @@ from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from core.nplusone import NPlusOneTestMixin
 from ingredient.models import Ingredient
 from recipe.models import Recipe
 
@@ -38,7 +40,7 @@ def create_user(email="user@example.com", password="testpass123"):
     return get_user_model().objects.create_user(email=email, password=password)
 
 
-class PublicIngredientsApiTests(TestCase):
+class PublicIngredientsApiTests(NPlusOneTestMixin, TestCase):
     """
     Test unauthenticated API requests.
     """
@@ -56,7 +58,7 @@ class PublicIngredientsApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
-class PrivateIngredientsApiTests(TestCase):
+class PrivateIngredientsApiTests(NPlusOneTestMixin, TestCase):
     """
     Test unauthenticated API requests.
     """
@@ -76,11 +78,13 @@ class PrivateIngredientsApiTests(TestCase):
 
         res = self.client.get(INGREDIENTS_URL)
 
+        data = json.loads(res.getvalue())
+
         ingredients = Ingredient.objects.all().order_by("-name")
         serializer = IngredientSerializer(ingredients, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(data, serializer.data)
 
     def test_ingredients_limited_to_user(self):
         """
@@ -94,10 +98,12 @@ class PrivateIngredientsApiTests(TestCase):
 
         res = self.client.get(INGREDIENTS_URL)
 
+        data = json.loads(res.getvalue())
+
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]["name"], ingredient.name)
-        self.assertEqual(res.data[0]["id"], ingredient.id)
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]["name"], ingredient.name)
+        self.assertEqual(data[0]["id"], ingredient.id)
 
     def test_update_ingredient(self):
         """
@@ -149,11 +155,13 @@ class PrivateIngredientsApiTests(TestCase):
 
         res = self.client.get(INGREDIENTS_URL, {"assigned_only": 1})
 
+        data = json.loads(res.getvalue())
+
         s_1 = IngredientSerializer(in_1)
         s_2 = IngredientSerializer(in_2)
 
-        self.assertIn(s_1.data, res.data)
-        self.assertNotIn(s_2.data, res.data)
+        self.assertIn(s_1.data, data)
+        self.assertNotIn(s_2.data, data)
 
     def test_filtered_ingredients_unique(self):
         """
@@ -180,4 +188,6 @@ class PrivateIngredientsApiTests(TestCase):
 
         res = self.client.get(INGREDIENTS_URL, {"assigned_only": 1})
 
-        self.assertEqual(len(res.data), 1)
+        data = json.loads(res.getvalue())
+
+        self.assertEqual(len(data), 1)
@@ -0,0 +1,159 @@
+"""
+Tests for the query plans of the recipe APIs.
+"""
+
+import json
+import unittest
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from ingredient.models import Ingredient
+from tag.models import Tag
+
+from ..models import Recipe
+from ..views import filter_recipe_attrs, filter_recipes
+
+# Plan nodes showing a query is not served by an index.
+BAD_NODES = {"Seq Scan", "Sort", "Incremental Sort"}
+
+
+def plan_nodes(plan):
+    """
+    Yield every node of an EXPLAIN (FORMAT JSON) plan.
+    :param plan:
+    :return:
+    """
+    yield plan
+
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+@unittest.skipUnless(
+    connection.vendor == "postgresql", "Query plans are PostgreSQL specific."
+)
+class QueryPlanTests(TestCase):
+    """
+    Test the main query of each endpoint is served by indexes.
+
+    The planner prefers sequential scans on small tables, so they and
+    explicit sorts are disabled while explaining: either still showing up
+    means no index can serve the query.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [
+            get_user_model().objects.create_user(
+                f"user{i}@example.com", "test_pass123"
+            )
+            for i in range(3)
+        ]
+        cls.user = users[0]
+
+        for user in reversed(users):
+            tags = Tag.objects.bulk_create(
+                Tag(user=user, name=f"Tag {i}") for i in range(20)
+            )
+            ingredients = Ingredient.objects.bulk_create(
+                Ingredient(user=user, name=f"Ingredient {i}")
+                for i in range(20)
+            )
+            recipes = Recipe.objects.bulk_create(
+                Recipe(
+                    user=user,
+                    title=f"Recipe {i}",
+                    time_minutes=10,
+                    price=Decimal("5.00"),
+                )
+                for i in range(200)
+            )
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe=recipe, tag=tags[i % 15])
+                for i, recipe in enumerate(recipes)
+            )
+            Recipe.ingredients.through.objects.bulk_create(
+                Recipe.ingredients.through(
+                    recipe=recipe, ingredient=ingredients[i % 15]
+                )
+                for i, recipe in enumerate(recipes)
+            )
+
+        # The last seeded user is the one the queries are for.
+        cls.tag_ids = ",".join(str(tag.id) for tag in tags[:2])
+        cls.ingredient_ids = str(ingredients[0].id)
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertIndexed(self, queryset):
+        """
+        Assert `queryset` runs without sequential scans or sorts.
+        :param queryset:
+        :return:
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_sort = off")
+
+        try:
+            plan = json.loads(queryset.explain(format="json"))[0]["Plan"]
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("RESET enable_seqscan")
+                cursor.execute("RESET enable_sort")
+
+        bad = [
+            f"{node['Node Type']} on {node.get('Relation Name', '-')}"
+            for node in plan_nodes(plan)
+            if node["Node Type"] in BAD_NODES
+        ]
+        self.assertEqual(
+            bad, [], f"{queryset.query}\n{json.dumps(plan, indent=2)}"
+        )
+
+    def test_recipe_list(self):
+        """
+        Test listing recipes with and without filters.
+        :return:
+        """
+        for params in (
+            {},
+            {"tags": self.tag_ids},
+            {"ingredients": self.ingredient_ids},
+            {"tags": self.tag_ids, "ingredients": self.ingredient_ids},
+        ):
+            with self.subTest(params=params):
+                self.assertIndexed(
+                    filter_recipes(Recipe.objects.all(), self.user, params)
+                )
+
+    def test_recipe_detail(self):
+        """
+        Test retrieving a recipe.
+        :return:
+        """
+        recipe = Recipe.objects.filter(user=self.user).first()
+
+        self.assertIndexed(
+            filter_recipes(Recipe.objects.all(), self.user, {}).filter(
+                pk=recipe.pk
+            )
+        )
+
+    def test_recipe_attr_lists(self):
+        """
+        Test listing tags and ingredients, all or assigned only.
+        :return:
+        """
+        for model in (Tag, Ingredient):
+            for params in ({}, {"assigned_only": "1"}):
+                with self.subTest(model=model.__name__, params=params):
+                    self.assertIndexed(
+                        filter_recipe_attrs(
+                            model.objects.all(), self.user, params
+                        )
+                    )
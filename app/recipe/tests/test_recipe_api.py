@@ -3,11 +3,22 @@ Tests for recipe APIs.
 """
 
 from decimal import Decimal
+from io import StringIO
+import io
+import json
 import os
 import tempfile
+import threading
+import time
+from unittest import skipUnless
+from unittest.mock import patch
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
 
 from PIL import Image
@@ -15,7 +26,10 @@ from PIL import Image
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from ..models import Recipe
+from ..images import delete_derivatives
+from ..models import ImageBlob, Recipe
+from core.models import Job
+from core.nplusone import NPlusOneTestMixin
 from ingredient.models import Ingredient
 from tag.models import Tag
 
@@ -73,7 +87,7 @@ def create_user(**params):
     return get_user_model().objects.create_user(**params)
 
 
-class PublicRecipeAPITests(TestCase):
+class PublicRecipeAPITests(NPlusOneTestMixin, TestCase):
     """
     Test unauthenticated recipe API requests.
     """
@@ -87,7 +101,7 @@ class PublicRecipeAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
-class PrivateRecipeApiTests(TestCase):
+class PrivateRecipeApiTests(NPlusOneTestMixin, TestCase):
     """
     Test authenticated API requests.
     """
@@ -106,11 +120,13 @@ class PrivateRecipeApiTests(TestCase):
 
         res = self.client.get(RECIPE_URL)
 
+        data = json.loads(res.getvalue())
+
         recipes = Recipe.objects.all().order_by("-id")
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(data, serializer.data)
 
     def test_recipe_list_limited_to_user(self):
         other_user = create_user(
@@ -121,11 +137,13 @@ class PrivateRecipeApiTests(TestCase):
 
         res = self.client.get(RECIPE_URL)
 
+        data = json.loads(res.getvalue())
+
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(data, serializer.data)
 
     def test_get_recipe_detail(self):
         """
@@ -500,14 +518,15 @@ class PrivateRecipeApiTests(TestCase):
 
         params = {"tags": f"{tag_1.id},{tag_2.id}"}
         res = self.client.get(RECIPE_URL, params)
+        data = json.loads(res.getvalue())
 
         s_1 = RecipeSerializer(r_1)
         s_2 = RecipeSerializer(r_2)
         s_3 = RecipeSerializer(r_3)
 
-        self.assertIn(s_1.data, res.data)
-        self.assertIn(s_2.data, res.data)
-        self.assertNotIn(s_3.data, res.data)
+        self.assertIn(s_1.data, data)
+        self.assertIn(s_2.data, data)
+        self.assertNotIn(s_3.data, data)
 
     def test_filter_by_ingredients(self):
         """
@@ -526,17 +545,19 @@ class PrivateRecipeApiTests(TestCase):
 
         params = {"ingredients": f"{in_1.id}, {in_2.id}"}
         res = self.client.get(RECIPE_URL, params)
+        data = json.loads(res.getvalue())
 
         s_1 = RecipeSerializer(r_1)
         s_2 = RecipeSerializer(r_2)
         s_3 = RecipeSerializer(r_3)
 
-        self.assertIn(s_1.data, res.data)
-        self.assertIn(s_2.data, res.data)
-        self.assertNotIn(s_3.data, res.data)
+        self.assertIn(s_1.data, data)
+        self.assertIn(s_2.data, data)
+        self.assertNotIn(s_3.data, data)
 
 
-class ImageUploadTests(TestCase):
+@override_settings(RECIPE_IMAGE_INLINE_DERIVATIVES=True)
+class ImageUploadTests(NPlusOneTestMixin, TestCase):
     """
     Tests for the image upload API.
     """
@@ -550,6 +571,16 @@ class ImageUploadTests(TestCase):
         self.recipe = create_recipe(user=self.user)
 
     def tearDown(self):
+        storage = self.recipe.image.storage
+        delete_derivatives(storage, self.recipe.image.name)
+        # Derivatives of overridden sizes and formats, which the settings
+        # no longer list once the test ended.
+        stored = Recipe.objects.filter(pk=self.recipe.pk).values_list(
+            "image_derivatives", flat=True
+        )
+        for formats in (stored.first() or {}).values():
+            for name in formats.values():
+                storage.delete(name)
         self.recipe.image.delete()
 
     def test_upload_image(self):
@@ -570,6 +601,279 @@ class ImageUploadTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertIn("image", res.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
+        self.assertEqual(res.data["image_width"], 10)
+        self.assertEqual(res.data["image_format"], "JPEG")
+        self.assertEqual(self.recipe.image_height, 10)
+        self.assertTrue(self.recipe.image_placeholder)
+
+    @override_settings(
+        RECIPE_IMAGE_DERIVATIVE_SIZES=[4, 8],
+        RECIPE_IMAGE_DERIVATIVE_FORMATS=["WEBP", "JPEG"],
+    )
+    def test_upload_image_generates_derivatives(self):
+        """
+        Test uploading an image stores resized copies of it.
+        :return:
+        """
+        url = image_upload_url(self.recipe.id)
+
+        with tempfile.NamedTemporaryFile(suffix=".png") as image_file:
+            img = Image.new("RGBA", (20, 10))
+            img.save(image_file, format="PNG")
+            image_file.seek(0)
+            res = self.client.post(
+                url, {"image": image_file}, format="multipart"
+            )
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(res.data["image_derivatives"]["4"]), {"webp", "jpeg"}
+        )
+        storage = self.recipe.image.storage
+        for name in (
+            self.recipe.image_derivatives["4"]["jpeg"],
+            self.recipe.image_derivatives["8"]["webp"],
+        ):
+            with Image.open(storage.path(name)) as derivative:
+                self.assertLessEqual(max(derivative.size), 8)
+
+    @override_settings(
+        RECIPE_IMAGE_INLINE_DERIVATIVES=False,
+        RECIPE_IMAGE_DERIVATIVE_SIZES=[4],
+        RECIPE_IMAGE_DERIVATIVE_FORMATS=["JPEG"],
+    )
+    def test_upload_image_queues_derivatives(self):
+        """
+        Test derivatives are generated by the worker when not inline.
+        :return:
+        """
+        url = image_upload_url(self.recipe.id)
+
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as image_file:
+            Image.new("RGB", (10, 10)).save(image_file, format="JPEG")
+            image_file.seek(0)
+            res = self.client.post(
+                url, {"image": image_file}, format="multipart"
+            )
+
+        self.assertEqual(res.data["image_derivatives"], {})
+        self.assertTrue(Job.objects.filter(name="recipe.derivatives"))
+
+        call_command(
+            "run_worker", concurrency=1, burst=True, stdout=StringIO()
+        )
+
+        self.recipe.refresh_from_db()
+        self.assertIn("jpeg", self.recipe.image_derivatives["4"])
+
+    @override_settings(RECIPE_IMAGE_MAX_UPLOAD_BYTES=1024)
+    def test_upload_image_too_many_bytes(self):
+        """
+        Test an upload over the byte limit is rejected and not kept.
+        :return:
+        """
+        url = image_upload_url(self.recipe.id)
+
+        with tempfile.NamedTemporaryFile(suffix=".png") as image_file:
+            img = Image.effect_noise((100, 100), 64)
+            img.save(image_file, format="PNG")
+            image_file.seek(0)
+            res = self.client.post(
+                url, {"image": image_file}, format="multipart"
+            )
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+        self.assertFalse(self.recipe.image)
+        self.assertEqual(
+            os.listdir(os.path.join(settings.MEDIA_ROOT, "tmp")), []
+        )
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=50)
+    def test_upload_image_too_many_pixels(self):
+        """
+        Test an image over the pixel limit is rejected from its header.
+        :return:
+        """
+        url = image_upload_url(self.recipe.id)
+
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as image_file:
+            img = Image.new("RGB", (10, 10))
+            img.save(image_file, format="JPEG")
+            image_file.seek(0)
+            res = self.client.post(
+                url, {"image": image_file}, format="multipart"
+            )
+
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=10**6)
+    def test_upload_decompression_bomb(self):
+        """
+        Test an image over Pillow's own pixel limit is rejected as too
+        large rather than invalid.
+        :return:
+        """
+        url = image_upload_url(self.recipe.id)
+
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as image_file:
+            Image.new("RGB", (10, 10)).save(image_file, format="JPEG")
+            image_file.seek(0)
+            with patch.object(Image, "MAX_IMAGE_PIXELS", 20):
+                res = self.client.post(
+                    url, {"image": image_file}, format="multipart"
+                )
+
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+    def test_upload_non_image_file(self):
+        """
+        Test a file that is not an image is rejected.
+        :return:
+        """
+        url = image_upload_url(self.recipe.id)
+
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as image_file:
+            image_file.write(b"not an image" * 100)
+            image_file.seek(0)
+            res = self.client.post(
+                url, {"image": image_file}, format="multipart"
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("image", res.data)
+
+    def test_upload_image_long_header(self):
+        """
+        Test an image whose header is longer than the buffered part of
+        the upload is identified from the whole file.
+        :return:
+        """
+        url = image_upload_url(self.recipe.id)
+
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as image_file:
+            img = Image.new("RGB", (10, 10))
+            img.save(image_file, format="JPEG", icc_profile=b"\0" * 100_000)
+            image_file.seek(0)
+            res = self.client.post(
+                url, {"image": image_file}, format="multipart"
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["image_format"], "JPEG")
+
+    def test_upload_long_non_image_file(self):
+        """
+        Test a file that is not an image is rejected once received.
+        :return:
+        """
+        url = image_upload_url(self.recipe.id)
+
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as image_file:
+            image_file.write(b"not an image" * 10_000)
+            image_file.seek(0)
+            res = self.client.post(
+                url, {"image": image_file}, format="multipart"
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("image", res.data)
+
+    def test_upload_same_image_shares_file(self):
+        """
+        Test identical uploads share one file until both are released.
+        :return:
+        """
+        other = create_recipe(user=self.user)
+        image_file = io.BytesIO()
+        Image.new("RGB", (10, 10), (0, 128, 0)).save(image_file, "JPEG")
+
+        for recipe in (self.recipe, other):
+            image_file.seek(0)
+            image_file.name = "photo.jpg"
+            res = self.client.post(
+                image_upload_url(recipe.id),
+                {"image": image_file},
+                format="multipart",
+            )
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.recipe.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, other.image.name)
+        self.assertEqual(ImageBlob.objects.get().refcount, 2)
+        path = other.image.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ImageBlob.objects.exists())
+
+    def test_rolled_back_delete_keeps_image(self):
+        """
+        Test the image survives a recipe delete that is rolled back.
+        :return:
+        """
+        image_file = io.BytesIO()
+        Image.new("RGB", (10, 10)).save(image_file, "JPEG")
+        image_file.seek(0)
+        image_file.name = "photo.jpg"
+        self.client.post(
+            image_upload_url(self.recipe.id),
+            {"image": image_file},
+            format="multipart",
+        )
+        self.recipe.refresh_from_db()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    Recipe.objects.get(pk=self.recipe.pk).delete()
+                    raise RuntimeError("Rolled back.")
+
+        self.assertTrue(os.path.exists(self.recipe.image.path))
+        self.assertEqual(ImageBlob.objects.get().refcount, 1)
+
+    @override_settings(RECIPE_IMAGE_MAX_DIMENSION=100)
+    def test_upload_image_downscaled_and_stripped(self):
+        """
+        Test large images are downscaled and stored without EXIF.
+        :return:
+        """
+        url = image_upload_url(self.recipe.id)
+        exif = Image.Exif()
+        exif[0x010F] = "Camera maker"
+
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as image_file:
+            img = Image.effect_noise((400, 300), 32).convert("RGB")
+            img.save(image_file, format="JPEG", exif=exif, quality=95)
+            original_size = image_file.tell()
+            image_file.seek(0)
+            res = self.client.post(
+                url, {"image": image_file}, format="multipart"
+            )
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        with Image.open(self.recipe.image.path) as stored:
+            self.assertEqual(stored.size, (100, 75))
+            self.assertFalse(stored.getexif())
+        self.assertEqual(self.recipe.image_width, 100)
+        self.assertEqual(
+            int(res["X-Image-Bytes-Saved"]),
+            original_size - self.recipe.image_size,
+        )
 
     def test_upload_image_bad_request(self):
         """
@@ -581,3 +885,96 @@ class ImageUploadTests(TestCase):
         res = self.client.post(url, payload, format="multipart")
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+def save_blob_file(test, name):
+    """
+    Store a file under `name` for the duration of `test`.
+    :param test:
+    :param name:
+    :return:
+    """
+    storage = Recipe._meta.get_field("image").storage
+    storage.save(name, ContentFile(b"image"))
+    test.addCleanup(storage.delete, name)
+
+    return storage
+
+
+class ImageBlobTests(TestCase):
+    """
+    Test reference counting of image files.
+    """
+
+    name = "uploads/recipe/blob/shared.jpg"
+
+    def setUp(self):
+        self.storage = save_blob_file(self, self.name)
+
+    def test_reacquired_before_commit_kept(self):
+        """
+        Test a file referenced again before its release commits is kept.
+        :return:
+        """
+        ImageBlob.objects.acquire(self.name)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            ImageBlob.objects.release(self.name)
+            ImageBlob.objects.acquire(self.name)
+        for callback in callbacks:
+            callback()
+
+        self.assertTrue(self.storage.exists(self.name))
+        self.assertEqual(ImageBlob.objects.get().refcount, 1)
+
+    def test_released_file_deleted_on_commit(self):
+        """
+        Test the last release deletes the file once committed.
+        :return:
+        """
+        ImageBlob.objects.acquire(self.name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ImageBlob.objects.release(self.name)
+            self.assertTrue(self.storage.exists(self.name))
+
+        self.assertFalse(self.storage.exists(self.name))
+        self.assertFalse(ImageBlob.objects.exists())
+
+
+@skipUnless(connection.vendor == "postgresql", "Needs concurrent writes.")
+class ImageBlobConcurrencyTests(TransactionTestCase):
+    """
+    Test concurrent references to a new image file.
+    """
+
+    name = "uploads/recipe/blob/concurrent.jpg"
+
+    def setUp(self):
+        save_blob_file(self, self.name)
+
+    def test_concurrent_first_acquire(self):
+        """
+        Test two transactions referencing a new file both count.
+        :return:
+        """
+        inserted = threading.Event()
+
+        def acquire_first():
+            try:
+                with transaction.atomic():
+                    ImageBlob.objects.acquire(self.name)
+                    inserted.set()
+                    time.sleep(0.5)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=acquire_first)
+        thread.start()
+        self.assertTrue(inserted.wait(5))
+
+        with transaction.atomic():
+            ImageBlob.objects.acquire(self.name)
+        thread.join()
+
+        self.assertEqual(ImageBlob.objects.get().refcount, 2)
@@ -2,6 +2,7 @@
 Tests for the tags API.
 """
 
+import json
 from decimal import Decimal
 
 from django.contrib.auth import get_user_model
@@ -11,6 +12,7 @@ from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from core.nplusone import NPlusOneTestMixin
 from recipe.models import Recipe
 from tag.models import Tag
 
@@ -38,7 +40,7 @@ def create_user(email="user@example.com", password="testpass123"):
     return get_user_model().objects.create_user(email=email, password=password)
 
 
-class PublicTagsApiTests(TestCase):
+class PublicTagsApiTests(NPlusOneTestMixin, TestCase):
     """
     Test unauthenticated API requests.
     """
@@ -56,7 +58,7 @@ class PublicTagsApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
-class PrivateTagsApiTests(TestCase):
+class PrivateTagsApiTests(NPlusOneTestMixin, TestCase):
     """
     Test authenticated API requests.
     """
@@ -77,10 +79,12 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL)
 
+        data = json.loads(res.getvalue())
+
         tags = Tag.objects.all().order_by("-name")
         serializer = TagSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(data, serializer.data)
 
     def test_tags_limited_to_user(self):
         """
@@ -94,10 +98,12 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL)
 
+        data = json.loads(res.getvalue())
+
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]["name"], tag.name)
-        self.assertEqual(res.data[0]["id"], tag.id)
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]["name"], tag.name)
+        self.assertEqual(data[0]["id"], tag.id)
 
     def test_update_tag(self):
         """
@@ -143,11 +149,13 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL, {"assigned_only": 1})
 
+        data = json.loads(res.getvalue())
+
         s_1 = TagSerializer(tag_1)
         s_2 = TagSerializer(tag_2)
 
-        self.assertIn(s_1.data, res.data)
-        self.assertNotIn(s_2.data, res.data)
+        self.assertIn(s_1.data, data)
+        self.assertNotIn(s_2.data, data)
 
     def test_filtered_tags_unique(self):
         """
@@ -175,4 +183,6 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL, {"assigned_only": 1})
 
-        self.assertEqual(len(res.data), 1)
+        data = json.loads(res.getvalue())
+
+        self.assertEqual(len(data), 1)
@@ -0,0 +1,198 @@
+"""
+Upload handlers for recipe images.
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import (
+    TemporaryUploadedFile,
+    UploadedFile,
+)
+from django.core.files.uploadhandler import FileUploadHandler
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions, status
+
+# Bytes of the file kept in memory to identify the image from its header.
+# Images with longer headers, as large ICC profiles or EXIF thumbnails
+# make them, are identified from the whole file once it is received.
+HEADER_BYTES = 64 * 2**10
+
+
+def upload_temp_dir():
+    """
+    Return the directory temporary upload files are written to.
+    :return:
+    """
+    return settings.RECIPE_IMAGE_UPLOAD_TEMP_DIR or os.path.join(
+        settings.MEDIA_ROOT, "tmp"
+    )
+
+
+class UploadTooLarge(exceptions.APIException):
+    """
+    Upload exceeds the configured byte or pixel limit.
+    """
+
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = _("Uploaded image is too large.")
+    default_code = "upload_too_large"
+
+
+class ImageUploadFile(TemporaryUploadedFile):
+    """
+    Temporary uploaded file created in a given directory.
+
+    Keeping the temporary file on the same filesystem as MEDIA_ROOT lets
+    storage move it into place with a single rename.
+    """
+
+    def __init__(self, name, content_type, charset, directory):
+        os.makedirs(directory, exist_ok=True)
+        ext = os.path.splitext(name)[1]
+        file = tempfile.NamedTemporaryFile(
+            suffix=".upload" + ext, dir=directory
+        )
+        UploadedFile.__init__(self, file, name, content_type, 0, charset)
+
+
+class BoundedImageUploadHandler(FileUploadHandler):
+    """
+    Stream an uploaded image to disk and reject it as early as possible.
+
+    Chunks go straight to a temporary file, so memory use does not depend
+    on the upload size, and are hashed on the way so storage can name the
+    file after its content without reading it again. The upload fails as
+    soon as it passes RECIPE_IMAGE_MAX_UPLOAD_BYTES, or once the header
+    shows it is not an accepted image format or has more than
+    RECIPE_IMAGE_MAX_PIXELS pixels.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_bytes = settings.RECIPE_IMAGE_MAX_UPLOAD_BYTES
+        self.max_pixels = settings.RECIPE_IMAGE_MAX_PIXELS
+        self.directory = upload_temp_dir()
+
+    def handle_raw_input(
+        self, input_data, META, content_length, boundary, encoding=None
+    ):
+        """
+        Reject requests whose declared length is already over the limit.
+        """
+        if content_length > self.max_bytes + self.chunk_size:
+            raise UploadTooLarge()
+
+    def new_file(self, *args, **kwargs):
+        """
+        Open the temporary file for a new upload.
+        """
+        super().new_file(*args, **kwargs)
+        self.header = b""
+        self.image_format = None
+        self.hasher = hashlib.sha256()
+        self.file = ImageUploadFile(
+            self.file_name, self.content_type, self.charset, self.directory
+        )
+
+    def receive_data_chunk(self, raw_data, start):
+        """
+        Write a chunk, checking the limits before it reaches the disk.
+        """
+        if start + len(raw_data) > self.max_bytes:
+            self.reject(UploadTooLarge())
+
+        if self.header is not None:
+            self.header += raw_data[: HEADER_BYTES - len(self.header)]
+            self.inspect(io.BytesIO(self.header), final=False)
+            if self.image_format or len(self.header) >= HEADER_BYTES:
+                self.header = None
+
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        """
+        Return the finished upload.
+        """
+        if self.image_format is None:
+            self.file.seek(0)
+            self.inspect(self.file, final=True)
+
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.hasher.hexdigest()
+
+        return self.file
+
+    def upload_interrupted(self):
+        """
+        Remove the temporary file of an unfinished upload.
+        """
+        self.discard()
+
+    def inspect(self, file, final):
+        """
+        Identify the image from its header in `file`.
+        :param file: the bytes received so far, or the whole file
+        :param final: whether `file` is the whole file
+        :return:
+        """
+        from PIL import Image
+
+        try:
+            with Image.open(file) as image:
+                image_format = image.format
+                width, height = image.size
+        except Image.DecompressionBombError:
+            # Over Pillow's own limit, far past any pixel limit we allow.
+            self.reject(
+                UploadTooLarge(_("Uploaded image has too many pixels."))
+            )
+        except Exception:
+            if final:
+                self.reject(
+                    exceptions.ValidationError(
+                        {"image": [_("Upload a valid image.")]}
+                    )
+                )
+            return
+
+        if image_format not in settings.RECIPE_IMAGE_UPLOAD_FORMATS:
+            self.reject(
+                exceptions.ValidationError(
+                    {"image": [_("Unsupported image format.")]}
+                )
+            )
+
+        if width * height > self.max_pixels:
+            self.reject(
+                UploadTooLarge(_("Uploaded image has too many pixels."))
+            )
+
+        self.image_format = image_format
+
+    def discard(self):
+        """
+        Close and delete the temporary file, if any.
+        :return:
+        """
+        if getattr(self, "file", None) is not None:
+            try:
+                self.file.close()
+            except FileNotFoundError:
+                pass
+            self.file = None
+
+    def reject(self, exc):
+        """
+        Abort the upload with `exc`.
+        :param exc:
+        :return:
+        """
+        self.discard()
+        raise exc
@@ -2,6 +2,7 @@
 Views for the recipe APIs.
 """
 
+from django.db.models import Exists, OuterRef
 from drf_spectacular.utils import (
     extend_schema_view,
     extend_schema,
@@ -14,15 +15,86 @@ from rest_framework import (
     mixins,
     status,
 )
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from .models import Recipe
+from core.authentication import ExpiringTokenAuthentication
+from core.routers import ReplicaReadMixin
+from core.streaming import StreamingListMixin
 from ingredient.models import Ingredient
 from tag.models import Tag
-from . import serializers
+from . import images, serializers
+from .uploadhandlers import BoundedImageUploadHandler
+
+
+def _params_to_ints(qs):
+    """
+    Convert a list of strings to integers
+    "1, 2, 3" -> 1, 2, 3
+    :param qs:
+    :return:
+    """
+    return [int(str_id) for str_id in qs.split(",")]
+
+
+def filter_recipes(queryset, user, params):
+    """
+    Filter recipes to the user's, optionally by tag and ingredient IDs.
+
+    Tag and ingredient filters are subqueries on the through tables rather
+    than joins, so no DISTINCT is needed and the user index gives the order.
+    :param queryset:
+    :param user:
+    :param params: query parameters
+    :return:
+    """
+    tags = params.get("tags")
+    ingredients = params.get("ingredients")
+
+    if tags:
+        tag_ids = _params_to_ints(tags)
+        queryset = queryset.filter(
+            id__in=Recipe.tags.through.objects.filter(
+                tag_id__in=tag_ids
+            ).values("recipe_id")
+        )
+
+    if ingredients:
+        ingredient_ids = _params_to_ints(ingredients)
+        queryset = queryset.filter(
+            id__in=Recipe.ingredients.through.objects.filter(
+                ingredient_id__in=ingredient_ids
+            ).values("recipe_id")
+        )
+
+    return queryset.filter(user=user).order_by("-id")
+
+
+def filter_recipe_attrs(queryset, user, params):
+    """
+    Filter tags or ingredients to the user's, optionally only those
+    assigned to recipes.
+    :param queryset:
+    :param user:
+    :param params: query parameters
+    :return:
+    """
+    assigned_only = bool(int(params.get("assigned_only", 0)))
+
+    if assigned_only:
+        # Through rows name the attribute after its model, e.g. tag_id.
+        through = queryset.model.recipe_set.through
+        queryset = queryset.filter(
+            Exists(
+                through.objects.filter(
+                    **{queryset.model._meta.model_name: OuterRef("pk")}
+                )
+            )
+        )
+
+    return queryset.filter(user=user).order_by("-name")
 
 
 @extend_schema_view(
@@ -41,45 +113,42 @@ from . import serializers
         ]
     )
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    ReplicaReadMixin, StreamingListMixin, viewsets.ModelViewSet
+):
     """
     View for manage recipe APIs.
     """
 
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
-    def _params_to_ints(self, qs):
+    def initialize_request(self, request, *args, **kwargs):
         """
-        Convert a list of strings to integers
-        "1, 2, 3" -> 1, 2, 3
-        :param qs:
-        :return:
+        Stream image uploads through a size-bounded upload handler.
         """
-        return [int(str_id) for str_id in qs.split(",")]
+        drf_request = super().initialize_request(request, *args, **kwargs)
+
+        if self.action == "upload_image":
+            request.upload_handlers = [BoundedImageUploadHandler(request)]
+
+        return drf_request
 
     def get_queryset(self):
         """
         Retrieve recipes for authenticated user.
         :return:
         """
-        tags = self.request.query_params.get("tags")
-        ingredients = self.request.query_params.get("ingredients")
-        queryset = self.queryset
-
-        if tags:
-            tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
+        queryset = filter_recipes(
+            self.queryset, self.request.user, self.request.query_params
+        )
 
-        if ingredients:
-            ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+        if self.action != "upload_image":
+            queryset = queryset.prefetch_related("tags", "ingredients")
 
-        return (
-            queryset.filter(user=self.request.user).order_by("-id").distinct()
-        )
+        return queryset
 
     def get_serializer_class(self):
         """
@@ -112,8 +181,13 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         if serializer.is_valid():
             serializer.save()
+            images.schedule_derivatives(recipe)
 
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return Response(
+                serializer.data,
+                status=status.HTTP_200_OK,
+                headers={"X-Image-Bytes-Saved": str(serializer.bytes_saved)},
+            )
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -131,6 +205,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
 )
 class BaseRecipeAttrViewSet(
+    ReplicaReadMixin,
+    StreamingListMixin,
     mixins.DestroyModelMixin,
     mixins.UpdateModelMixin,
     mixins.ListModelMixin,
@@ -140,7 +216,7 @@ class BaseRecipeAttrViewSet(
     Base view set for recipe attributes.
     """
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -148,18 +224,8 @@ class BaseRecipeAttrViewSet(
         Filter queryset to authenticate user.
         :return:
         """
-        assigned_only = bool(
-            int(self.request.query_params.get("assigned_only", 0))
-        )
-        queryset = self.queryset
-
-        if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
-
-        return (
-            queryset.filter(user=self.request.user)
-            .order_by("-name")
-            .distinct()
+        return filter_recipe_attrs(
+            self.queryset, self.request.user, self.request.query_params
         )
 
 
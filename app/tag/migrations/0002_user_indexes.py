@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-19 10:46
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built without blocking writes to the tables, which
+    # cannot be done in a transaction.
+    atomic = False
+
+    dependencies = [
+        ('tag', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='tag',
+            index=models.Index(fields=['user', '-name'], include=('id',), name='tag_user_name_idx'),
+        ),
+    ]
@@ -13,5 +13,16 @@ class Tag(models.Model):
         on_delete=models.CASCADE,
     )
 
+    class Meta:
+        indexes = [
+            # Lists filter by user and sort by name, the included id makes
+            # them index-only scans.
+            models.Index(
+                fields=["user", "-name"],
+                include=["id"],
+                name="tag_user_name_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.name
@@ -7,8 +7,10 @@ from django.utils.translation import gettext as _
 
 from rest_framework import serializers
 
+from core.metrics import TimedSerializerMixin
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the user object.
     """
@@ -34,13 +36,11 @@ class UserSerializer(serializers.ModelSerializer):
         :return:
         """
         password = validated_data.pop("password", None)
-        user = super().update(instance, validated_data)
 
         if password:
-            user.set_password(password)
-            user.save()
+            instance.set_password(password)
 
-        return user
+        return super().update(instance, validated_data)
 
 
 class AuthTokenSerializer(serializers.Serializer):
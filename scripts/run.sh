@@ -0,0 +1,10 @@
+#!/bin/sh
+
+set -e
+
+python manage.py wait_for_db
+python manage.py collectstatic --noinput
+python manage.py migrate
+python manage.py createcachetable
+
+exec gunicorn --config gunicorn.conf.py